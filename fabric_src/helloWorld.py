@@ -1,9 +1,12 @@
-from fabric import Connection
-
+from fabric_src.utils.common import configure_logging
+from fabric_src.utils.connection_pool import get_connection_pool
 from fabric_src.utils.service_manager import ServiceManagerOperator, DeployConfig
 
 if __name__ == '__main__':
-    operator = ServiceManagerOperator(Connection('47.99.62.85', user='root'))
+    configure_logging()
+    # 从连接池获取连接，同一进程内多次部署复用同一个SSH连接
+    with get_connection_pool().connection('root@47.99.62.85') as conn:
+        operator = ServiceManagerOperator(conn)
 
-    # 获取service目录
-    operator.deploy_service_with_service_dir('/Users/weisanju/gitrepos/personal-architecture/fabric_src/service/mihomo')
+        # 获取service目录
+        operator.deploy_service_with_service_dir('/Users/weisanju/gitrepos/personal-architecture/fabric_src/service/mihomo')
@@ -0,0 +1,201 @@
+import argparse
+import gzip
+import multiprocessing
+import os
+import resource
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from dataclasses import dataclass
+from queue import Empty
+from typing import Dict, List, Optional
+
+from .common import _create_temp_tgz, cleanup_archive, configure_logging
+
+# 支持的输入类型
+INPUT_TYPES = ('dir', 'tgz', 'tar', 'zip', 'gz', 'file')
+
+# 等待子进程测量结果时检查子进程状态的间隔（秒）
+RESULT_POLL_INTERVAL = 0.5
+
+
+@dataclass
+class ArchiveBenchmarkResult:
+    """单个输入类型的打包耗时和资源占用"""
+    input_type: str  # 输入类型
+    input_size: int  # 输入文件或目录的大小（字节）
+    output_size: int  # 生成的tgz大小（字节）
+    wall_time: float  # 耗时（秒）
+    cpu_time: float  # CPU时间（用户态+内核态，秒）
+    peak_rss: int  # 子进程峰值内存（字节）
+    baseline_rss: int  # 打包前子进程内存（字节），峰值与其差值为打包本身占用的内存
+
+
+def _write_payload(path: str, size: int):
+    """写入一半随机、一半重复内容的文件，模拟二进制程序的可压缩程度"""
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, 1024 * 1024)
+            f.write(os.urandom(chunk // 2) + b'\0' * (chunk - chunk // 2))
+            remaining -= chunk
+
+
+def create_sample_inputs(work_dir: str, size: int) -> Dict[str, str]:
+    """
+    生成每种输入类型的样例，内容均为同一个大小为size的文件
+
+    Args:
+        work_dir: 工作目录
+        size: 样例文件大小（字节）
+
+    Returns:
+        Dict[str, str]: 输入类型到样例路径的映射
+    """
+    payload_dir = os.path.join(work_dir, 'payload')
+    os.makedirs(payload_dir)
+    payload = os.path.join(payload_dir, 'payload.bin')
+    _write_payload(payload, size)
+
+    samples = {'dir': payload_dir, 'file': payload}
+    samples['tar'] = os.path.join(work_dir, 'payload.tar')
+    with tarfile.open(samples['tar'], 'w') as tar:
+        tar.add(payload, arcname='payload.bin')
+    samples['tgz'] = os.path.join(work_dir, 'payload.tgz')
+    with tarfile.open(samples['tgz'], 'w:gz') as tar:
+        tar.add(payload, arcname='payload.bin')
+    samples['zip'] = os.path.join(work_dir, 'payload.zip')
+    with zipfile.ZipFile(samples['zip'], 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.write(payload, 'payload.bin')
+    samples['gz'] = os.path.join(work_dir, 'payload.bin.gz')
+    with open(payload, 'rb') as src, gzip.open(samples['gz'], 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    return samples
+
+
+def _input_size(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, files in os.walk(path) for name in files)
+    return os.path.getsize(path)
+
+
+def _measure(input_type: str, source_path: str, queue):
+    """在独立子进程中打包，使峰值内存不受其他输入类型影响"""
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    tgz_path = _create_temp_tgz(source_path)
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    try:
+        queue.put(ArchiveBenchmarkResult(
+            input_type=input_type,
+            input_size=_input_size(source_path),
+            output_size=os.path.getsize(tgz_path),
+            wall_time=wall_time,
+            cpu_time=cpu_time,
+            peak_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            baseline_rss=baseline_rss,
+        ))
+    finally:
+        cleanup_archive(tgz_path)
+
+
+def _wait_result(input_type: str, process, queue, timeout: Optional[float]) -> ArchiveBenchmarkResult:
+    """
+    等待子进程的测量结果，子进程异常退出或超时时不会一直阻塞
+
+    Raises:
+        RuntimeError: 子进程没有返回结果就退出了（如测量时抛出异常或被杀死）
+        TimeoutError: 超时未返回结果，子进程会被终止
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            return queue.get(timeout=RESULT_POLL_INTERVAL)
+        except Empty:
+            pass
+        if not process.is_alive():
+            # 子进程可能在放入结果后才退出
+            try:
+                return queue.get(timeout=RESULT_POLL_INTERVAL)
+            except Empty:
+                raise RuntimeError(f"Benchmark of {input_type} exited with code {process.exitcode} "
+                                   f"without a result")
+        if deadline is not None and time.monotonic() > deadline:
+            process.terminate()
+            raise TimeoutError(f"Benchmark of {input_type} did not finish within {timeout}s")
+
+
+def run_benchmark(size: int = 64 * 1024 * 1024,
+                  input_types: Optional[List[str]] = None,
+                  timeout: Optional[float] = None) -> List[ArchiveBenchmarkResult]:
+    """
+    对每种输入类型测量 _create_temp_tgz 的耗时、CPU时间和峰值内存
+
+    Args:
+        size: 样例文件大小（字节）
+        input_types: 要测量的输入类型，默认全部
+        timeout: 每种输入类型的超时时间（秒），None表示不限制
+
+    Returns:
+        List[ArchiveBenchmarkResult]: 每种输入类型的测量结果
+
+    Raises:
+        RuntimeError: 测量子进程异常退出
+        TimeoutError: 测量超时
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        samples = create_sample_inputs(work_dir, size)
+        ctx = multiprocessing.get_context('spawn')
+        results = []
+        for input_type in input_types or INPUT_TYPES:
+            queue = ctx.Queue()
+            process = ctx.Process(target=_measure, args=(input_type, samples[input_type], queue))
+            process.start()
+            try:
+                results.append(_wait_result(input_type, process, queue, timeout))
+            finally:
+                process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"Benchmark of {input_type} exited with code {process.exitcode}")
+        return results
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def format_results(results: List[ArchiveBenchmarkResult]) -> str:
+    """
+    生成测量结果报告
+
+    Args:
+        results: 测量结果列表
+
+    Returns:
+        str: 报告文本
+    """
+    mb = 1024 * 1024
+    lines = [f"{'TYPE':<6}{'INPUT':>10}{'OUTPUT':>10}{'WALL':>9}{'CPU':>9}{'PEAK RSS':>11}{'DELTA':>9}"]
+    for r in results:
+        lines.append(f"{r.input_type:<6}{r.input_size / mb:>8.1f}MB{r.output_size / mb:>8.1f}MB"
+                     f"{r.wall_time:>8.2f}s{r.cpu_time:>8.2f}s{r.peak_rss / mb:>9.1f}MB"
+                     f"{(r.peak_rss - r.baseline_rss) / mb:>7.1f}MB")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="测量各输入类型打包为tgz的CPU时间和峰值内存")
+    parser.add_argument('--size', type=int, default=64, help="样例文件大小（MB）")
+    parser.add_argument('--types', nargs='+', choices=INPUT_TYPES, help="要测量的输入类型，默认全部")
+    parser.add_argument('--timeout', type=float, help="每种输入类型的超时时间（秒），默认不限制")
+    args = parser.parse_args(argv)
+    configure_logging()
+    print(format_results(run_benchmark(args.size * 1024 * 1024, args.types, args.timeout)))
+
+
+if __name__ == '__main__':
+    main()
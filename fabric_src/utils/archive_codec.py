@@ -0,0 +1,343 @@
+import gzip
+import logging
+import lzma
+import math
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+from .host_facts import get_facts, host_key
+
+if TYPE_CHECKING:
+    from fabric import Connection
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，未安装时不使用zstd
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+class _NonClosingWriter:
+    """不压缩的写入流，关闭时不关闭底层流"""
+
+    def __init__(self, fileobj: BinaryIO):
+        self._fileobj = fileobj
+
+    def write(self, data: bytes) -> int:
+        return self._fileobj.write(data)
+
+    def flush(self):
+        self._fileobj.flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self) -> "_NonClosingWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Codec:
+    """归档压缩编解码器"""
+
+    name = ''  # 编解码器名称
+    extension = ''  # 归档文件扩展名
+    aliases: Tuple[str, ...] = ()  # 其他可识别的扩展名
+    tar_option = ''  # 远程 tar -x 的解压参数
+    remote_command: Optional[str] = None  # 远程解压依赖的命令，None表示无依赖
+    default_level = 0  # 默认压缩级别
+    max_level: Optional[int] = None  # 最大压缩级别（最小为0），None表示不使用压缩级别
+
+    def available(self) -> bool:
+        """本地是否可以使用该编解码器压缩"""
+        return True
+
+    def check_level(self, level: Optional[int]) -> int:
+        """
+        校验压缩级别
+
+        Args:
+            level: 压缩级别，None使用默认级别
+
+        Returns:
+            int: 实际使用的压缩级别
+
+        Raises:
+            ValueError: 压缩级别超出该编解码器支持的范围
+        """
+        if level is None:
+            return self.default_level
+        if self.max_level is not None and not 0 <= level <= self.max_level:
+            raise ValueError(f"Compression level for {self.name} must be between 0 and {self.max_level}: {level}")
+        return level
+
+    def open_writer(self, fileobj: BinaryIO, level: Optional[int] = None) -> BinaryIO:
+        """
+        打开压缩写入流，关闭返回的流时不会关闭fileobj
+
+        Args:
+            fileobj: 目标流
+            level: 压缩级别，None使用默认级别
+
+        Returns:
+            BinaryIO: 压缩写入流
+        """
+        return _NonClosingWriter(fileobj)
+
+    def open_reader(self, path: str) -> BinaryIO:
+        """
+        打开解压读取流
+
+        Args:
+            path: 压缩文件路径
+
+        Returns:
+            BinaryIO: 解压读取流
+        """
+        return open(path, 'rb')
+
+    def tar_extract_cmd(self, archive: str, target_dir: str) -> str:
+        """
+        生成远程解压命令
+
+        Args:
+            archive: 远程归档文件路径，'-'表示标准输入
+            target_dir: 目标解压目录
+
+        Returns:
+            str: 解压命令
+        """
+        option = f" {self.tar_option}" if self.tar_option else ''
+        return f"tar -x{option} -f {archive} -C {target_dir} --overwrite"
+
+    def __repr__(self) -> str:
+        return f"Codec({self.name})"
+
+
+class NoneCodec(Codec):
+    """不压缩"""
+    name = 'none'
+    extension = '.tar'
+
+
+class GzipCodec(Codec):
+    """gzip压缩"""
+    name = 'gzip'
+    extension = '.tar.gz'
+    aliases = ('.tgz',)
+    tar_option = '-z'
+    remote_command = 'gzip'
+    default_level = 6
+    max_level = 9
+
+    def open_writer(self, fileobj: BinaryIO, level: Optional[int] = None) -> BinaryIO:
+        return gzip.GzipFile(fileobj=fileobj, mode='wb',
+                             compresslevel=self.default_level if level is None else level)
+
+    def open_reader(self, path: str) -> BinaryIO:
+        return gzip.open(path, 'rb')
+
+
+class XzCodec(Codec):
+    """xz压缩，压缩率最高，压缩速度最慢"""
+    name = 'xz'
+    extension = '.tar.xz'
+    aliases = ('.txz',)
+    tar_option = '-J'
+    remote_command = 'xz'
+    default_level = 6
+    max_level = 9
+
+    def open_writer(self, fileobj: BinaryIO, level: Optional[int] = None) -> BinaryIO:
+        return lzma.LZMAFile(fileobj, mode='wb', preset=self.default_level if level is None else level)
+
+    def open_reader(self, path: str) -> BinaryIO:
+        return lzma.open(path, 'rb')
+
+
+class ZstdCodec(Codec):
+    """zstd压缩，需要安装 zstandard 包"""
+    name = 'zstd'
+    extension = '.tar.zst'
+    aliases = ('.tzst',)
+    tar_option = "-I 'zstd -d'"
+    remote_command = 'zstd'
+    default_level = 3
+    max_level = 22
+
+    def available(self) -> bool:
+        return zstandard is not None
+
+    def open_writer(self, fileobj: BinaryIO, level: Optional[int] = None) -> BinaryIO:
+        compressor = zstandard.ZstdCompressor(level=self.default_level if level is None else level)
+        return compressor.stream_writer(fileobj, closefd=False)
+
+    def open_reader(self, path: str) -> BinaryIO:
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+
+# 所有编解码器，按名称索引
+CODECS: Dict[str, Codec] = {codec.name: codec for codec in (NoneCodec(), GzipCodec(), XzCodec(), ZstdCodec())}
+
+# 未指定时使用的编解码器，与所有远程主机兼容
+DEFAULT_CODEC = 'gzip'
+
+# 各编解码器和级别在典型二进制制品上的估算：(压缩率, 本地压缩速度MB/s, 远程解压速度MB/s)
+CODEC_PROFILES: Dict[Tuple[str, int], Tuple[float, float, float]] = {
+    ('none', 0): (1.0, math.inf, math.inf),
+    ('zstd', 1): (0.42, 400, 1000),
+    ('zstd', 3): (0.39, 250, 1000),
+    ('zstd', 9): (0.36, 50, 1000),
+    ('zstd', 19): (0.32, 4, 900),
+    ('gzip', 1): (0.45, 60, 250),
+    ('gzip', 6): (0.40, 25, 250),
+    ('gzip', 9): (0.39, 8, 250),
+    ('xz', 1): (0.34, 12, 70),
+    ('xz', 6): (0.30, 3, 80),
+}
+
+
+def get_codec(name: str) -> Codec:
+    """
+    按名称获取编解码器
+
+    Args:
+        name: 编解码器名称
+
+    Returns:
+        Codec: 编解码器
+
+    Raises:
+        ValueError: 未知的编解码器，或本地缺少依赖
+    """
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(f"Unknown compression codec: {name}")
+    if not codec.available():
+        raise ValueError(f"Compression codec {name} is not available locally")
+    return codec
+
+
+def codec_for_path(path: str) -> Optional[Codec]:
+    """
+    根据扩展名识别tar归档的编解码器
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        Optional[Codec]: 编解码器，不是tar归档时返回None
+    """
+    for codec in CODECS.values():
+        if path.endswith((codec.extension,) + codec.aliases):
+            return codec
+    return None
+
+
+# 测得的链路速度缓存：主机 -> 字节/秒
+_link_speeds: Dict[str, float] = {}
+_probe_lock = threading.Lock()
+
+
+def probe_remote_codecs(conn: "Connection") -> List[str]:
+    """
+    获取远程主机可以解压的编解码器，根据缓存的主机信息判断，不单独执行远程命令
+
+    Args:
+        conn: Fabric连接对象
+
+    Returns:
+        List[str]: 编解码器名称列表
+    """
+    found = set(get_facts(conn).commands)
+    return [codec.name for codec in CODECS.values()
+            if codec.remote_command is None or codec.remote_command in found]
+
+
+def known_link_speed(conn: "Connection") -> Optional[float]:
+    """
+    获取已测得的链路速度，不发送任何数据
+
+    Args:
+        conn: Fabric连接对象
+
+    Returns:
+        Optional[float]: 上传速度（字节/秒），尚未测量时返回None
+    """
+    with _probe_lock:
+        return _link_speeds.get(host_key(conn))
+
+
+def measure_link_speed(conn: "Connection", probe_size: int = 2 * 1024 * 1024) -> float:
+    """
+    向远程主机发送一段随机数据测量上传速度，结果按主机缓存
+
+    Args:
+        conn: Fabric连接对象
+        probe_size: 测量数据大小（字节）
+
+    Returns:
+        float: 上传速度（字节/秒）
+    """
+    key = host_key(conn)
+    with _probe_lock:
+        if key in _link_speeds:
+            return _link_speeds[key]
+
+    conn.open()
+    channel = conn.client.get_transport().open_session()
+    try:
+        channel.exec_command('cat > /dev/null')
+        start = time.perf_counter()
+        channel.sendall(os.urandom(probe_size))
+        channel.shutdown_write()
+        channel.recv_exit_status()
+        speed = probe_size / max(time.perf_counter() - start, 1e-6)
+    finally:
+        channel.close()
+
+    logger.info(f"Measured link speed to {conn.host}: {speed / 1024 / 1024:.1f} MB/s")
+    with _probe_lock:
+        _link_speeds[key] = speed
+    return speed
+
+
+def select_codec(candidates: Iterable[str],
+                 link_speed: Optional[float] = None,
+                 cpu_budget: Optional[float] = None) -> Tuple[Codec, int]:
+    """
+    选择预计端到端耗时（本地压缩 + 传输 + 远程解压）最短的编解码器和压缩级别
+
+    Args:
+        candidates: 可用的编解码器名称（本地和远程均支持）
+        link_speed: 链路速度（字节/秒），None时使用默认编解码器
+        cpu_budget: 每GB输入允许的本地压缩CPU时间（秒），None表示不限制
+
+    Returns:
+        Tuple[Codec, int]: (编解码器, 压缩级别)
+    """
+    usable = [name for name in candidates if name in CODECS and CODECS[name].available()]
+    if link_speed is None:
+        name = DEFAULT_CODEC if DEFAULT_CODEC in usable else 'none'
+        return CODECS[name], CODECS[name].default_level
+
+    link_mb = link_speed / 1024 / 1024
+    best = None
+    for (name, level), (ratio, compress_mb, decompress_mb) in CODEC_PROFILES.items():
+        if name not in usable:
+            continue
+        if cpu_budget is not None and 1024 / compress_mb > cpu_budget:
+            continue
+        # 每MB输入的预计耗时
+        cost = 1 / compress_mb + ratio / link_mb + 1 / decompress_mb
+        if best is None or cost < best[0]:
+            best = (cost, name, level)
+
+    if best is None:
+        return CODECS['none'], 0
+    return CODECS[best[1]], best[2]
@@ -0,0 +1,109 @@
+import shlex
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# 步骤标记前缀，脚本输出中以该前缀开头的行用于划分各步骤的输出
+STEP_MARKER = '__FABRIC_STEP__'
+
+
+@dataclass
+class ScriptStep:
+    """批量脚本中的一个步骤"""
+    name: str  # 步骤名称
+    commands: List[str]  # 依次执行的命令，任一命令失败则该步骤失败
+    fatal: bool = True  # 失败时是否终止脚本
+
+
+@dataclass
+class StepResult:
+    """步骤执行结果"""
+    name: str  # 步骤名称
+    exit_code: Optional[int]  # 退出码，None表示脚本在该步骤结束前中断
+    output: str = ''  # 该步骤的输出（标准输出和标准错误合并）
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+
+class BatchStepError(RuntimeError):
+    """批量脚本中的某个步骤执行失败"""
+
+    def __init__(self, step: StepResult):
+        self.step = step
+        super().__init__(f"Step '{step.name}' failed with exit code {step.exit_code}: {step.output.strip()}")
+
+
+@dataclass
+class BatchScript:
+    """
+    批量脚本：将多个步骤编译为一个shell脚本，在一次远程调用中执行
+
+    每个步骤的输出前后带有标记行，执行结果可以按步骤拆分，失败可以对应到具体步骤
+    """
+    steps: List[ScriptStep] = field(default_factory=list)
+    prologue: List[str] = field(default_factory=list)  # 所有步骤之前执行的命令（如设置变量）
+    epilogue: List[str] = field(default_factory=list)  # 脚本退出时总会执行的命令（如清理临时文件）
+
+    def add_step(self, name: str, *commands: str, fatal: bool = True):
+        """
+        添加步骤
+
+        Args:
+            name: 步骤名称，不能包含空白字符
+            *commands: 依次执行的命令
+            fatal: 失败时是否终止脚本
+        """
+        if not name or any(c.isspace() for c in name):
+            raise ValueError(f"Invalid step name: {name!r}")
+        self.steps.append(ScriptStep(name, list(commands), fatal))
+
+    def render(self) -> str:
+        """
+        生成shell脚本，标准错误合并到标准输出
+
+        Returns:
+            str: shell脚本
+        """
+        lines = ['exec 2>&1']
+        if self.epilogue:
+            lines.append(f"trap {shlex.quote('; '.join(self.epilogue))} EXIT")
+        lines.extend(self.prologue)
+        for step in self.steps:
+            body = ' && '.join(step.commands) or 'true'
+            lines.append(f"echo '{STEP_MARKER} begin {step.name}'")
+            lines.append(f"{{ {body}; }}; rc=$?")
+            lines.append(f"echo \"{STEP_MARKER} end {step.name} $rc\"")
+            if step.fatal:
+                lines.append('[ $rc -eq 0 ] || exit $rc')
+        lines.append('exit 0')
+        return '\n'.join(lines)
+
+    @staticmethod
+    def parse(output: str) -> List[StepResult]:
+        """
+        按步骤标记拆分脚本输出
+
+        Args:
+            output: 脚本输出
+
+        Returns:
+            List[StepResult]: 已开始执行的步骤的结果，按执行顺序排列
+        """
+        results = []
+        current: Optional[StepResult] = None
+        buffer: List[str] = []
+        for line in output.splitlines():
+            if line.startswith(f"{STEP_MARKER} begin "):
+                current = StepResult(name=line.split()[2], exit_code=None)
+                results.append(current)
+                buffer = []
+            elif line.startswith(f"{STEP_MARKER} end ") and current is not None:
+                current.exit_code = int(line.split()[3])
+                current.output = '\n'.join(buffer)
+                current = None
+            elif current is not None:
+                buffer.append(line)
+        if current is not None:
+            current.output = '\n'.join(buffer)
+        return results
@@ -0,0 +1,427 @@
+import argparse
+import functools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+from .archive_benchmark import INPUT_TYPES, _write_payload, create_sample_inputs
+from .cache_manager import DownloadCache
+from .common import _create_temp_tgz, cleanup_archive, configure_logging, download_file, extract_archive, \
+    get_download_cache, set_download_cache
+
+# 可选的测试组
+SUITES = ('archive', 'cache', 'download', 'deploy')
+
+# 基准结果文件格式版本
+BASELINE_VERSION = 1
+
+
+@dataclass
+class BenchmarkResult:
+    """单个基准测试的结果"""
+    name: str  # 测试名称，如 archive.tgz.16MB
+    seconds: float  # 每轮耗时的中位数（秒）
+    min: float  # 最短一轮耗时（秒）
+    max: float  # 最长一轮耗时（秒）
+    runs: int  # 测量轮数
+    ops: int = 1  # 每轮执行的操作数，如缓存测试中的条目数
+    metrics: Dict[str, Any] = field(default_factory=dict)  # 其他指标，如远程调用次数、字节数
+
+    @property
+    def per_op(self) -> float:
+        """每个操作的耗时（秒）"""
+        return self.seconds / self.ops
+
+
+def _measure(name: str, func: Callable[[], Any], runs: int, setup: Optional[Callable[[], Any]] = None,
+             teardown: Optional[Callable[[Any], None]] = None, ops: int = 1) -> BenchmarkResult:
+    """
+    多轮执行并计时，setup 和 teardown 不计入耗时
+
+    Args:
+        name: 测试名称
+        func: 被测函数，参数为 setup 的返回值（没有 setup 时无参数）
+        runs: 测量轮数
+        setup: 每轮执行前的准备函数
+        teardown: 每轮执行后的清理函数，参数为 func 的返回值
+        ops: 每轮执行的操作数
+
+    Returns:
+        BenchmarkResult: 测量结果
+    """
+    times = []
+    for _ in range(runs):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        value = func(*args)
+        times.append(time.perf_counter() - start)
+        if teardown is not None:
+            teardown(value)
+    return BenchmarkResult(name, statistics.median(times), min(times), max(times), runs, ops)
+
+
+def bench_archive(sizes: List[int], runs: int = 3, input_types: Optional[List[str]] = None) -> List[BenchmarkResult]:
+    """
+    测量 _create_temp_tgz 对每种输入类型和大小的打包耗时
+
+    Args:
+        sizes: 样例文件大小列表（字节）
+        runs: 测量轮数
+        input_types: 要测量的输入类型，默认全部
+
+    Returns:
+        List[BenchmarkResult]: 测量结果
+    """
+    results = []
+    for size in sizes:
+        work_dir = tempfile.mkdtemp()
+        try:
+            samples = create_sample_inputs(work_dir, size)
+            for input_type in input_types or INPUT_TYPES:
+                result = _measure(f"archive.{input_type}.{size // (1024 * 1024)}MB",
+                                  functools.partial(_create_temp_tgz, samples[input_type]), runs,
+                                  teardown=cleanup_archive)
+                result.metrics['input_bytes'] = size
+                results.append(result)
+        finally:
+            shutil.rmtree(work_dir)
+    return results
+
+
+def bench_download_cache(entries: int = 10000) -> List[BenchmarkResult]:
+    """
+    测量 DownloadCache 在大量条目下的 put、get（命中和未命中）和 clear 耗时
+
+    Args:
+        entries: 缓存条目数
+
+    Returns:
+        List[BenchmarkResult]: 测量结果，每个操作执行 entries 次为一轮
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        files_dir = os.path.join(work_dir, 'files')
+        os.makedirs(files_dir)
+        paths = []
+        for index in range(entries):
+            # 内容各不相同，避免按内容去重后只存储一份
+            path = os.path.join(files_dir, f"{index}.bin")
+            with open(path, 'wb') as f:
+                f.write(index.to_bytes(8, 'big') * 16)
+            paths.append(path)
+        urls = [f"http://bench.invalid/{index}.bin" for index in range(entries)]
+        cache = DownloadCache(os.path.join(work_dir, 'cache'))
+
+        def put_all():
+            for url, path in zip(urls, paths):
+                cache.put(url, path)
+
+        def get_all(prefix: str = ''):
+            for url in urls:
+                cache.get(prefix + url)
+
+        results = [
+            _measure(f"cache.put.{entries}", put_all, 1, ops=entries),
+            _measure(f"cache.get.{entries}", get_all, 3, ops=entries),
+            _measure(f"cache.get_miss.{entries}", functools.partial(get_all, 'miss:'), 3, ops=entries),
+            _measure(f"cache.clear.{entries}", cache.clear, 1, ops=entries),
+        ]
+        return results
+    finally:
+        shutil.rmtree(work_dir)
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_download(sizes: List[int], runs: int = 3) -> List[BenchmarkResult]:
+    """
+    测量 download_file 从本机HTTP服务下载的耗时：不使用缓存、冷缓存、缓存命中
+
+    Args:
+        sizes: 文件大小列表（字节）
+        runs: 测量轮数
+
+    Returns:
+        List[BenchmarkResult]: 测量结果
+    """
+    work_dir = tempfile.mkdtemp()
+    www_dir = os.path.join(work_dir, 'www')
+    os.makedirs(www_dir)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=www_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    original_cache = get_download_cache()
+    results = []
+    try:
+        for size in sizes:
+            label = f"{size // (1024 * 1024)}MB"
+            _write_payload(os.path.join(www_dir, f"{label}.bin"), size)
+            url = f"http://127.0.0.1:{server.server_address[1]}/{label}.bin"
+            cache_dirs = []
+
+            def fresh_cache():
+                cache_dirs.append(tempfile.mkdtemp(dir=work_dir))
+                set_download_cache(DownloadCache(cache_dirs[-1]))
+
+            results.append(_measure(f"download.nocache.{label}", lambda: download_file(url, use_cache=False), runs,
+                                    teardown=lambda path: shutil.rmtree(os.path.dirname(path))))
+            results.append(_measure(f"download.cold.{label}", lambda _: download_file(url), runs,
+                                    setup=fresh_cache))
+            results.append(_measure(f"download.hit.{label}", lambda: download_file(url), runs))
+            for result in results[-3:]:
+                result.metrics['bytes'] = size
+            for cache_dir in cache_dirs:
+                shutil.rmtree(cache_dir)
+    finally:
+        set_download_cache(original_cache)
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(work_dir)
+    return results
+
+
+def bench_deploy(host: str, sizes: List[int], runs: int = 3, use_sudo: bool = False,
+                 remote_dir: str = '/tmp/fabric-bench') -> List[BenchmarkResult]:
+    """
+    在测试主机（如本机sshd或一次性容器）上测量 extract_archive 和 deploy_service 的耗时
+
+    deploy_service 会安装并启动名为 fabric-bench 的systemd服务，结束后移除，不要在生产主机上运行
+
+    Args:
+        host: 测试主机地址（如 root@127.0.0.1:2222）
+        sizes: 样例文件大小列表（字节）
+        runs: 测量轮数
+        use_sudo: 是否使用sudo权限
+        remote_dir: 远程工作目录，测试前后会被删除
+
+    Returns:
+        List[BenchmarkResult]: 测量结果，deploy 测试附带远程调用次数
+    """
+    from fabric import Connection
+
+    from .service_manager import DeployConfig, ServiceManagerOperator
+
+    conn = Connection(host)
+    work_dir = tempfile.mkdtemp()
+    results = []
+    try:
+        for size in sizes:
+            label = f"{size // (1024 * 1024)}MB"
+            source_dir = os.path.join(work_dir, label)
+            os.makedirs(source_dir)
+            _write_payload(os.path.join(source_dir, 'payload.bin'), size)
+
+            def clean_remote():
+                conn.run(f"rm -rf {remote_dir}", hide=True)
+
+            def check_remote(_):
+                # extract_archive 只记录异常，不向上抛出，需要检查结果
+                if not conn.run(f"test -f {remote_dir}/payload.bin", hide=True, warn=True).ok:
+                    raise RuntimeError(f"Benchmark extract failed on {host}")
+
+            for streaming in (False, True):
+                mode = 'stream' if streaming else 'upload'
+                results.append(_measure(
+                    f"extract.{mode}.{label}",
+                    lambda _, s=streaming: extract_archive(conn, source_dir, remote_dir, use_sudo, streaming=s),
+                    runs, setup=clean_remote, teardown=check_remote))
+
+            for mode in ('step', 'batch', 'stream'):
+                config = DeployConfig(name='fabric-bench', description='fabric benchmark service',
+                                      exec_start='/bin/sleep infinity', source_path=source_dir,
+                                      install_path=remote_dir, use_sudo=use_sudo, compression='gzip',
+                                      batch=mode == 'batch', stream_transfer=mode == 'stream')
+                operator = ServiceManagerOperator(conn)
+                round_trips = []
+
+                def deploy(_, config=config, operator=operator):
+                    operator.deploy_service(config, force=True)
+                    round_trips.append(operator.timings['round_trips'])
+
+                result = _measure(f"deploy.{mode}.{label}", deploy, runs, setup=clean_remote)
+                result.metrics['round_trips'] = max(round_trips)
+                results.append(result)
+            ServiceManagerOperator(conn).remove_service('fabric-bench', remote_dir, use_sudo)
+    finally:
+        conn.run(f"rm -rf {remote_dir}", hide=True, warn=True)
+        conn.close()
+        shutil.rmtree(work_dir)
+    return results
+
+
+def run_suites(suites: Optional[List[str]] = None, sizes: Optional[List[int]] = None, runs: int = 3,
+               entries: int = 10000, host: Optional[str] = None, use_sudo: bool = False) -> List[BenchmarkResult]:
+    """
+    运行基准测试组
+
+    Args:
+        suites: 要运行的测试组，默认全部；没有指定测试主机时跳过 deploy
+        sizes: 样例文件大小列表（字节），默认1MB和16MB
+        runs: 测量轮数
+        entries: 缓存测试的条目数
+        host: deploy 测试组使用的测试主机
+        use_sudo: deploy 测试组是否使用sudo权限
+
+    Returns:
+        List[BenchmarkResult]: 测量结果
+    """
+    suites = suites or [suite for suite in SUITES if suite != 'deploy' or host]
+    sizes = sizes or [1024 * 1024, 16 * 1024 * 1024]
+    results = []
+    if 'archive' in suites:
+        results += bench_archive(sizes, runs)
+    if 'cache' in suites:
+        results += bench_download_cache(entries)
+    if 'download' in suites:
+        results += bench_download(sizes, runs)
+    if 'deploy' in suites:
+        if not host:
+            raise ValueError("The deploy suite requires a test host")
+        results += bench_deploy(host, sizes, runs, use_sudo)
+    return results
+
+
+def save_results(results: List[BenchmarkResult], path: str):
+    """
+    保存测量结果为JSON基准文件，附带运行环境信息
+
+    Args:
+        results: 测量结果
+        path: 基准文件路径
+    """
+    data = {
+        'version': BASELINE_VERSION,
+        'created_at': time.time(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': [asdict(result) for result in results],
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+
+def load_results(path: str) -> Dict[str, BenchmarkResult]:
+    """
+    读取JSON基准文件
+
+    Args:
+        path: 基准文件路径
+
+    Returns:
+        Dict[str, BenchmarkResult]: 测试名称到测量结果的映射
+
+    Raises:
+        ValueError: 基准文件版本不支持
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != BASELINE_VERSION:
+        raise ValueError(f"Unsupported baseline version in {path}: {data.get('version')}")
+    return {result['name']: BenchmarkResult(**result) for result in data['results']}
+
+
+@dataclass
+class Comparison:
+    """单个测试与基准的对比"""
+    name: str  # 测试名称
+    baseline: Optional[float]  # 基准耗时（秒），新增的测试为None
+    current: Optional[float]  # 当前耗时（秒），已删除的测试为None
+    change: Optional[float]  # 相对变化，0.1表示慢了10%
+    regressed: bool  # 是否超过阈值
+
+
+def compare_results(baseline: Dict[str, BenchmarkResult], current: Dict[str, BenchmarkResult],
+                    threshold: float = 0.1, min_delta: float = 0.001) -> List[Comparison]:
+    """
+    对比当前结果与基准，耗时增加超过阈值视为回退
+
+    Args:
+        baseline: 基准结果
+        current: 当前结果
+        threshold: 相对阈值，0.1表示慢10%以上为回退
+        min_delta: 绝对阈值（秒），耗时增加不超过该值时不视为回退，避免微小耗时的测量噪声
+
+    Returns:
+        List[Comparison]: 按测试名称排序的对比结果
+    """
+    comparisons = []
+    for name in sorted(set(baseline) | set(current)):
+        old, new = baseline.get(name), current.get(name)
+        if old is None or new is None:
+            comparisons.append(Comparison(name, old and old.seconds, new and new.seconds, None, False))
+            continue
+        change = (new.seconds - old.seconds) / old.seconds if old.seconds else 0.0
+        regressed = change > threshold and new.seconds - old.seconds > min_delta
+        comparisons.append(Comparison(name, old.seconds, new.seconds, change, regressed))
+    return comparisons
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    """生成测量结果报告"""
+    lines = [f"{'NAME':<28}{'MEDIAN':>11}{'MIN':>11}{'MAX':>11}{'PER OP':>11}  METRICS"]
+    for r in results:
+        metrics = ' '.join(f"{key}={value}" for key, value in r.metrics.items())
+        lines.append(f"{r.name:<28}{r.seconds * 1000:>9.2f}ms{r.min * 1000:>9.2f}ms{r.max * 1000:>9.2f}ms"
+                     f"{r.per_op * 1e6:>9.1f}us  {metrics}")
+    return '\n'.join(lines)
+
+
+def format_comparisons(comparisons: List[Comparison]) -> str:
+    """生成对比报告"""
+    lines = [f"{'NAME':<28}{'BASELINE':>11}{'CURRENT':>11}{'CHANGE':>9}"]
+    for c in comparisons:
+        baseline = '-' if c.baseline is None else f"{c.baseline * 1000:.2f}ms"
+        current = '-' if c.current is None else f"{c.current * 1000:.2f}ms"
+        change = '-' if c.change is None else f"{c.change:+.1%}"
+        lines.append(f"{c.name:<28}{baseline:>11}{current:>11}{change:>9}{'  REGRESSION' if c.regressed else ''}")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="部署热点路径基准测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="运行基准测试")
+    run_parser.add_argument('--suites', nargs='+', choices=SUITES, help="要运行的测试组，默认除 deploy 外全部")
+    run_parser.add_argument('--sizes', nargs='+', type=int, default=[1, 16], help="样例文件大小（MB）")
+    run_parser.add_argument('--runs', type=int, default=3, help="测量轮数")
+    run_parser.add_argument('--entries', type=int, default=10000, help="缓存测试的条目数")
+    run_parser.add_argument('--host', help="deploy 测试组使用的测试主机（如本机sshd或一次性容器）")
+    run_parser.add_argument('--sudo', action='store_true', help="deploy 测试组使用sudo权限")
+    run_parser.add_argument('--output', help="保存结果的JSON基准文件")
+
+    compare_parser = subparsers.add_parser('compare', help="与基准对比，存在回退时以状态码1退出")
+    compare_parser.add_argument('baseline', help="基准文件")
+    compare_parser.add_argument('current', help="当前结果文件")
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help="相对阈值，0.1表示慢10%%以上为回退")
+    compare_parser.add_argument('--min-delta', type=float, default=0.001, help="绝对阈值（秒）")
+
+    args = parser.parse_args(argv)
+    configure_logging()
+    if args.command == 'run':
+        results = run_suites(args.suites, [size * 1024 * 1024 for size in args.sizes], args.runs,
+                             args.entries, args.host, args.sudo)
+        print(format_results(results))
+        if args.output:
+            save_results(results, args.output)
+        return 0
+
+    comparisons = compare_results(load_results(args.baseline), load_results(args.current),
+                                  args.threshold, args.min_delta)
+    print(format_comparisons(comparisons))
+    return 1 if any(c.regressed for c in comparisons) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
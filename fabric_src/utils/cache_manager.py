@@ -1,89 +1,741 @@
+import fnmatch
 import hashlib
+import logging
 import os
+import re
 import shutil
+import sqlite3
+import tempfile
+import threading
 import time
-from typing import Optional
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Dict, List, Optional
 from urllib.parse import unquote, urlparse
 
+from .file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+class EvictionPolicy:
+    """缓存淘汰策略"""
+    LRU = "lru"  # 最近最少使用
+    LFU = "lfu"  # 最不经常使用
+
+
+@dataclass
+class CachePolicy:
+    """按URL模式配置的缓存新鲜度策略"""
+    pattern: str  # URL的fnmatch模式
+    ttl: Optional[int] = None  # 新鲜期（秒），None表示永不过期（适用于固定版本的URL）
+    revalidate: bool = True  # 过期后是否使用ETag/Last-Modified条件请求重新验证，否则完整重新下载
+
+
+class IntegrityError(ValueError):
+    """下载内容的sha256与期望值不一致"""
+
+
+class BlobWriter:
+    """缓存写入器，边写入边计算sha256，提交时原子重命名到内容寻址路径"""
+
+    def __init__(self, cache: "DownloadCache", url: str, expected_sha256: Optional[str] = None):
+        """
+        初始化缓存写入器
+
+        Args:
+            cache: 下载缓存管理器
+            url: 下载URL
+            expected_sha256: 期望的sha256，提交时校验
+        """
+        self.cache = cache
+        self.url = url
+        self.expected_sha256 = expected_sha256.lower() if expected_sha256 else None
+        self.size = 0
+        self._digest = hashlib.sha256()
+        # 临时文件与缓存位于同一文件系统，保证重命名是原子的
+        fd, self.temp_path = tempfile.mkstemp(dir=cache.temp_dir, suffix='.partial')
+        self._file = os.fdopen(fd, 'wb')
+        self._committed = False
+
+    def write(self, data: bytes):
+        """写入数据"""
+        self._file.write(data)
+        self._digest.update(data)
+        self.size += len(data)
+
+    def flush(self):
+        """刷新写入缓冲"""
+        self._file.flush()
+
+    def commit(self, etag: Optional[str] = None, last_modified: Optional[str] = None) -> str:
+        """
+        完成写入：刷盘、校验sha256并原子重命名到缓存中
+
+        Args:
+            etag: 响应的ETag
+            last_modified: 响应的Last-Modified
+
+        Returns:
+            str: 缓存文件路径
+
+        Raises:
+            IntegrityError: sha256与期望值不一致
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        digest = self._digest.hexdigest()
+        if self.expected_sha256 and digest != self.expected_sha256:
+            self.abort()
+            raise IntegrityError(f"SHA-256 mismatch for {self.url}: expected {self.expected_sha256}, got {digest}")
+
+        path = self.cache._commit(self.url, self.temp_path, digest, self.size, etag, last_modified)
+        self._committed = True
+        return path
+
+    def abort(self):
+        """放弃写入并删除临时文件"""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)
+
+    def __enter__(self) -> "BlobWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self._committed:
+            self.abort()
+
 
 class DownloadCache:
-    """下载缓存管理器"""
+    """
+    下载缓存管理器
+
+    文件按内容sha256存放在 blobs/<前两位>/<sha256>/<文件名>，URL通过别名指向内容，
+    不同镜像下载的相同文件只存储一份。文件只会通过原子重命名进入缓存，不会出现不完整的条目
+    """
+
+    # 索引数据库文件名
+    INDEX_NAME = "index.sqlite3"
+
+    # 缓存布局版本，旧版本按URL的MD5存放的缓存会在首次打开时迁移
+    LAYOUT_VERSION = 2
 
-    def __init__(self, cache_dir: Optional[str] = None):
+    # 旧版本布局的缓存文件目录：<URL的MD5前两位>/<第三、四位>/<文件名>
+    _LEGACY_DIR = re.compile(r'^[0-9a-f]{2}$')
+
+    # 崩溃进程残留的未完成写入文件的保留时间（秒）
+    PARTIAL_MAX_AGE = 24 * 3600
+
+    # 各淘汰策略对应的淘汰顺序
+    _EVICTION_ORDER = {
+        EvictionPolicy.LRU: "last_access ASC",
+        EvictionPolicy.LFU: "hits ASC, last_access ASC",
+    }
+
+    # 未匹配任何策略时使用的默认策略：永不过期
+    DEFAULT_POLICY = CachePolicy(pattern='*')
+
+    def __init__(self, cache_dir: Optional[str] = None,
+                 max_size: Optional[int] = None,
+                 eviction_policy: str = EvictionPolicy.LRU,
+                 policies: Optional[List[CachePolicy]] = None):
         """
         初始化下载缓存管理器
 
         Args:
             cache_dir: 缓存目录路径，如果为None则使用默认路径
+            max_size: 缓存总大小上限（字节），如果为None则不限制
+            eviction_policy: 超出上限时的淘汰策略（lru/lfu）
+            policies: 新鲜度策略列表，按顺序匹配URL，第一个匹配的生效
         """
         if cache_dir is None:
             # 默认缓存目录在用户目录下
             cache_dir = os.path.expanduser("~/.fabric_cache/downloads")
+        if eviction_policy not in self._EVICTION_ORDER:
+            raise ValueError(f"Unsupported eviction policy: {eviction_policy}")
         self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        self.temp_dir = os.path.join(cache_dir, 'tmp')
+        self.lock_dir = os.path.join(cache_dir, 'locks')
+        self.max_size = max_size
+        self.eviction_policy = eviction_policy
+        self.policies = list(policies or [])
         os.makedirs(self.cache_dir, exist_ok=True)
 
-    def _get_cache_key(self, url: str) -> str:
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.cache_dir, self.INDEX_NAME),
+                                   timeout=30, check_same_thread=False, isolation_level=None)
+        self._init_index()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.temp_dir, exist_ok=True)
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._clean_partials()
+
+    def _clean_partials(self):
+        """清理崩溃进程残留的未完成写入文件"""
+        now = time.time()
+        for file in os.listdir(self.temp_dir):
+            file_path = os.path.join(self.temp_dir, file)
+            try:
+                if now - os.path.getmtime(file_path) > self.PARTIAL_MAX_AGE:
+                    os.unlink(file_path)
+            except FileNotFoundError:
+                pass
+
+    def lock(self, url: str, timeout: Optional[float] = None) -> FileLock:
+        """
+        获取URL对应的跨进程锁，用于保证同一URL同时只有一个下载
+
+        指向同一缓存目录的多个DownloadCache实例（包括其他进程中的）共享同一把锁
+
+        Args:
+            url: 下载URL
+            timeout: 获取锁的超时时间（秒），None表示一直等待
+
+        Returns:
+            FileLock: 文件锁（未获取，需配合with使用）
+        """
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return FileLock(os.path.join(self.lock_dir, f"{key}.lock"), timeout=timeout)
+
+    def _init_index(self):
+        """创建索引表，旧版本布局的缓存会被迁移"""
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS stats ("
+                " name TEXT PRIMARY KEY,"
+                " value INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                " digest TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS aliases ("
+                " url TEXT PRIMARY KEY,"
+                " digest TEXT NOT NULL,"
+                " filename TEXT NOT NULL,"
+                " etag TEXT,"
+                " last_modified TEXT,"
+                " validated_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS aliases_digest ON aliases (digest)")
+
+            layout = self._db.execute("SELECT value FROM stats WHERE name = 'layout'").fetchone()
+            if layout is None or layout[0] < self.LAYOUT_VERSION:
+                self._migrate_legacy_layout()
+            self._db.execute("INSERT OR REPLACE INTO stats (name, value) VALUES ('layout', ?)",
+                             (self.LAYOUT_VERSION,))
+
+    def _migrate_legacy_layout(self):
+        """
+        将旧版本按URL的MD5存放的缓存迁移到内容寻址布局（调用方需持有锁）
+
+        旧索引 entries 表中有URL的条目移入 blobs 并创建别名；没有URL的条目，以及最早版本不建索引、
+        只存放在 <md5前两位>/<第三、四位>/ 目录下的文件，无法还原URL，按内容sha256导入 blobs 不创建别名，
+        之后仍可通过指定sha256的查找命中。只处理缓存目录下的文件，其他文件不受影响
+        """
+        cache_root = os.path.realpath(self.cache_dir)
+        adopted = imported = imported_bytes = 0
+        if self._db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries'").fetchone():
+            rows = self._db.execute("SELECT * FROM entries").fetchall()
+            columns = [column[0] for column in self._db.execute("SELECT * FROM entries LIMIT 0").description]
+            for row in rows:
+                entry = dict(zip(columns, row))
+                path = os.path.realpath(entry['path'])
+                # 只处理缓存目录下的文件
+                if os.path.commonpath([cache_root, path]) != cache_root or path == cache_root:
+                    continue
+                if not os.path.isfile(path):
+                    continue
+                if entry['url']:
+                    self._adopt_legacy_file(entry, path)
+                    adopted += 1
+                else:
+                    imported_bytes += os.path.getsize(path)
+                    self._adopt_blob(path, os.path.basename(path), entry['created_at'], entry['last_access'],
+                                     entry['hits'])
+                    imported += 1
+                self._remove_empty_dirs(os.path.dirname(path), cache_root)
+            self._db.execute("DROP TABLE entries")
+
+        # 没有索引的旧版本缓存文件
+        for first in sorted(os.listdir(cache_root)):
+            first_dir = os.path.join(cache_root, first)
+            if not self._LEGACY_DIR.match(first) or not os.path.isdir(first_dir):
+                continue
+            for second in sorted(os.listdir(first_dir)):
+                second_dir = os.path.join(first_dir, second)
+                if not self._LEGACY_DIR.match(second) or not os.path.isdir(second_dir):
+                    continue
+                for name in sorted(os.listdir(second_dir)):
+                    path = os.path.join(second_dir, name)
+                    if not os.path.isfile(path) or os.path.islink(path):
+                        continue
+                    mtime = os.path.getmtime(path)
+                    imported_bytes += os.path.getsize(path)
+                    self._adopt_blob(path, name, mtime, mtime, 0)
+                    imported += 1
+                self._remove_empty_dirs(second_dir, cache_root)
+
+        if adopted or imported:
+            logger.info(f"Migrated legacy download cache {self.cache_dir}: {adopted} files with URL aliases, "
+                        f"{imported} files without URL ({imported_bytes} bytes) imported by content sha256")
+
+    @staticmethod
+    def _remove_empty_dirs(path: str, cache_root: str):
+        """删除迁移后变空的旧版本目录，直到缓存根目录"""
+        while path != cache_root:
+            try:
+                os.rmdir(path)
+            except OSError:
+                break
+            path = os.path.dirname(path)
+
+    def _adopt_blob(self, path: str, filename: str, created_at: float, last_access: float, hits: int) -> str:
+        """
+        将一个旧版本缓存文件按内容sha256移入 blobs，相同内容已存在时删除该文件（调用方需持有锁）
+
+        Returns:
+            str: 内容sha256
+        """
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        if self._db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone() \
+                and self._ensure_blob_name(digest, filename):
+            os.unlink(path)
+            return digest
+        blob_path = self._get_blob_path(digest, filename)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(path, blob_path)
+        self._db.execute(
+            "INSERT OR REPLACE INTO blobs (digest, size, created_at, last_access, hits) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (digest, os.path.getsize(blob_path), created_at, last_access, hits)
+        )
+        return digest
+
+    def _adopt_legacy_file(self, entry: Dict, path: str):
+        """将一个旧版本缓存文件移入内容寻址布局并创建别名（调用方需持有锁）"""
+        filename = self._get_filename(entry['url'])
+        digest = self._adopt_blob(path, filename, entry['created_at'], entry['last_access'], entry['hits'])
+        self._set_alias(entry['url'], digest, filename, entry.get('etag'), entry.get('last_modified'))
+        # 保留旧条目的验证时间，迁移不应延长新鲜期
+        self._db.execute("UPDATE aliases SET validated_at = ? WHERE url = ?",
+                         (entry.get('validated_at') or entry['created_at'], entry['url']))
+
+    def _incr_stat(self, name: str, amount: int = 1):
+        self._db.execute(
+            "INSERT INTO stats (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def add_policy(self, policy: CachePolicy):
+        """
+        添加新鲜度策略，优先级低于已添加的策略
+
+        Args:
+            policy: 新鲜度策略
+        """
+        self.policies.append(policy)
+
+    def policy_for(self, url: str) -> CachePolicy:
         """
-        生成URL的缓存键
+        获取URL对应的新鲜度策略
 
         Args:
             url: 下载URL
 
         Returns:
-            str: 缓存键（URL的MD5值）
+            CachePolicy: 第一个匹配的策略，没有匹配时返回默认策略
         """
-        return hashlib.md5(url.encode()).hexdigest()
+        for policy in self.policies:
+            if fnmatch.fnmatch(url, policy.pattern):
+                return policy
+        return self.DEFAULT_POLICY
 
-    def _get_cache_path(self, url: str) -> str:
+    @staticmethod
+    def _get_filename(url: str) -> str:
         """
-        获取URL对应的缓存文件路径
+        获取URL对应的原始文件名，解压时依赖扩展名判断格式
 
         Args:
             url: 下载URL
 
         Returns:
-            str: 缓存文件路径
+            str: 文件名
         """
-        # 获取原始文件名
         filename = unquote(os.path.basename(urlparse(url).path))
-        if not filename:
-            filename = 'downloaded_file'
+        return filename or 'downloaded_file'
+
+    def _get_blob_path(self, digest: str, filename: str) -> str:
+        """
+        获取内容对应的缓存文件路径
+
+        Args:
+            digest: 内容sha256
+            filename: 文件名
+
+        Returns:
+            str: 缓存文件路径
+        """
+        return os.path.join(self.blob_dir, digest[:2], digest, filename)
 
-        # 使用URL的MD5值作为子目录，避免文件名冲突
-        cache_key = self._get_cache_key(url)
-        cache_subdir = os.path.join(self.cache_dir, cache_key[:2], cache_key[2:4])
-        os.makedirs(cache_subdir, exist_ok=True)
+    def _ensure_blob_name(self, digest: str, filename: str) -> Optional[str]:
+        """
+        确保内容目录下存在指定文件名，不同文件名之间使用硬链接，不占用额外空间（调用方需持有锁）
+
+        Returns:
+            Optional[str]: 缓存文件路径，如果内容已不存在则返回None
+        """
+        path = self._get_blob_path(digest, filename)
+        if os.path.exists(path):
+            return path
+        blob_dir = os.path.dirname(path)
+        existing = os.listdir(blob_dir) if os.path.isdir(blob_dir) else []
+        if not existing:
+            return None
+        try:
+            os.link(os.path.join(blob_dir, existing[0]), path)
+        except OSError:
+            shutil.copy2(os.path.join(blob_dir, existing[0]), path)
+        return path
 
-        # 组合最终的缓存文件路径
-        return os.path.join(cache_subdir, filename)
+    def _hit(self, digest: str, size: int):
+        """记录一次命中（调用方需持有锁）"""
+        self._db.execute("UPDATE blobs SET last_access = ?, hits = hits + 1 WHERE digest = ?",
+                         (time.time(), digest))
+        self._incr_stat('hits')
+        self._incr_stat('bytes_saved', size)
 
-    def get(self, url: str) -> Optional[str]:
+    def get(self, url: str, sha256: Optional[str] = None) -> Optional[str]:
         """
         从缓存中获取文件
 
         Args:
             url: 下载URL
+            sha256: 期望的内容sha256（可选），指定时只返回内容一致的文件，
+                即使该URL从未下载过，只要相同内容已在缓存中也会命中
 
         Returns:
-            Optional[str]: 缓存文件路径，如果不存在则返回None
+            Optional[str]: 缓存文件路径，如果不存在或已过期则返回None
         """
-        cache_path = self._get_cache_path(url)
-        return cache_path if os.path.exists(cache_path) else None
+        filename = self._get_filename(url)
+        ttl = self.policy_for(url).ttl
+        sha256 = sha256.lower() if sha256 else None
+        with self._lock:
+            if sha256:
+                # 内容寻址：按摘要直接查找，与URL和新鲜度无关
+                row = self._db.execute("SELECT size FROM blobs WHERE digest = ?", (sha256,)).fetchone()
+                path = self._ensure_blob_name(sha256, filename) if row else None
+                if path is None:
+                    self._incr_stat('misses')
+                    return None
+                self._set_alias(url, sha256, filename)
+                self._hit(sha256, row[0])
+                return path
+
+            row = self._db.execute(
+                "SELECT a.digest, a.validated_at, b.size FROM aliases a "
+                "JOIN blobs b ON a.digest = b.digest WHERE a.url = ?", (url,)
+            ).fetchone()
+            path = self._ensure_blob_name(row[0], filename) if row else None
+            if path is None:
+                self._incr_stat('misses')
+                return None
+            if ttl is not None and time.time() - row[1] > ttl:
+                # 已过期，需要重新验证或重新下载
+                self._incr_stat('stale')
+                return None
+
+            self._hit(row[0], row[2])
+        return path
+
+    def contains(self, url: str, sha256: Optional[str] = None) -> bool:
+        """
+        检查缓存中是否有URL对应的新鲜条目，不记录命中统计
+
+        Args:
+            url: 下载URL
+            sha256: 期望的内容sha256（可选）
+
+        Returns:
+            bool: 是否存在
+        """
+        ttl = self.policy_for(url).ttl
+        with self._lock:
+            if sha256:
+                row = self._db.execute("SELECT 1 FROM blobs WHERE digest = ?", (sha256.lower(),)).fetchone()
+                return row is not None
+            row = self._db.execute(
+                "SELECT a.validated_at FROM aliases a "
+                "JOIN blobs b ON a.digest = b.digest WHERE a.url = ?", (url,)
+            ).fetchone()
+        return row is not None and (ttl is None or time.time() - row[0] <= ttl)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """
+        获取重新验证缓存条目所需的条件请求头
+
+        Args:
+            url: 下载URL
+
+        Returns:
+            Dict[str, str]: If-None-Match / If-Modified-Since 请求头，无法重新验证时为空
+        """
+        if not self.policy_for(url).revalidate:
+            return {}
+        with self._lock:
+            row = self._db.execute(
+                "SELECT a.etag, a.last_modified FROM aliases a "
+                "JOIN blobs b ON a.digest = b.digest WHERE a.url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return {}
+
+        headers = {}
+        if row[0]:
+            headers['If-None-Match'] = row[0]
+        if row[1]:
+            headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def mark_revalidated(self, url: str) -> Optional[str]:
+        """
+        服务端返回304后调用，刷新条目的验证时间
+
+        Args:
+            url: 下载URL
+
+        Returns:
+            Optional[str]: 缓存文件路径，如果条目已不存在则返回None
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT a.digest, b.size FROM aliases a "
+                "JOIN blobs b ON a.digest = b.digest WHERE a.url = ?", (url,)
+            ).fetchone()
+            path = self._ensure_blob_name(row[0], self._get_filename(url)) if row else None
+            if path is None:
+                return None
+            now = time.time()
+            self._db.execute("UPDATE aliases SET validated_at = ? WHERE url = ?", (now, url))
+            self._db.execute("UPDATE blobs SET last_access = ?, hits = hits + 1 WHERE digest = ?",
+                             (now, row[0]))
+            self._incr_stat('revalidations')
+            self._incr_stat('bytes_saved', row[1])
+        return path
 
-    def put(self, url: str, file_path: str) -> str:
+    def link(self, url: str, target_url: str) -> Optional[str]:
+        """
+        让URL指向另一个URL已缓存的内容，不复制文件
+
+        Args:
+            url: 新的URL
+            target_url: 已缓存的URL
+
+        Returns:
+            Optional[str]: 缓存文件路径，target_url未缓存时返回None
+        """
+        filename = self._get_filename(url)
+        with self._lock:
+            row = self._db.execute("SELECT digest FROM aliases WHERE url = ?", (target_url,)).fetchone()
+            path = self._ensure_blob_name(row[0], filename) if row else None
+            if path:
+                self._set_alias(url, row[0], filename)
+        return path
+
+    def writer(self, url: str, expected_sha256: Optional[str] = None) -> BlobWriter:
+        """
+        创建流式写入器，下载数据直接写入缓存，无需再复制一次
+
+        Args:
+            url: 下载URL
+            expected_sha256: 期望的sha256，提交时校验
+
+        Returns:
+            BlobWriter: 缓存写入器
+        """
+        return BlobWriter(self, url, expected_sha256)
+
+    def partial_path(self, url: str) -> str:
+        """
+        获取URL对应的下载中文件路径，同一URL固定不变，中断的下载可以续传（调用方需持有该URL的锁）
+
+        Args:
+            url: 下载URL
+
+        Returns:
+            str: 下载中文件路径
+        """
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.temp_dir, f"{key}.partial")
+
+    def commit_file(self, url: str, file_path: str,
+                    digest: Optional[str] = None, expected_sha256: Optional[str] = None,
+                    etag: Optional[str] = None, last_modified: Optional[str] = None) -> str:
+        """
+        将缓存目录内下载完成的文件原子移动到缓存中
+
+        Args:
+            url: 下载URL
+            file_path: 下载完成的文件，必须位于缓存的临时目录中
+            digest: 已知的文件sha256，为None时读取一次文件计算
+            expected_sha256: 期望的sha256（可选）
+            etag: 响应的ETag
+            last_modified: 响应的Last-Modified
+
+        Returns:
+            str: 缓存文件路径
+
+        Raises:
+            IntegrityError: sha256与期望值不一致，此时文件会被删除
+        """
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                while chunk := f.read(1024 * 1024):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+        if expected_sha256 and digest != expected_sha256.lower():
+            os.unlink(file_path)
+            raise IntegrityError(f"SHA-256 mismatch for {url}: expected {expected_sha256.lower()}, got {digest}")
+        return self._commit(url, file_path, digest, os.path.getsize(file_path), etag, last_modified)
+
+    def put(self, url: str, file_path: str,
+            etag: Optional[str] = None, last_modified: Optional[str] = None,
+            sha256: Optional[str] = None) -> str:
         """
         将文件添加到缓存
 
         Args:
             url: 下载URL
             file_path: 源文件路径
+            etag: 响应的ETag，用于之后的条件请求
+            last_modified: 响应的Last-Modified，用于之后的条件请求
+            sha256: 期望的sha256（可选）
+
+        Returns:
+            str: 缓存文件路径
+        """
+        with self.writer(url, sha256) as writer, open(file_path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                writer.write(chunk)
+            return writer.commit(etag=etag, last_modified=last_modified)
+
+    def _set_alias(self, url: str, digest: str, filename: str,
+                   etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """记录URL到内容的别名（调用方需持有锁）"""
+        self._db.execute(
+            "INSERT INTO aliases (url, digest, filename, etag, last_modified, validated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET digest = excluded.digest, filename = excluded.filename, "
+            "etag = excluded.etag, last_modified = excluded.last_modified, validated_at = excluded.validated_at",
+            (url, digest, filename, etag, last_modified, time.time())
+        )
+
+    def _commit(self, url: str, temp_path: str, digest: str, size: int,
+                etag: Optional[str], last_modified: Optional[str]) -> str:
+        """
+        将写入完成的临时文件放入缓存，相同内容已存在时直接复用
 
         Returns:
             str: 缓存文件路径
         """
-        cache_path = self._get_cache_path(url)
-        shutil.copy2(file_path, cache_path)
-        return cache_path
+        filename = self._get_filename(url)
+        blob_path = self._get_blob_path(digest, filename)
+        now = time.time()
+        with self._lock:
+            exists = self._db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            path = self._ensure_blob_name(digest, filename) if exists else None
+            if path:
+                # 相同内容已存在
+                os.unlink(temp_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(temp_path, blob_path)
+                path = blob_path
+                self._db.execute(
+                    "INSERT OR REPLACE INTO blobs (digest, size, created_at, last_access, hits) "
+                    "VALUES (?, ?, ?, ?, 0)",
+                    (digest, size, now, now)
+                )
+            self._set_alias(url, digest, filename, etag, last_modified)
+            self._evict(keep=digest)
+        return path
+
+    def _evict(self, keep: Optional[str] = None):
+        """
+        按淘汰策略删除内容，直到缓存总大小不超过上限（调用方需持有锁）
+
+        Args:
+            keep: 不参与淘汰的内容摘要（通常是刚加入的内容）
+        """
+        if self.max_size is None:
+            return
+
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        order = self._EVICTION_ORDER[self.eviction_policy]
+        rows = self._db.execute(f"SELECT digest, size FROM blobs ORDER BY {order}").fetchall()
+        for digest, size in rows:
+            if total <= self.max_size:
+                break
+            if digest == keep:
+                continue
+            self._remove_blob(digest)
+            self._incr_stat('evictions')
+            total -= size
+
+    def _remove_blob(self, digest: str):
+        """删除内容及指向它的别名（调用方需持有锁）"""
+        blob_dir = os.path.join(self.blob_dir, digest[:2], digest)
+        if os.path.isdir(blob_dir):
+            shutil.rmtree(blob_dir)
+        self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        self._db.execute("DELETE FROM aliases WHERE digest = ?", (digest,))
+        # 清理空的前缀目录
+        parent = os.path.dirname(blob_dir)
+        if os.path.isdir(parent) and not os.listdir(parent):
+            os.rmdir(parent)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取缓存统计信息，不扫描文件系统
+
+        Returns:
+            Dict[str, int]: 包含 entries、aliases、size、hits、misses、stale、revalidations、bytes_saved、evictions
+        """
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            aliases = self._db.execute("SELECT COUNT(*) FROM aliases").fetchone()[0]
+            counters = dict(self._db.execute("SELECT name, value FROM stats").fetchall())
+        return {
+            'entries': entries,
+            'aliases': aliases,
+            'size': size,
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'stale': counters.get('stale', 0),
+            'revalidations': counters.get('revalidations', 0),
+            'bytes_saved': counters.get('bytes_saved', 0),
+            'evictions': counters.get('evictions', 0),
+        }
 
     def clear(self, max_age: Optional[int] = None):
         """
@@ -92,23 +744,192 @@ class DownloadCache:
         Args:
             max_age: 最大缓存时间（秒），如果为None则清理所有缓存
         """
-        if max_age is None:
-            # 清理所有缓存
-            shutil.rmtree(self.cache_dir)
-            os.makedirs(self.cache_dir, exist_ok=True)
-        else:
-            # 清理过期缓存
-            now = time.time()
-            for root, dirs, files in os.walk(self.cache_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if now - os.path.getmtime(file_path) > max_age:
-                        os.unlink(file_path)
-
-            # 清理空目录
-            for root, dirs, files in os.walk(self.cache_dir, topdown=False):
-                for _dir in dirs:
-                    dir_path = os.path.join(root, _dir)
-                    if not os.listdir(dir_path):
-                        os.rmdir(dir_path)
+        with self._lock:
+            if max_age is None:
+                # 清理所有缓存
+                shutil.rmtree(self.blob_dir)
+                os.makedirs(self.blob_dir, exist_ok=True)
+                self._db.execute("DELETE FROM blobs")
+                self._db.execute("DELETE FROM aliases")
+            else:
+                # 清理过期缓存，通过索引查询而不是遍历文件系统
+                expired = self._db.execute(
+                    "SELECT digest FROM blobs WHERE created_at < ?", (time.time() - max_age,)
+                ).fetchall()
+                for (digest,) in expired:
+                    self._remove_blob(digest)
+
+
+class ArchiveCache:
+    """
+    传输归档缓存
 
+    缓存打包好的传输归档，按源内容摘要和编解码器设置索引，与 DownloadCache 使用相同的存储和淘汰策略。
+    源文件或目录先按路径、大小和修改时间计算快速键，未命中时才读取内容计算摘要
+    """
+
+    # 残留的检出目录最长保留时间（秒）
+    STAGING_MAX_AGE = 24 * 3600
+
+    def __init__(self, cache_dir: Optional[str] = None,
+                 max_size: Optional[int] = None,
+                 eviction_policy: str = EvictionPolicy.LRU):
+        """
+        初始化归档缓存
+
+        Args:
+            cache_dir: 缓存目录路径，如果为None则使用默认路径
+            max_size: 缓存总大小上限（字节），如果为None则不限制
+            eviction_policy: 超出上限时的淘汰策略（lru/lfu）
+        """
+        if cache_dir is None:
+            # 默认与下载缓存放在同一目录下
+            cache_dir = os.path.expanduser("~/.fabric_cache/archives")
+        self.store = DownloadCache(cache_dir, max_size, eviction_policy)
+        self.staging_dir = os.path.join(cache_dir, 'staging')
+        os.makedirs(self.staging_dir, exist_ok=True)
+        self._clean_staging()
+
+    def _clean_staging(self):
+        """清理崩溃进程残留的检出目录"""
+        now = time.time()
+        for name in os.listdir(self.staging_dir):
+            path = os.path.join(self.staging_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.STAGING_MAX_AGE:
+                    shutil.rmtree(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _walk(path: str):
+        """按固定顺序遍历目录，返回 (相对路径, 绝对路径, lstat结果)"""
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(dirs + files):
+                full_path = os.path.join(root, name)
+                yield os.path.relpath(full_path, path), full_path, os.lstat(full_path)
+
+    @classmethod
+    def stat_key(cls, source_path: str) -> str:
+        """
+        根据路径、大小、权限和修改时间计算快速键，不读取文件内容
+
+        Args:
+            source_path: 源文件或目录路径
+
+        Returns:
+            str: 键
+        """
+        digest = hashlib.sha256(os.path.realpath(source_path).encode())
+        st = os.stat(source_path)
+        digest.update(f"\0{st.st_size}\0{st.st_mode}\0{st.st_mtime_ns}".encode())
+        if os.path.isdir(source_path):
+            for rel_path, _, st in cls._walk(source_path):
+                digest.update(f"\n{rel_path}\0{st.st_size}\0{st.st_mode}\0{st.st_mtime_ns}".encode())
+        return f"stat-{digest.hexdigest()}"
+
+    @staticmethod
+    def _file_sha256(path: str) -> str:
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    @classmethod
+    def content_key(cls, source_path: str) -> str:
+        """
+        根据文件名、权限和内容计算键，文件名会影响归档中的条目名
+
+        Args:
+            source_path: 源文件或目录路径
+
+        Returns:
+            str: 键
+        """
+        if not os.path.isdir(source_path):
+            st = os.stat(source_path)
+            digest = hashlib.sha256(f"{os.path.basename(source_path)}\0{st.st_mode}\0".encode())
+            digest.update(cls._file_sha256(source_path).encode())
+            return f"sha-{digest.hexdigest()}"
+
+        digest = hashlib.sha256()
+        for rel_path, full_path, st in cls._walk(source_path):
+            if os.path.islink(full_path):
+                content = f"link:{os.readlink(full_path)}"
+            elif os.path.isfile(full_path):
+                content = cls._file_sha256(full_path)
+            else:
+                content = ''
+            digest.update(f"{rel_path}\0{st.st_mode}\0{content}\n".encode())
+        return f"sha-{digest.hexdigest()}"
+
+    @staticmethod
+    def _url(key: str, variant: str, filename: str) -> str:
+        return f"archive://{key}/{variant}/{filename}"
+
+    def get_or_build(self, source_path: str, variant: str, filename: str,
+                     build: Callable[[BinaryIO], None]) -> str:
+        """
+        获取缓存的归档，不存在时调用build写入缓存；多个进程同时构建同一归档时只有一个会执行
+
+        Args:
+            source_path: 源文件或目录路径
+            variant: 归档设置（如编解码器和压缩级别），不同设置的归档分别缓存
+            filename: 归档文件名
+            build: 将归档内容写入给定流的函数
+
+        Returns:
+            str: 缓存中的归档路径，不能修改或删除
+        """
+        stat_url = self._url(self.stat_key(source_path), variant, filename)
+        with self.store.lock(stat_url):
+            path = self.store.get(stat_url)
+            if path:
+                return path
+
+            content_url = self._url(self.content_key(source_path), variant, filename)
+            path = self.store.get(content_url)
+            if path is None:
+                with self.store.writer(content_url) as writer:
+                    build(writer)
+                    path = writer.commit()
+            return self.store.link(stat_url, content_url) or path
+
+    def checkout(self, path: str) -> str:
+        """
+        将缓存中的归档链接到独立的临时目录，之后即使归档被淘汰也不影响使用，
+        使用完毕后可按临时文件删除
+
+        Args:
+            path: 缓存中的归档路径
+
+        Returns:
+            str: 临时目录中的归档路径
+        """
+        temp_dir = tempfile.mkdtemp(dir=self.staging_dir)
+        temp_path = os.path.join(temp_dir, os.path.basename(path))
+        try:
+            os.link(path, temp_path)
+        except OSError:
+            shutil.copy2(path, temp_path)
+        return temp_path
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取缓存统计信息
+
+        Returns:
+            Dict[str, int]: 同 DownloadCache.stats
+        """
+        return self.store.stats()
+
+    def clear(self, max_age: Optional[int] = None):
+        """
+        清理缓存
+
+        Args:
+            max_age: 最大缓存时间（秒），如果为None则清理所有缓存
+        """
+        self.store.clear(max_age)
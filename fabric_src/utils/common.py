@@ -1,41 +1,178 @@
+import gzip
 import logging
 import os
+import shlex
 import shutil
+import tarfile
 import tempfile
-from typing import Tuple
+import threading
+import time
+import zipfile
+from typing import TYPE_CHECKING, BinaryIO, Callable, Optional, Tuple
 from urllib.parse import urlparse, unquote
 
-import requests
-from fabric import Connection
+from fabric_src.utils.archive_codec import Codec, codec_for_path, get_codec
+from fabric_src.utils.cache_manager import ArchiveCache, DownloadCache, IntegrityError
+from fabric_src.utils.downloader import get_downloader
+from fabric_src.utils.tracing import get_tracer
 
-from fabric_src.utils.cache_manager import DownloadCache
+if TYPE_CHECKING:
+    from fabric import Connection
 
-# 全局缓存管理器实例
-_download_cache = DownloadCache()
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# 全局缓存管理器实例，第一次使用时创建
+_download_cache: Optional[DownloadCache] = None
+# 全局传输归档缓存实例，第一次使用时创建
+_archive_cache: Optional[ArchiveCache] = None
+_cache_lock = threading.Lock()
 
 logger = logging.getLogger(__name__)
 
+# 流式传输时每次读取的块大小
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# 单文件gzip解压后保存在内存中的上限，超过后写入临时文件
+GZIP_SPOOL_SIZE = 64 * 1024 * 1024
+
+# run_streaming 使用sudo时的密码提示符，只有出现该提示时才发送密码
+SUDO_PROMPT = '__FABRIC_SUDO_PROMPT__'
+
+# run_streaming 使用sudo时远程脚本开始执行后输出到标准错误的标记，之后才写入数据
+STREAM_READY_MARKER = '__FABRIC_STREAM_READY__'
+
+
+def configure_logging(level: int = logging.INFO):
+    """
+    配置命令行入口的日志输出，导入模块时不再修改日志配置
+
+    Args:
+        level: 日志级别
+    """
+    logging.basicConfig(level=level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def get_download_cache() -> DownloadCache:
+    """
+    获取全局下载缓存管理器，第一次调用时创建缓存目录
+
+    Returns:
+        DownloadCache: 下载缓存管理器
+    """
+    global _download_cache
+    with _cache_lock:
+        if _download_cache is None:
+            _download_cache = DownloadCache()
+        return _download_cache
+
+
+def set_download_cache(cache: DownloadCache):
+    """
+    替换全局下载缓存管理器，例如设置缓存大小上限
+
+    Args:
+        cache: 下载缓存管理器
+    """
+    global _download_cache
+    with _cache_lock:
+        _download_cache = cache
+
+
+def get_archive_cache() -> ArchiveCache:
+    """
+    获取全局传输归档缓存，第一次调用时创建缓存目录
+
+    Returns:
+        ArchiveCache: 传输归档缓存
+    """
+    global _archive_cache
+    with _cache_lock:
+        if _archive_cache is None:
+            _archive_cache = ArchiveCache()
+        return _archive_cache
+
+
+def set_archive_cache(cache: ArchiveCache):
+    """
+    替换全局传输归档缓存，例如使用其他缓存目录或设置大小上限
+
+    Args:
+        cache: 传输归档缓存
+    """
+    global _archive_cache
+    with _cache_lock:
+        _archive_cache = cache
+
+
+def _download_to_cache(url: str, sha256: Optional[str] = None) -> str:
+    """
+    下载文件到缓存，调用方需持有该URL的缓存锁
 
-def download_file(url: str, use_cache: bool = True) -> str:
+    Args:
+        url: 下载URL
+        sha256: 期望的文件sha256（可选）
+
+    Returns:
+        str: 缓存文件路径
+    """
+    download_cache = get_download_cache()
+    cached_path = download_cache.get(url, sha256=sha256)
+    if cached_path:
+        return cached_path
+
+    headers = {}
+    if not sha256:
+        # 指定了sha256时缓存中没有对应内容，条件请求没有意义
+        headers = download_cache.conditional_headers(url)
+
+    downloader = get_downloader()
+    partial_path = download_cache.partial_path(url)
+    result = downloader.fetch(url, partial_path, headers=headers)
+    if result.status_code == 304:
+        cached_path = download_cache.mark_revalidated(url)
+        if cached_path:
+            return cached_path
+        # 缓存条目在验证期间被删除，重新完整下载
+        result = downloader.fetch(url, partial_path)
+
+    # 原子移动到缓存，sha256已在下载过程中计算
+    return download_cache.commit_file(url, partial_path, digest=result.sha256, expected_sha256=sha256,
+                                       etag=result.etag, last_modified=result.last_modified)
+
+
+def download_file(url: str, use_cache: bool = True, sha256: Optional[str] = None) -> str:
     """
     下载文件到本地
+
+    使用缓存时数据边下载边写入缓存并计算sha256，完成后原子重命名，不会再复制一次。
+    缓存条目过期时，如果有ETag/Last-Modified则发送条件请求，服务端返回304时直接使用缓存。
+    多个进程同时下载同一URL时只有一个实际下载，其余等待后读取缓存
     
     Args:
         url: 下载URL
         use_cache: 是否使用缓存
+        sha256: 期望的文件sha256（可选），下载过程中校验，不需要额外读取文件
         
     Returns:
-        Tuple[bool, str]: (是否成功, 本地文件路径)
+        str: 本地文件路径
+
+    Raises:
+        IntegrityError: 下载内容的sha256与期望值不一致
     """
+    with get_tracer().span('http_download', url=url) as span:
+        if use_cache:
+            span.cache = 'hit' if get_download_cache().contains(url, sha256) else 'miss'
+        path = _download_file(url, use_cache, sha256)
+        span.bytes_in = os.path.getsize(path)
+        return path
+
+
+def _download_file(url: str, use_cache: bool, sha256: Optional[str]) -> str:
+    """下载文件到本地，参数见 download_file"""
     temp_dir = None
     try:
-        # 检查缓存
         if use_cache:
-            cached_path = _download_cache.get(url)
-            if cached_path:
-                return cached_path
+            # 同一URL同时只有一个调用方下载，其他调用方（包括其他进程）等待后直接读取缓存
+            with get_download_cache().lock(url):
+                return _download_to_cache(url, sha256)
 
         # 从URL中提取文件名
         filename = unquote(os.path.basename(urlparse(url).path))
@@ -46,105 +183,59 @@ def download_file(url: str, use_cache: bool = True) -> str:
         temp_dir = tempfile.mkdtemp()
         temp_path = os.path.join(temp_dir, filename)
 
-        # 下载文件
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-
-        with open(temp_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        # 添加到缓存
-        if use_cache:
-            cached_path = _download_cache.put(url, temp_path)
-            os.unlink(temp_path)
-            os.rmdir(temp_dir)
-            return cached_path
+        result = get_downloader().fetch(url, temp_path)
+        if sha256 and result.sha256 != sha256.lower():
+            raise IntegrityError(f"SHA-256 mismatch for {url}: expected {sha256}, got {result.sha256}")
 
         return temp_path
 
     except Exception as e:
         logger.exception(f"Error downloading file: {str(e)}", exc_info=e)
 
-        if 'temp_dir' in locals() and os.path.exists(temp_dir):
+        if temp_dir and os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
 
         raise e
 
 
-def _create_temp_tgz(source_path: str) -> str:
+def _create_temp_tgz(source_path: str, codec: Optional[Codec] = None, level: Optional[int] = None) -> str:
     """
     将源文件或目录打包为临时tgz文件
-    
+
+    所有输入类型均通过 _write_tar_stream 单次流式转换，内存占用与输入大小无关；
+    已经是目标压缩格式的tar归档以硬链接（跨文件系统时为符号链接）的方式直接使用，不复制内容
+
     Args:
         source_path: 源文件或目录路径
-        
+        codec: 压缩编解码器，默认gzip
+        level: 压缩级别，None使用编解码器的默认级别
+
     Returns:
-        Tuple[bool, str]: (是否成功, 临时tgz文件路径)
+        str: 临时归档文件路径，扩展名与编解码器对应
+
+    Raises:
+        ValueError: 源路径不存在
     """
+    if not os.path.exists(source_path):
+        raise ValueError(f"Source path does not exist: {source_path}")
+
     # 创建临时目录
     temp_dir = tempfile.mkdtemp()
     try:
         # 获取文件名 不包含扩展名
-        file_name = os.path.basename(source_path)
-
-        file_name_with_no_ext = os.path.splitext(file_name)[0]
-
-        tgz_path = os.path.join(temp_dir, f"{file_name_with_no_ext}.tar.gz")
-
-        # 如果是目录，直接打包
-        if os.path.isdir(source_path):
-            shutil.make_archive(
-                os.path.join(temp_dir, file_name_with_no_ext),  # 不包含.tgz的路径
-                'gztar',  # 格式为tar.gz
-                root_dir=source_path,  # 要打包的目录
-            )
-        # 如果是文件，根据类型处理
-        elif os.path.isfile(source_path):
-            if source_path.endswith(('.tar.gz', '.tgz')):
-                # 如果已经是tgz格式，直接复制
-                shutil.copy2(source_path, tgz_path)
-            elif source_path.endswith('.tar'):
-                # 如果是tar文件，添加gzip压缩
-                import tarfile
-                import gzip
-                with tarfile.open(source_path, 'r:') as tar:
-                    with gzip.open(tgz_path, 'wb') as gz:
-                        gz.write(tar.read())
-            elif source_path.endswith('.zip'):
-                # 如果是zip文件，先解压后重新打包为tgz
-                temp_extract = os.path.join(temp_dir, 'extracted')
-                shutil.unpack_archive(source_path, temp_extract, 'zip')
-                shutil.make_archive(
-                    os.path.splitext(tgz_path)[0],
-                    'gztar',
-                    root_dir=temp_extract
-                )
-            elif source_path.endswith('.gz'):
-                import tarfile
-                import gzip
-                # 创建tar文件并添加gzip文件内容
-                with tarfile.open(tgz_path, 'w:gz') as tar:
-                    # 创建tarinfo对象
-                    tarinfo = tarfile.TarInfo(name=file_name_with_no_ext)
-                    # 获取解压后的文件大小
-                    with gzip.open(source_path, 'rb') as gz_file:
-                        # 移动到文件末尾以获取大小
-                        gz_file.seek(0, 2)
-                        tarinfo.size = gz_file.tell()
-                        gz_file.seek(0)
-                        tar.addfile(tarinfo, gz_file)
-            else:
-                # 其他类型文件，直接打包
-                shutil.make_archive(
-                    os.path.splitext(tgz_path)[0],
-                    'gztar',
-                    root_dir=os.path.dirname(source_path),
-                    base_dir=os.path.basename(source_path)
-                )
+        file_name_with_no_ext = os.path.splitext(os.path.basename(source_path.rstrip('/')))[0]
+        codec = codec or get_codec('gzip')
+        tgz_path = os.path.join(temp_dir, f"{file_name_with_no_ext}{codec.extension}")
 
+        if os.path.isfile(source_path) and codec_for_path(source_path) is codec:
+            # 已经是目标格式，链接到临时目录，cleanup_archive 只会删除链接
+            try:
+                os.link(source_path, tgz_path)
+            except OSError:
+                os.symlink(os.path.abspath(source_path), tgz_path)
         else:
-            raise ValueError(f"Source path does not exist: {source_path}")
+            with open(tgz_path, 'wb') as f:
+                _write_tar_stream(source_path, f, codec, level)
         return tgz_path
     except Exception as e:
         logger.exception(f"Error creating tgz: {str(e)}", exc_info=e)
@@ -153,61 +244,449 @@ def _create_temp_tgz(source_path: str) -> str:
         raise e
 
 
-def extract_archive(conn: Connection,
-                    source_path: str,
-                    target_dir: str,
-                    use_sudo: bool = False):
+def prepare_archive(source_path: str, sha256: Optional[str] = None,
+                    codec: Optional[Codec] = None, level: Optional[int] = None,
+                    use_cache: bool = True) -> str:
     """
-    将本地文件或目录传输并解压到远程主机
-    
+    准备上传用的tgz文件：如果是HTTP URL先下载，再打包为临时tgz文件
+
+    打包结果保存在传输归档缓存中，相同的源和压缩设置再次准备时直接复用
+
+    Args:
+        source_path: 源文件或目录路径，或HTTP URL
+        sha256: HTTP源的期望sha256（可选）
+        codec: 压缩编解码器，默认gzip
+        level: 压缩级别，None使用编解码器的默认级别
+        use_cache: 是否使用传输归档缓存
+
+    Returns:
+        str: 临时tgz文件路径，使用完毕后需调用 cleanup_archive 清理
+    """
+    # 如果是HTTP URL，先下载到本地
+    if source_path.startswith(('http://', 'https://')):
+        source_path = download_file(source_path, True, sha256=sha256)
+
+    codec = codec or get_codec('gzip')
+    with get_tracer().span('archive_build', source=source_path, codec=codec.name) as span:
+        # 已经是目标格式的归档无需打包，不占用缓存空间
+        if not use_cache or not os.path.exists(source_path) or codec_for_path(source_path) is codec:
+            tgz_path = _create_temp_tgz(source_path, codec, level)
+        else:
+            level = codec.default_level if level is None else level
+            file_name_with_no_ext = os.path.splitext(os.path.basename(source_path.rstrip('/')))[0]
+            built = []
+
+            def build(f: BinaryIO):
+                built.append(True)
+                _write_tar_stream(source_path, f, codec, level)
+
+            archive_cache = get_archive_cache()
+            cached_path = archive_cache.get_or_build(
+                source_path, f"{codec.name}-{level}", f"{file_name_with_no_ext}{codec.extension}", build)
+            span.cache = 'miss' if built else 'hit'
+            tgz_path = archive_cache.checkout(cached_path)
+
+        if span.cache != 'hit':
+            span.bytes_in = _source_size(source_path)
+        span.bytes_out = os.path.getsize(tgz_path)
+        return tgz_path
+
+
+def _source_size(source_path: str) -> int:
+    """获取源文件或目录中所有文件的总大小"""
+    if not os.path.isdir(source_path):
+        return os.path.getsize(source_path)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(source_path) for name in files
+               if not os.path.islink(os.path.join(root, name)))
+
+
+def cleanup_archive(tgz_path: str):
+    """
+    清理 prepare_archive 生成的临时tgz文件及其临时目录
+
+    Args:
+        tgz_path: 临时tgz文件路径
+    """
+    if tgz_path and os.path.exists(tgz_path):
+        os.unlink(tgz_path)
+    if tgz_path and os.path.exists(os.path.dirname(tgz_path)):
+        shutil.rmtree(os.path.dirname(tgz_path))
+
+
+def upload_archive(conn: "Connection",
+                   tgz_path: str,
+                   target_dir: str,
+                   use_sudo: bool = False):
+    """
+    将已准备好的tgz文件上传并解压到远程主机，不会删除本地tgz文件
+
     Args:
         conn: Fabric连接对象
-        source_path: 源文件或目录路径（支持目录、.tar.gz、.tgz、.tar、.zip文件）
+        tgz_path: 本地归档文件路径，按扩展名选择远程解压方式
         target_dir: 目标解压目录
         use_sudo: 是否使用sudo权限
-    Returns:
-        bool: 操作是否成功
     """
-    try:
-        # 如果是HTTP URL，先下载到本地
-        if source_path.startswith(('http://', 'https://')):
-            source_path = download_file(source_path, True)
-        # 1. 创建临时tgz文件
-        temp_tgz = _create_temp_tgz(source_path)
-
-        # 2. 确保远程目标目录存在
+    tracer = get_tracer()
+    with tracer.span('archive_upload', host=conn.host, remote_calls=5 if use_sudo else 4):
+        # 1. 确保远程目标目录存在
         mkdir_cmd = f"mkdir -p {target_dir}"
         if use_sudo:
             conn.sudo(mkdir_cmd)
         else:
             conn.run(mkdir_cmd)
 
-        try:
-            # 3. 上传tgz文件到远程临时目录
-            remote_temp = f"/tmp/{os.path.basename(temp_tgz)}"
-            conn.put(temp_tgz, remote=remote_temp)
+        # 2. 上传tgz文件到远程临时目录
+        remote_temp = f"/tmp/{os.path.basename(tgz_path)}"
+        with tracer.span('sftp_put', bytes_out=os.path.getsize(tgz_path), remote_calls=1):
+            conn.put(tgz_path, remote=remote_temp)
 
-            # 4. 解压文件
-            extract_cmd = f"tar -xzf {remote_temp} -C {target_dir}  --overwrite"
+        # 3. 解压文件
+        extract_cmd = (codec_for_path(tgz_path) or get_codec('gzip')).tar_extract_cmd(remote_temp, target_dir)
+        with tracer.span('remote_extract', remote_calls=1):
             if use_sudo:
-                # 如果使用sudo，设置目录权限
                 conn.sudo(extract_cmd)
-                conn.sudo(f"chown -R root:root {target_dir}")
             else:
                 conn.run(extract_cmd)
+        if use_sudo:
+            # 如果使用sudo，设置目录权限
+            with tracer.span('remote_chown', remote_calls=1):
+                conn.sudo(f"chown -R root:root {target_dir}")
+
+        # 4. 清理远程临时文件
+        clean_cmd = f"rm -f {remote_temp}"
+        if use_sudo:
+            conn.sudo(clean_cmd)
+        else:
+            conn.run(clean_cmd)
+
+
+def run_shell(conn: "Connection", script: str, use_sudo: bool = False, **kwargs):
+    """
+    通过 sh -c 在远程主机执行一段shell脚本，使用sudo时整段脚本都以root权限执行
+
+    Args:
+        conn: Fabric连接对象
+        script: shell脚本
+        use_sudo: 是否使用sudo权限
+        **kwargs: 传递给 conn.run / conn.sudo 的参数
+
+    Returns:
+        命令执行结果
+    """
+    cmd = f"sh -c {shlex.quote(script)}"
+    if use_sudo:
+        return conn.sudo(cmd, **kwargs)
+    return conn.run(cmd, **kwargs)
+
+
+def _spool_gzip(gz_path: str) -> "tempfile.SpooledTemporaryFile":
+    """
+    将单文件gzip解压一次到假脱机文件，tar条目的大小取自解压后的位置，内容从假脱机文件读取
+
+    不使用gzip尾部的ISIZE字段：它只保存大小对2^32取模的值（解压后超过4GB时不正确），
+    且多成员gzip中只对应最后一个成员，大小错误会使 tar.addfile 截断或损坏条目。
+    解压后不超过 GZIP_SPOOL_SIZE 时只占用内存，否则写入临时文件
+
+    Args:
+        gz_path: gzip文件路径
+
+    Returns:
+        tempfile.SpooledTemporaryFile: 解压后的内容，位置在末尾，由调用方关闭
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=GZIP_SPOOL_SIZE)
+    try:
+        with gzip.open(gz_path, 'rb') as gz_file:
+            shutil.copyfileobj(gz_file, spool, STREAM_CHUNK_SIZE)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def _write_tar_stream(source_path: str, fileobj: BinaryIO,
+                      codec: Optional[Codec] = None, level: Optional[int] = None):
+    """
+    将源文件或目录以压缩tar流的形式写入fileobj，除较大的单文件gzip解压内容外不产生临时文件
+
+    Args:
+        source_path: 源文件或目录路径（支持目录、tar归档、.zip、.gz及普通文件）
+        fileobj: 只需支持write的目标流
+        codec: 压缩编解码器，默认gzip
+        level: 压缩级别，None使用编解码器的默认级别
+    """
+    codec = codec or get_codec('gzip')
+    file_name = os.path.basename(source_path)
+    file_name_with_no_ext = os.path.splitext(file_name)[0]
+    source_codec = codec_for_path(source_path)
+
+    if not os.path.exists(source_path):
+        raise ValueError(f"Source path does not exist: {source_path}")
+    if os.path.isfile(source_path) and source_codec is codec:
+        # 已经是目标格式的tar归档，原样传输
+        with open(source_path, 'rb') as src:
+            shutil.copyfileobj(src, fileobj, STREAM_CHUNK_SIZE)
+        return
+
+    with codec.open_writer(fileobj, level) as out:
+        if os.path.isdir(source_path):
+            with tarfile.open(fileobj=out, mode='w|') as tar:
+                tar.add(source_path, arcname='.')
+        elif source_codec is not None:
+            # 其他格式的tar归档，边解压边重新压缩
+            with source_codec.open_reader(source_path) as src:
+                shutil.copyfileobj(src, out, STREAM_CHUNK_SIZE)
+        elif source_path.endswith('.zip'):
+            # zip文件，逐个条目转写为tar条目，不解压到磁盘
+            with zipfile.ZipFile(source_path) as zf, tarfile.open(fileobj=out, mode='w|') as tar:
+                for info in zf.infolist():
+                    tarinfo = tarfile.TarInfo(name=info.filename.rstrip('/'))
+                    tarinfo.mtime = int(time.mktime(info.date_time + (0, 0, -1)))
+                    mode = (info.external_attr >> 16) & 0o7777
+                    if info.is_dir():
+                        tarinfo.type = tarfile.DIRTYPE
+                        tarinfo.mode = mode or 0o755
+                        tar.addfile(tarinfo)
+                    else:
+                        tarinfo.size = info.file_size
+                        tarinfo.mode = mode or 0o644
+                        with zf.open(info) as member:
+                            tar.addfile(tarinfo, member)
+        elif source_path.endswith('.gz'):
+            # 单文件gzip，只解压一次，作为tar中的单个文件
+            with tarfile.open(fileobj=out, mode='w|') as tar, _spool_gzip(source_path) as spool:
+                tarinfo = tarfile.TarInfo(name=file_name_with_no_ext)
+                tarinfo.size = spool.tell()
+                tarinfo.mtime = int(os.path.getmtime(source_path))
+                spool.seek(0)
+                tar.addfile(tarinfo, spool)
+        else:
+            # 其他类型文件，直接打包
+            with tarfile.open(fileobj=out, mode='w|') as tar:
+                tar.add(source_path, arcname=file_name)
 
-            # 5. 清理远程临时文件
-            clean_cmd = f"rm -f {remote_temp}"
-            if use_sudo:
-                conn.sudo(clean_cmd)
-            else:
-                conn.run(clean_cmd)
 
+def stream_archive(conn: "Connection",
+                   source_path: str,
+                   target_dir: str,
+                   use_sudo: bool = False,
+                   sha256: Optional[str] = None,
+                   codec: Optional[Codec] = None,
+                   level: Optional[int] = None):
+    """
+    以流式方式将本地文件或目录传输并解压到远程主机
+
+    tar流在本地边生成边通过SSH通道写入远程 tar -x 的标准输入，
+    本地和远程均不产生临时文件。使用sudo时需要免密sudo，或在连接配置中设置sudo密码
+
+    Args:
+        conn: Fabric连接对象
+        source_path: 源文件或目录路径，或HTTP URL
+        target_dir: 目标解压目录
+        use_sudo: 是否使用sudo权限
+        sha256: HTTP源的期望sha256（可选）
+        codec: 压缩编解码器，默认gzip
+        level: 压缩级别，None使用编解码器的默认级别
+
+    Raises:
+        RuntimeError: 远程解压失败
+    """
+    # 如果是HTTP URL，先下载到本地
+    if source_path.startswith(('http://', 'https://')):
+        source_path = download_file(source_path, True, sha256=sha256)
+
+    # 创建目录、解压、修改属主在同一个远程命令中完成
+    codec = codec or get_codec('gzip')
+    extract_cmd = f"mkdir -p {target_dir} && {codec.tar_extract_cmd('-', target_dir)}"
+    if use_sudo:
+        extract_cmd += f" && chown -R root:root {target_dir}"
+
+    exit_status, _, stderr = run_streaming(conn, extract_cmd,
+                                           lambda stdin: _write_tar_stream(source_path, stdin, codec, level),
+                                           use_sudo)
+    if exit_status != 0:
+        raise RuntimeError(f"Remote extract failed with exit code {exit_status}: {stderr.strip()}")
+
+
+def _wait_stream_ready(channel, sudo_password: Optional[str]) -> Tuple[bool, bytes]:
+    """
+    等待sudo启动远程脚本：出现密码提示时发送一次密码，读到就绪标记后返回
+
+    sudo已缓存凭据或免密时不会提示，密码不会被发送，也就不会混入脚本的标准输入
+
+    Args:
+        channel: SSH通道
+        sudo_password: sudo密码，None表示不发送密码
+
+    Returns:
+        Tuple[bool, bytes]: (脚本是否已开始执行, 去掉提示符和标记后已读取的标准错误)
+    """
+    prompt, marker = SUDO_PROMPT.encode(), f"{STREAM_READY_MARKER}\n".encode()
+    buffer = b''
+    prompted = False
+    while True:
+        if marker in buffer:
+            before, _, after = buffer.partition(marker)
+            return True, before + after
+        if prompt in buffer:
+            buffer = buffer.replace(prompt, b'')
+            # 没有密码，或密码错误再次提示时放弃
+            if prompted or not sudo_password:
+                return False, buffer
+            prompted = True
+            channel.sendall(f"{sudo_password}\n".encode())
+        data = channel.recv_stderr(4096)
+        if not data:
+            return False, buffer
+        buffer += data
+
+
+def run_streaming(conn: "Connection", script: str, write_stdin: Callable[[BinaryIO], None],
+                  use_sudo: bool = False) -> Tuple[int, str, str]:
+    """
+    在远程主机执行一段shell脚本，并将本地生成的数据流式写入其标准输入，只占用一次远程调用
+
+    使用sudo时需要免密sudo，或在连接配置中设置sudo密码；密码只在sudo提示时发送，
+    远程脚本开始执行后才写入数据。标准输出和标准错误在写入数据的同时并发读取，
+    远程输出较多时不会因通道窗口写满而阻塞
+
+    Args:
+        conn: Fabric连接对象
+        script: shell脚本
+        write_stdin: 将数据写入远程标准输入的函数
+        use_sudo: 是否使用sudo权限
+
+    Returns:
+        Tuple[int, str, str]: (退出码, 标准输出, 标准错误)
+    """
+    sudo_password = None
+    if use_sudo:
+        sudo_password = conn.config.sudo.password
+        sudo_flag = '-S' if sudo_password else '-n'
+        script = f"echo {STREAM_READY_MARKER} >&2\n{script}"
+        command = f"sudo {sudo_flag} -p {SUDO_PROMPT} sh -c {shlex.quote(script)}"
+    else:
+        command = f"sh -c {shlex.quote(script)}"
+
+    with get_tracer().span('ssh_stream', host=conn.host, remote_calls=1) as span:
+        conn.open()
+        channel = conn.client.get_transport().open_session()
+        try:
+            channel.exec_command(command)
+            ready, stderr_head = _wait_stream_ready(channel, sudo_password) if use_sudo else (True, b'')
+
+            outputs = {}
+
+            def drain(name: str, fileobj):
+                outputs[name] = fileobj.read()
+
+            readers = [threading.Thread(target=drain, args=('stdout', channel.makefile('rb')), daemon=True),
+                       threading.Thread(target=drain, args=('stderr', channel.makefile_stderr('rb')), daemon=True)]
+            for reader in readers:
+                reader.start()
+
+            stdin = _CountingWriter(channel.makefile_stdin('wb'))
+            try:
+                if ready:
+                    write_stdin(stdin)
+                    stdin.flush()
+            except OSError as e:
+                # 远程进程提前退出时写入会失败，错误信息以远程输出为准
+                logger.warning(f"Stream to remote interrupted: {str(e)}")
+            finally:
+                span.bytes_out = stdin.bytes_written
+            channel.shutdown_write()
+
+            for reader in readers:
+                reader.join()
+            exit_status = channel.recv_exit_status()
+            stdout = outputs.get('stdout', b'').decode(errors='replace')
+            stderr = (stderr_head + outputs.get('stderr', b'')).decode(errors='replace')
+            span.attributes['exit_status'] = exit_status
+            return exit_status, stdout, stderr
+        finally:
+            channel.close()
+
+
+class _CountingWriter:
+    """统计写入字节数的流包装"""
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self.bytes_written = 0
+
+    def write(self, data) -> int:
+        self.fileobj.write(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+
+class RoundTripCounter:
+    """
+    连接代理，统计通过连接发起的远程调用次数
+
+    每次 run、sudo、put、get 调用计一次；直接打开SSH通道执行命令前会调用 open，同样计一次
+    """
+
+    # 需要计数的连接方法
+    COUNTED_METHODS = ('run', 'sudo', 'put', 'get', 'open')
+
+    def __init__(self, conn: "Connection"):
+        """
+        初始化计数代理
+
+        Args:
+            conn: Fabric连接对象
+        """
+        self.conn = conn
+        self.count = 0
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.conn, name)
+        if name not in self.COUNTED_METHODS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self.count += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+def extract_archive(conn: "Connection",
+                    source_path: str,
+                    target_dir: str,
+                    use_sudo: bool = False,
+                    streaming: bool = False,
+                    sha256: Optional[str] = None):
+    """
+    将本地文件或目录传输并解压到远程主机
+    
+    Args:
+        conn: Fabric连接对象
+        source_path: 源文件或目录路径（支持目录、.tar.gz、.tgz、.tar、.zip文件）
+        target_dir: 目标解压目录
+        use_sudo: 是否使用sudo权限
+        streaming: 是否使用流式传输（不产生本地和远程临时文件）
+        sha256: HTTP源的期望sha256（可选）
+    Returns:
+        bool: 操作是否成功
+    """
+    try:
+        if streaming:
+            stream_archive(conn, source_path, target_dir, use_sudo, sha256=sha256)
+            return
+
+        # 1. 下载并创建临时tgz文件
+        temp_tgz = prepare_archive(source_path, sha256=sha256)
+
+        try:
+            # 2. 上传并解压
+            upload_archive(conn, temp_tgz, target_dir, use_sudo)
         finally:
-            if temp_tgz and os.path.exists(temp_tgz):
-                os.unlink(temp_tgz)
-            if os.path.exists(os.path.dirname(temp_tgz)):
-                shutil.rmtree(os.path.dirname(temp_tgz))
+            cleanup_archive(temp_tgz)
 
     except Exception as e:
         logger.exception(f"Error in extract_archive", exc_info=e)
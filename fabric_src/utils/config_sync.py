@@ -0,0 +1,291 @@
+import hashlib
+import json
+import logging
+import os
+import shlex
+import shutil
+import tarfile
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from .common import STREAM_CHUNK_SIZE, run_shell, stream_archive, upload_archive
+
+if TYPE_CHECKING:
+    from fabric import Connection
+
+logger = logging.getLogger(__name__)
+
+# 远程安装目录中记录上次同步结果的清单文件
+REMOTE_MANIFEST_NAME = '.fabric_sync_manifest.json'
+
+# 远程清单输出中分隔清单内容与文件状态的标记
+_STAT_MARKER = '__FABRIC_SYNC_STAT__'
+
+
+@dataclass
+class ManifestEntry:
+    """清单条目"""
+    size: int  # 文件大小
+    mtime: int  # 修改时间（秒）
+    sha256: str  # 内容哈希
+
+
+@dataclass
+class SyncResult:
+    """同步结果"""
+    uploaded: List[str] = field(default_factory=list)  # 新增或变更的文件
+    deleted: List[str] = field(default_factory=list)  # 删除的过期文件
+    unchanged: List[str] = field(default_factory=list)  # 未变化的文件
+    bytes_uploaded: int = 0  # 上传的文件字节数（未压缩）
+
+
+class HashCache:
+    """文件哈希缓存，按路径、大小和修改时间缓存sha256，避免重复读取未变化的文件"""
+
+    def __init__(self, cache_file: Optional[str] = None):
+        """
+        初始化文件哈希缓存
+
+        Args:
+            cache_file: 缓存文件路径，如果为None则使用默认路径
+        """
+        if cache_file is None:
+            cache_file = os.path.expanduser("~/.fabric_cache/file_hashes.json")
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._entries: Dict[str, list] = {}
+        self._dirty = False
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._entries = {}
+
+    def sha256(self, path: str) -> str:
+        """
+        获取文件的sha256，文件大小和修改时间未变化时直接返回缓存值
+
+        Args:
+            path: 文件路径
+
+        Returns:
+            str: sha256十六进制字符串
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._entries.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(STREAM_CHUNK_SIZE):
+                digest.update(chunk)
+        value = digest.hexdigest()
+
+        with self._lock:
+            self._entries[path] = [stat.st_size, stat.st_mtime_ns, value]
+            self._dirty = True
+        return value
+
+    def save(self):
+        """将缓存写回磁盘"""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            # 每次写入使用唯一的临时文件，多个线程或进程同时保存时互不干扰
+            fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(self.cache_file), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._entries, f)
+                os.replace(temp_file, self.cache_file)
+            except BaseException:
+                os.unlink(temp_file)
+                raise
+            self._dirty = False
+
+
+# 全局共享的文件哈希缓存
+_hash_cache: Optional[HashCache] = None
+_hash_cache_lock = threading.Lock()
+
+
+def get_hash_cache() -> HashCache:
+    """
+    获取全局共享的文件哈希缓存，避免每次计算清单或部署摘要时重新读取缓存文件
+
+    Returns:
+        HashCache: 文件哈希缓存
+    """
+    global _hash_cache
+    with _hash_cache_lock:
+        if _hash_cache is None:
+            _hash_cache = HashCache()
+        return _hash_cache
+
+
+def set_hash_cache(cache: HashCache):
+    """
+    替换全局共享的文件哈希缓存，例如使用其他缓存文件
+
+    Args:
+        cache: 文件哈希缓存
+    """
+    global _hash_cache
+    with _hash_cache_lock:
+        _hash_cache = cache
+
+
+def build_local_manifest(local_dir: str, hash_cache: Optional[HashCache] = None) -> Dict[str, ManifestEntry]:
+    """
+    生成本地目录的清单
+
+    Args:
+        local_dir: 本地目录
+        hash_cache: 文件哈希缓存，默认使用全局共享的缓存
+
+    Returns:
+        Dict[str, ManifestEntry]: 相对路径到清单条目的映射
+    """
+    hash_cache = hash_cache or get_hash_cache()
+    manifest = {}
+    for root, dirs, files in os.walk(local_dir):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            rel_path = os.path.relpath(path, local_dir).replace(os.sep, '/')
+            if rel_path == REMOTE_MANIFEST_NAME:
+                continue
+            stat = os.stat(path)
+            manifest[rel_path] = ManifestEntry(
+                size=stat.st_size,
+                mtime=int(stat.st_mtime),
+                sha256=hash_cache.sha256(path),
+            )
+    return manifest
+
+
+def fetch_remote_manifest(conn: "Connection", remote_dir: str,
+                          use_sudo: bool = False) -> Dict[str, ManifestEntry]:
+    """
+    通过一次远程命令获取远程目录的清单
+
+    远程清单以上次同步写入的清单文件为准，再用远程文件当前的大小和修改时间校验，
+    在同步后被修改或删除的文件不会出现在返回结果中
+
+    Args:
+        conn: Fabric连接对象
+        remote_dir: 远程目录
+        use_sudo: 是否使用sudo权限
+
+    Returns:
+        Dict[str, ManifestEntry]: 相对路径到清单条目的映射
+    """
+    script = (f"cd {remote_dir} 2>/dev/null || exit 0; "
+              f"cat {REMOTE_MANIFEST_NAME} 2>/dev/null; echo; echo {_STAT_MARKER}; "
+              f"find . -type f -printf '%s\\t%T@\\t%P\\n'")
+    result = run_shell(conn, script, use_sudo, hide=True, warn=True)
+    output = result.stdout
+    if _STAT_MARKER not in output:
+        return {}
+
+    manifest_text, stat_text = output.split(_STAT_MARKER, 1)
+    try:
+        recorded = json.loads(manifest_text.strip() or '{}')
+    except json.JSONDecodeError:
+        logger.warning(f"Invalid remote manifest in {remote_dir}, ignored")
+        recorded = {}
+
+    current = {}
+    for line in stat_text.splitlines():
+        parts = line.split('\t', 2)
+        if len(parts) == 3:
+            current[parts[2]] = (int(parts[0]), int(float(parts[1])))
+
+    manifest = {}
+    for rel_path, entry in recorded.items():
+        entry = ManifestEntry(**entry)
+        if current.get(rel_path) == (entry.size, entry.mtime):
+            manifest[rel_path] = entry
+    return manifest
+
+
+def sync_config_dir(conn: "Connection",
+                    local_dir: str,
+                    remote_dir: str,
+                    use_sudo: bool = False,
+                    delete: bool = False,
+                    streaming: bool = False,
+                    hash_cache: Optional[HashCache] = None) -> SyncResult:
+    """
+    增量同步本地配置目录到远程目录，只传输新增或变更的文件
+
+    Args:
+        conn: Fabric连接对象
+        local_dir: 本地目录
+        remote_dir: 远程目录
+        use_sudo: 是否使用sudo权限
+        delete: 是否删除上次同步过、但本地已不存在的文件
+        streaming: 是否流式传输
+        hash_cache: 文件哈希缓存，默认使用全局共享的缓存
+
+    Returns:
+        SyncResult: 同步结果
+    """
+    hash_cache = hash_cache or get_hash_cache()
+    local_manifest = build_local_manifest(local_dir, hash_cache)
+    hash_cache.save()
+    remote_manifest = fetch_remote_manifest(conn, remote_dir, use_sudo)
+
+    result = SyncResult()
+    for rel_path, entry in local_manifest.items():
+        remote_entry = remote_manifest.get(rel_path)
+        if remote_entry and remote_entry.sha256 == entry.sha256:
+            result.unchanged.append(rel_path)
+        else:
+            result.uploaded.append(rel_path)
+            result.bytes_uploaded += entry.size
+    stale = sorted(set(remote_manifest) - set(local_manifest))
+    if delete:
+        result.deleted = stale
+
+    if not result.uploaded and not result.deleted:
+        return result
+
+    # 未变化的文件沿用远程记录，保证记录的修改时间与远程文件一致
+    new_manifest = dict(local_manifest)
+    new_manifest.update({path: remote_manifest[path] for path in result.unchanged})
+    # 不删除时保留过期文件的记录，以便之后仍可删除
+    if not delete:
+        new_manifest.update({path: remote_manifest[path] for path in stale})
+
+    # 打包变更文件及新的清单文件
+    temp_dir = tempfile.mkdtemp()
+    try:
+        tgz_path = os.path.join(temp_dir, 'config_sync.tar.gz')
+        manifest_path = os.path.join(temp_dir, REMOTE_MANIFEST_NAME)
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({path: entry.__dict__ for path, entry in new_manifest.items()}, f)
+        with tarfile.open(tgz_path, 'w:gz') as tar:
+            for rel_path in result.uploaded:
+                tar.add(os.path.join(local_dir, rel_path), arcname=rel_path)
+            tar.add(manifest_path, arcname=REMOTE_MANIFEST_NAME)
+
+        if streaming:
+            stream_archive(conn, tgz_path, remote_dir, use_sudo)
+        else:
+            upload_archive(conn, tgz_path, remote_dir, use_sudo)
+    finally:
+        shutil.rmtree(temp_dir)
+
+    if result.deleted:
+        paths = ' '.join(shlex.quote(path) for path in result.deleted)
+        run_shell(conn, f"cd {remote_dir} && rm -f -- {paths}", use_sudo)
+
+    logger.info(f"Synced {local_dir} to {remote_dir}: {len(result.uploaded)} uploaded, "
+                f"{len(result.deleted)} deleted, {len(result.unchanged)} unchanged")
+    return result
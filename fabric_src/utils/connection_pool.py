@@ -0,0 +1,225 @@
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional
+
+from .lazy_import import lazy_import
+
+if TYPE_CHECKING:
+    from fabric import Connection
+
+fabric = lazy_import('fabric')
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(TimeoutError):
+    """等待可用连接超时"""
+
+
+class ConnectionPool:
+    """
+    SSH连接池
+
+    按主机复用已建立的连接，同一连接上的 run/sudo/put/get 共用一个SSH传输层，
+    put/get 共用 Connection 缓存的同一个SFTP客户端。获取连接时检查传输层是否已断开，
+    断开则重新连接；限制每台主机和全部主机的连接数，超过时等待其他连接释放
+    """
+
+    def __init__(self,
+                 max_per_host: int = 2,
+                 max_total: int = 32,
+                 keepalive: int = 30,
+                 connection_factory: Optional[Callable[[str], "Connection"]] = None):
+        """
+        初始化连接池
+
+        Args:
+            max_per_host: 每台主机的最大连接数
+            max_total: 全部主机的最大连接数
+            keepalive: SSH keepalive间隔（秒），0表示不发送
+            connection_factory: 由主机地址创建连接的函数，默认使用 Connection(host)
+        """
+        if max_per_host < 1 or max_total < 1:
+            raise ValueError(f"Connection limits must be positive: {max_per_host}, {max_total}")
+        self.max_per_host = max_per_host
+        self.max_total = max_total
+        self.keepalive = keepalive
+        self.connection_factory = connection_factory or fabric.Connection
+        self._idle: Dict[str, List["Connection"]] = {}
+        self._open: Dict[str, int] = {}
+        self._owners: Dict[int, str] = {}
+        self._cond = threading.Condition()
+        self._stats = {'checkouts': 0, 'handshakes': 0, 'reconnects': 0, 'evictions': 0}
+
+    def _total(self) -> int:
+        return sum(self._open.values())
+
+    def _evict_idle(self) -> bool:
+        """关闭一个其他主机的空闲连接，为新连接腾出名额"""
+        for host, idle in self._idle.items():
+            if idle:
+                conn = idle.pop(0)
+                self._open[host] -= 1
+                self._owners.pop(id(conn), None)
+                self._stats['evictions'] += 1
+                conn.close()
+                return True
+        return False
+
+    def _connect(self, conn: "Connection", reconnect: bool = False):
+        """建立SSH连接并启用keepalive"""
+        if reconnect:
+            # 传输层断开后缓存的SFTP客户端已不可用
+            conn.close()
+            logger.info(f"Reconnecting to {conn.host}")
+        conn.open()
+        with self._cond:
+            self._stats['handshakes'] += 1
+            self._stats['reconnects'] += int(reconnect)
+        if self.keepalive and conn.transport is not None:
+            conn.transport.set_keepalive(self.keepalive)
+
+    def acquire(self, host: str, timeout: Optional[float] = None) -> "Connection":
+        """
+        获取主机的连接，使用完后需要调用 release 归还
+
+        Args:
+            host: 主机地址（如 root@1.2.3.4:22）
+            timeout: 等待可用连接的超时时间（秒），None表示一直等待
+
+        Returns:
+            Connection: 已连接的Fabric连接对象
+
+        Raises:
+            PoolTimeout: 等待可用连接超时
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                idle = self._idle.get(host)
+                if idle:
+                    conn = idle.pop()
+                    break
+                if self._open.get(host, 0) < self.max_per_host and (
+                        self._total() < self.max_total or self._evict_idle()):
+                    conn = self.connection_factory(host)
+                    self._open[host] = self._open.get(host, 0) + 1
+                    self._owners[id(conn)] = host
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeout(f"Timed out waiting for a connection to {host}")
+                self._cond.wait(remaining)
+            self._stats['checkouts'] += 1
+
+        try:
+            if not conn.is_connected:
+                self._connect(conn, reconnect=conn.transport is not None)
+        except Exception:
+            self._discard(conn)
+            raise
+        return conn
+
+    def release(self, conn: "Connection"):
+        """
+        归还连接，连接保持打开供后续复用
+
+        Args:
+            conn: acquire 获取的连接
+        """
+        with self._cond:
+            host = self._owners.get(id(conn))
+            if host is None:
+                return
+            self._idle.setdefault(host, []).append(conn)
+            self._cond.notify_all()
+
+    def _discard(self, conn: "Connection"):
+        """关闭连接并释放名额"""
+        with self._cond:
+            host = self._owners.pop(id(conn), None)
+            if host is not None:
+                self._open[host] -= 1
+            self._cond.notify_all()
+        conn.close()
+
+    @contextmanager
+    def connection(self, host: str, timeout: Optional[float] = None) -> Iterator["Connection"]:
+        """
+        获取主机的连接，退出时自动归还
+
+        Args:
+            host: 主机地址
+            timeout: 等待可用连接的超时时间（秒）
+
+        Yields:
+            Connection: 已连接的Fabric连接对象
+        """
+        conn = self.acquire(host, timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """关闭所有空闲连接，正在使用的连接归还后仍可复用"""
+        with self._cond:
+            idle = [conn for conns in self._idle.values() for conn in conns]
+            for host, conns in self._idle.items():
+                self._open[host] -= len(conns)
+                for conn in conns:
+                    self._owners.pop(id(conn), None)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取连接池统计信息
+
+        Returns:
+            Dict[str, int]: 包含 open、idle、checkouts、handshakes、reconnects、evictions、handshakes_saved
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats['open'] = self._total()
+            stats['idle'] = sum(len(conns) for conns in self._idle.values())
+        # 每次获取连接如果不复用都需要一次握手
+        stats['handshakes_saved'] = stats['checkouts'] - stats['handshakes']
+        return stats
+
+
+# 全局共享的连接池
+_connection_pool: Optional[ConnectionPool] = None
+_connection_pool_lock = threading.Lock()
+
+
+def get_connection_pool() -> ConnectionPool:
+    """
+    获取全局共享的连接池，进程退出时关闭所有连接
+
+    Returns:
+        ConnectionPool: 连接池
+    """
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = ConnectionPool()
+            atexit.register(_connection_pool.close_all)
+        return _connection_pool
+
+
+def set_connection_pool(pool: ConnectionPool):
+    """
+    替换全局共享的连接池，例如调整连接数限制
+
+    Args:
+        pool: 连接池
+    """
+    global _connection_pool
+    with _connection_pool_lock:
+        _connection_pool = pool
@@ -0,0 +1,149 @@
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+# 计划中的操作类型，按执行顺序排列
+ACTIONS = ('download', 'mkdir', 'archive', 'upload', 'sync', 'install', 'chmod', 'unit', 'enable', 'start', 'restart',
+           'stamp')
+
+# 向远程主机传输数据的操作
+TRANSFER_ACTIONS = ('upload', 'sync', 'unit')
+
+
+@dataclass
+class PlanAction:
+    """部署计划中的一个操作"""
+    action: str  # 操作类型，见 ACTIONS
+    target: str  # 操作对象（如 source、config、包名列表、服务名）
+    bytes: Optional[int] = None  # 处理或传输的字节数，None表示未知
+    remote_calls: int = 0  # 逐步执行时的远程调用次数，批量模式下均合并到一次调用中
+    estimated: bool = False  # bytes 是否为估算值（如压缩后大小）
+    details: Dict[str, Any] = field(default_factory=dict)  # 执行所需的参数（如编解码器、源路径）
+
+
+@dataclass
+class DeployPlan:
+    """
+    部署计划：根据部署配置、下载缓存和远程部署摘要计算出的有序操作列表
+
+    实际部署只执行计划中的操作，计划和执行使用同一份数据
+    """
+    service: str  # 服务名称
+    host: str  # 主机标识
+    install_path: str  # 安装目录
+    batch: bool  # 是否批量模式执行
+    changed: List[str]  # 与远程部署摘要相比有变化的部分
+    stamp: Dict[str, str]  # 部署成功后写入的部署摘要
+    actions: List[PlanAction] = field(default_factory=list)  # 有序操作列表
+    remote_calls: int = 0  # 执行计划预计的远程调用次数（不含计划本身）
+
+    def add(self, action: str, target: str, **kwargs) -> PlanAction:
+        """
+        添加操作
+
+        Args:
+            action: 操作类型
+            target: 操作对象
+            **kwargs: PlanAction 的其他字段
+
+        Returns:
+            PlanAction: 添加的操作
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown plan action: {action}")
+        plan_action = PlanAction(action, target, **kwargs)
+        self.actions.append(plan_action)
+        return plan_action
+
+    def find(self, action: str, target: Optional[str] = None) -> Optional[PlanAction]:
+        """
+        查找操作
+
+        Args:
+            action: 操作类型
+            target: 操作对象，None表示不限
+
+        Returns:
+            Optional[PlanAction]: 第一个匹配的操作，不存在时返回None
+        """
+        for plan_action in self.actions:
+            if plan_action.action == action and (target is None or plan_action.target == target):
+                return plan_action
+        return None
+
+    @property
+    def up_to_date(self) -> bool:
+        """是否无需部署"""
+        return not self.actions
+
+    def _sum_bytes(self, actions) -> Optional[int]:
+        sizes = [a.bytes for a in self.actions if a.action in actions]
+        return None if None in sizes else sum(sizes)
+
+    @property
+    def upload_bytes(self) -> Optional[int]:
+        """预计上传到远程主机的字节数，存在未知大小的操作时为None"""
+        return self._sum_bytes(TRANSFER_ACTIONS)
+
+    @property
+    def download_bytes(self) -> Optional[int]:
+        """预计下载到本地的字节数，存在未知大小的操作时为None"""
+        return self._sum_bytes(('download',))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转换为可序列化为JSON的字典，附带汇总信息
+
+        Returns:
+            Dict[str, Any]: 计划字典
+        """
+        data = asdict(self)
+        data['summary'] = {
+            'up_to_date': self.up_to_date,
+            'actions': len(self.actions),
+            'download_bytes': self.download_bytes,
+            'upload_bytes': self.upload_bytes,
+            'remote_calls': self.remote_calls,
+        }
+        return data
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        """序列化为JSON"""
+        return json.dumps(self.to_dict(), indent=indent, ensure_ascii=False)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DeployPlan":
+        """
+        从字典（如保存的JSON计划）恢复部署计划，以便审核后按原计划执行
+
+        Args:
+            data: to_dict 生成的字典
+
+        Returns:
+            DeployPlan: 部署计划
+        """
+        data = {key: value for key, value in data.items() if key != 'summary'}
+        data['actions'] = [PlanAction(**action) for action in data.get('actions', [])]
+        return cls(**data)
+
+
+def summarize_plans(plans: List[DeployPlan]) -> Dict[str, Any]:
+    """
+    汇总多台主机的部署计划，用于全量发布前评估
+
+    Args:
+        plans: 部署计划列表
+
+    Returns:
+        Dict[str, Any]: 汇总信息及各主机的计划
+    """
+    upload = [plan.upload_bytes for plan in plans]
+    download = [plan.download_bytes for plan in plans]
+    return {
+        'hosts': len(plans),
+        'up_to_date': sum(1 for plan in plans if plan.up_to_date),
+        'upload_bytes': None if None in upload else sum(upload),
+        'download_bytes': None if None in download else sum(download),
+        'remote_calls': sum(plan.remote_calls for plan in plans),
+        'plans': [plan.to_dict() for plan in plans],
+    }
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from .lazy_import import lazy_import
+
+jsonschema = lazy_import('jsonschema')
+
+# 部署配置（definitions.json）的 JSON Schema
+DEPLOY_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  'service', 'deploy_schema.json')
+
+_schema: Optional[Dict[str, Any]] = None
+_validator: Any = None
+_schema_lock = threading.Lock()
+
+
+def load_deploy_schema() -> Dict[str, Any]:
+    """
+    读取部署配置的 JSON Schema，进程内只读取一次
+
+    Returns:
+        Dict[str, Any]: JSON Schema
+    """
+    global _schema
+    with _schema_lock:
+        if _schema is None:
+            with open(DEPLOY_SCHEMA_PATH, 'r', encoding='utf-8') as f:
+                _schema = json.load(f)
+        return _schema
+
+
+class LazyDeploySchema:
+    """
+    类属性描述符，首次访问时才读取部署配置的 JSON Schema，导入模块时不读取文件
+
+    Example:
+        class DeployConfig:
+            SCHEMA = LazyDeploySchema()
+    """
+
+    def __get__(self, instance, owner) -> Dict[str, Any]:
+        return load_deploy_schema()
+
+
+def schema_fingerprint() -> str:
+    """
+    获取 JSON Schema 的指纹，Schema 变化后按旧 Schema 校验的结果不再可用
+
+    Returns:
+        str: sha256十六进制字符串
+    """
+    return hashlib.sha256(json.dumps(load_deploy_schema(), sort_keys=True).encode()).hexdigest()
+
+
+def get_deploy_validator():
+    """
+    获取预编译的部署配置校验器
+
+    jsonschema.validate 每次调用都会检查 Schema 并重新创建校验器，这里按 Schema 声明的版本
+    选择校验器类，检查一次 Schema 后复用同一个校验器
+
+    Returns:
+        jsonschema.protocols.Validator: 校验器
+
+    Raises:
+        jsonschema.exceptions.SchemaError: Schema 本身不合法
+    """
+    global _validator
+    schema = load_deploy_schema()
+    with _schema_lock:
+        if _validator is None:
+            validator_class = jsonschema.validators.validator_for(schema)
+            validator_class.check_schema(schema)
+            _validator = validator_class(schema)
+        return _validator
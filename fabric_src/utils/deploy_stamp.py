@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import shlex
+from dataclasses import asdict, dataclass, fields
+from typing import TYPE_CHECKING, Optional, Set
+
+from .common import download_file, run_shell
+from .config_sync import HashCache, build_local_manifest, get_hash_cache
+
+if TYPE_CHECKING:
+    from fabric import Connection
+
+    from .service_manager import DeployConfig
+
+# 安装目录中记录部署摘要的文件
+STAMP_NAME = '.fabric_deploy_stamp.json'
+
+
+def _sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def path_digest(path: str, hash_cache: Optional[HashCache] = None) -> str:
+    """
+    计算本地文件或目录的内容摘要，目录按清单（相对路径、大小、哈希）计算
+
+    Args:
+        path: 本地文件或目录路径
+        hash_cache: 文件哈希缓存，默认使用全局共享的缓存
+
+    Returns:
+        str: sha256十六进制字符串
+    """
+    hash_cache = hash_cache or get_hash_cache()
+    if os.path.isdir(path):
+        manifest = build_local_manifest(path, hash_cache)
+        return _sha256_text(''.join(f"{rel_path}\0{entry.size}\0{entry.sha256}\n"
+                                    for rel_path, entry in sorted(manifest.items())))
+    return hash_cache.sha256(path)
+
+
+@dataclass
+class DeployStamp:
+    """部署摘要，记录上次成功部署时各部分的摘要"""
+    source: str  # 源路径摘要
+    archive: str  # 源内容摘要
+    config: str  # 合并配置目录摘要
+    dependencies: str  # 依赖列表摘要
+    unit: str  # 服务单元文件摘要
+
+    @classmethod
+    def compute(cls, config: "DeployConfig", hash_cache: Optional[HashCache] = None) -> "DeployStamp":
+        """
+        根据部署配置计算部署摘要，未指定sha256的HTTP源会先下载到缓存
+
+        Args:
+            config: 部署配置
+            hash_cache: 文件哈希缓存，默认使用全局共享的缓存
+
+        Returns:
+            DeployStamp: 部署摘要
+        """
+        hash_cache = hash_cache or get_hash_cache()
+
+        source_path = config.source_path
+        # 指定了sha256时直接使用，无需下载源文件计算摘要
+        if config.sha256:
+            archive_digest = config.sha256.lower()
+        else:
+            if source_path.startswith(('http://', 'https://')):
+                source_path = download_file(source_path, True)
+            elif source_path.startswith('file://'):
+                source_path = source_path[7:]
+            archive_digest = path_digest(source_path, hash_cache)
+
+        config_digest = ''
+        if config.merge_config_dir and os.path.exists(config.merge_config_dir):
+            config_digest = path_digest(config.merge_config_dir, hash_cache)
+
+        stamp = cls(
+            source=_sha256_text(f"{config.source_path}\0{config.binary or ''}"),
+            archive=archive_digest,
+            config=config_digest,
+            dependencies=_sha256_text('\n'.join(sorted(config.dependencies or []))),
+            unit=_sha256_text(config.to_service_definition().generate_systemd_unit()),
+        )
+        # 只有新计算了哈希时才写回缓存文件
+        hash_cache.save()
+        return stamp
+
+    def changed_parts(self, other: Optional["DeployStamp"]) -> Set[str]:
+        """
+        与另一个部署摘要比较，返回有变化的部分
+
+        Args:
+            other: 远程记录的部署摘要，None表示从未部署
+
+        Returns:
+            Set[str]: 有变化的字段名
+        """
+        if other is None:
+            return {f.name for f in fields(self)}
+        return {f.name for f in fields(self) if getattr(self, f.name) != getattr(other, f.name)}
+
+
+def read_remote_stamp(conn: "Connection", install_path: str, use_sudo: bool = False) -> Optional[DeployStamp]:
+    """
+    读取远程安装目录中的部署摘要
+
+    Args:
+        conn: Fabric连接对象
+        install_path: 远程安装目录
+        use_sudo: 是否使用sudo权限
+
+    Returns:
+        Optional[DeployStamp]: 部署摘要，不存在或无法解析时返回None
+    """
+    stamp_path = os.path.join(install_path, STAMP_NAME)
+    result = run_shell(conn, f"cat {stamp_path} 2>/dev/null || true", use_sudo, hide=True, warn=True)
+    try:
+        return DeployStamp(**json.loads(result.stdout))
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def write_remote_stamp(conn: "Connection", install_path: str, stamp: DeployStamp, use_sudo: bool = False):
+    """
+    将部署摘要写入远程安装目录
+
+    Args:
+        conn: Fabric连接对象
+        install_path: 远程安装目录
+        stamp: 部署摘要
+        use_sudo: 是否使用sudo权限
+    """
+    run_shell(conn, stamp_write_cmd(install_path, stamp), use_sudo, hide=True)
+
+
+def stamp_write_cmd(install_path: str, stamp: DeployStamp) -> str:
+    """
+    生成将部署摘要写入远程安装目录的shell命令
+
+    Args:
+        install_path: 远程安装目录
+        stamp: 部署摘要
+
+    Returns:
+        str: shell命令
+    """
+    stamp_path = os.path.join(install_path, STAMP_NAME)
+    content = json.dumps(asdict(stamp))
+    return f"printf '%s' {shlex.quote(content)} > {stamp_path}"
@@ -0,0 +1,347 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from .lazy_import import lazy_import
+
+requests = lazy_import('requests')
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DownloadResult:
+    """下载结果"""
+    status_code: int  # HTTP状态码（200或304）
+    size: int = 0  # 文件大小
+    etag: Optional[str] = None  # 响应的ETag
+    last_modified: Optional[str] = None  # 响应的Last-Modified
+    sha256: Optional[str] = None  # 下载内容的sha256（304时为None）
+    segments: int = 1  # 实际使用的分段数
+    resumed_bytes: int = 0  # 从上次中断处续传时跳过的字节数
+
+
+class Downloader:
+    """
+    HTTP下载器
+
+    复用连接池，失败自动重试；服务端支持Range时大文件按多个字节区间并行下载，
+    下载中断后从 .partial 文件续传
+    """
+
+    def __init__(self,
+                 segments: int = 4,
+                 chunk_size: int = 1024 * 1024,
+                 min_segment_size: int = 8 * 1024 * 1024,
+                 retries: int = 3,
+                 timeout: float = 30,
+                 pool_size: int = 16):
+        """
+        初始化下载器
+
+        Args:
+            segments: 并行下载的最大分段数，1表示不分段
+            chunk_size: 每次读取和写入的块大小（字节）
+            min_segment_size: 每个分段的最小大小（字节），小于两个分段大小的文件顺序下载
+            retries: 连接失败或下载中断时的重试次数
+            timeout: 连接和读取超时（秒）
+            pool_size: 连接池大小
+        """
+        if segments < 1:
+            raise ValueError(f"segments must be positive: {segments}")
+        self.segments = segments
+        self.chunk_size = chunk_size
+        self.min_segment_size = min_segment_size
+        self.retries = retries
+        self.timeout = timeout
+
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5,
+                      status_forcelist=(500, 502, 503, 504), allowed_methods=('GET', 'HEAD'))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @staticmethod
+    def _state_path(partial_path: str) -> str:
+        return f"{partial_path}.json"
+
+    def _load_state(self, partial_path: str) -> dict:
+        """读取续传状态，.partial 文件不存在时视为无状态"""
+        if not os.path.exists(partial_path):
+            return {}
+        try:
+            with open(self._state_path(partial_path), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self, partial_path: str, state: dict):
+        temp_path = f"{self._state_path(partial_path)}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self._state_path(partial_path))
+
+    def discard(self, partial_path: str):
+        """
+        删除 .partial 文件及其续传状态
+
+        Args:
+            partial_path: .partial 文件路径
+        """
+        for path in (partial_path, self._state_path(partial_path)):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    @staticmethod
+    def _validator_matches(state: dict, etag: Optional[str], last_modified: Optional[str], size: int) -> bool:
+        """续传前确认远程文件没有变化"""
+        if not state or state.get('size') != size:
+            return False
+        if etag:
+            return state.get('etag') == etag
+        return bool(last_modified) and state.get('last_modified') == last_modified
+
+    @staticmethod
+    def _content_range_size(response: "requests.Response") -> int:
+        """从 Content-Range（如 bytes 0-0/1234）中解析文件总大小，未知时返回-1"""
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        return int(total) if total.isdigit() else -1
+
+    def fetch(self, url: str, partial_path: str, headers: Optional[Dict[str, str]] = None) -> DownloadResult:
+        """
+        下载URL到 partial_path，成功后由调用方重命名或移动该文件
+
+        先发送只请求第一个字节的Range请求获取大小和验证器：服务端忽略Range时该响应就是完整内容，
+        直接顺序下载；支持Range时再决定续传、分段或顺序下载，不会为了读取响应头打开完整的下载
+
+        Args:
+            url: 下载URL
+            partial_path: 下载目标文件，已存在且有续传状态时从中断处继续
+            headers: 额外请求头（如条件请求头）
+
+        Returns:
+            DownloadResult: 下载结果，status_code为304时不会写入文件
+        """
+        response = self.session.get(url, stream=True, headers={**(headers or {}), 'Range': 'bytes=0-0'},
+                                    timeout=self.timeout)
+        if response.status_code == 304:
+            response.close()
+            return DownloadResult(status_code=304)
+        if response.status_code == 416:
+            # 空文件无法满足第一个字节的区间，按不支持Range处理
+            response.close()
+            response = self.session.get(url, stream=True, headers=headers or {}, timeout=self.timeout)
+            if response.status_code == 304:
+                response.close()
+                return DownloadResult(status_code=304)
+        response.raise_for_status()
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+        accept_ranges = response.status_code == 206 and not encoded
+        if response.status_code == 206:
+            size = self._content_range_size(response)
+            response.close()
+            response = None
+        else:
+            size = int(response.headers.get('Content-Length') or -1)
+
+        state = self._load_state(partial_path)
+        resumable = accept_ranges and size > 0 and self._validator_matches(state, etag, last_modified, size)
+        segmented = accept_ranges and size >= 2 * self.min_segment_size and self.segments > 1
+
+        if resumable and state.get('mode') == 'sequential' and 0 < os.path.getsize(partial_path) <= size:
+            return self._fetch_resumed(url, partial_path, state)
+        if not resumable or state.get('mode') != ('segmented' if segmented else 'sequential'):
+            self.discard(partial_path)
+            state = {'url': url, 'size': size, 'etag': etag, 'last_modified': last_modified, 'done': []}
+
+        if segmented:
+            state['mode'] = 'segmented'
+            return self._fetch_segmented(url, partial_path, state)
+        state['mode'] = 'sequential'
+        if response is None:
+            # 探测请求只返回了第一个字节，重新请求完整内容
+            response = self.session.get(url, stream=True, headers=headers or {}, timeout=self.timeout)
+            if response.status_code == 304:
+                response.close()
+                return DownloadResult(status_code=304)
+            response.raise_for_status()
+        return self._fetch_sequential(response, partial_path, state)
+
+    def _fetch_sequential(self, response: "requests.Response", partial_path: str, state: dict) -> DownloadResult:
+        """顺序下载，边下载边计算sha256；中断后按 .partial 文件已有长度续传"""
+        digest = hashlib.sha256()
+        written = 0
+        if state['size'] > 0:
+            self._save_state(partial_path, state)
+        with response, open(partial_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                f.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        self._remove_state(partial_path)
+        return DownloadResult(status_code=200, size=written, etag=state['etag'],
+                              last_modified=state['last_modified'], sha256=digest.hexdigest())
+
+    def _fetch_resumed(self, url: str, partial_path: str, state: dict) -> DownloadResult:
+        """从上次顺序下载中断的位置续传"""
+        offset = os.path.getsize(partial_path)
+        logger.info(f"Resuming {url} from byte {offset}")
+        digest = hashlib.sha256()
+        with open(partial_path, 'rb') as f:
+            while chunk := f.read(self.chunk_size):
+                digest.update(chunk)
+        self._download_range(url, partial_path, offset, state['size'], digest, if_range=True, state=state)
+        with open(partial_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        self._remove_state(partial_path)
+        return DownloadResult(status_code=200, size=state['size'], etag=state['etag'],
+                              last_modified=state['last_modified'], sha256=digest.hexdigest(),
+                              resumed_bytes=offset)
+
+    def _fetch_segmented(self, url: str, partial_path: str, state: dict) -> DownloadResult:
+        """
+        按字节区间并行下载，已完成的区间跳过
+
+        sha256 按顺序读取已完成的区间计算，与后续区间的下载同时进行，
+        最后一个区间完成后只需再读取该区间（通常仍在页缓存中）
+        """
+        size = state['size']
+        segment_size = max(self.min_segment_size, -(-size // self.segments))
+        ranges = [(start, min(start + segment_size, size)) for start in range(0, size, segment_size)]
+        done = {tuple(item) for item in state.get('done', [])}
+        pending = [item for item in ranges if item not in done]
+        resumed_bytes = sum(end - start for start, end in ranges if (start, end) in done)
+        if resumed_bytes:
+            logger.info(f"Resuming {url}: {resumed_bytes} of {size} bytes already downloaded")
+
+        # 预分配文件，各分段写入各自的偏移位置
+        if not os.path.exists(partial_path):
+            with open(partial_path, 'wb') as f:
+                f.truncate(size)
+        state['done'] = [list(item) for item in ranges if item in done]
+        self._save_state(partial_path, state)
+
+        state_lock = threading.Lock()
+
+        def download(segment: Tuple[int, int]):
+            self._download_range(url, partial_path, segment[0], segment[1], None, if_range=True, state=state)
+            with state_lock:
+                state['done'].append(list(segment))
+                self._save_state(partial_path, state)
+
+        digest = hashlib.sha256()
+        # 不使用缓冲读取：预读会读入尚未下载完成的下一个区间
+        with ThreadPoolExecutor(max_workers=min(self.segments, len(pending) or 1)) as executor, \
+                open(partial_path, 'rb+', buffering=0) as f:
+            futures = {segment: executor.submit(download, segment) for segment in pending}
+            for start, end in ranges:
+                if (start, end) in futures:
+                    futures[(start, end)].result()
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = f.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        raise RuntimeError(f"Incomplete segment of {url} at byte {end - remaining}")
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+            os.fsync(f.fileno())
+
+        self._remove_state(partial_path)
+        return DownloadResult(status_code=200, size=size, etag=state['etag'],
+                              last_modified=state['last_modified'], sha256=digest.hexdigest(),
+                              segments=len(ranges), resumed_bytes=resumed_bytes)
+
+    def _download_range(self, url: str, partial_path: str, start: int, end: int,
+                        digest=None, if_range: bool = False, state: Optional[dict] = None):
+        """
+        下载 [start, end) 区间并写入文件对应位置，连接中断时从已写入位置重试
+
+        Args:
+            url: 下载URL
+            partial_path: 目标文件
+            start: 起始字节
+            end: 结束字节（不包含）
+            digest: 顺序续传时累计计算的sha256，分段下载时为None（下载完成后按顺序计算）
+            if_range: 是否携带If-Range，远程文件变化时服务端会返回完整内容而不是区间
+            state: 续传状态，用于读取ETag/Last-Modified
+        """
+        position = start
+        attempts = 0
+        headers = {}
+        validator = state and (state.get('etag') or state.get('last_modified'))
+        if if_range and validator:
+            headers['If-Range'] = validator
+        with open(partial_path, 'rb+') as f:
+            while position < end:
+                try:
+                    headers['Range'] = f"bytes={position}-{end - 1}"
+                    with self.session.get(url, stream=True, headers=headers, timeout=self.timeout) as response:
+                        if response.status_code != 206:
+                            raise RuntimeError(f"Server ignored range request for {url}: "
+                                               f"HTTP {response.status_code}")
+                        f.seek(position)
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            chunk = chunk[:end - position]
+                            f.write(chunk)
+                            if digest is not None:
+                                digest.update(chunk)
+                            position += len(chunk)
+                            if position >= end:
+                                break
+                except (requests.ConnectionError, requests.Timeout,
+                        requests.exceptions.ChunkedEncodingError) as e:
+                    attempts += 1
+                    if attempts > self.retries:
+                        raise
+                    logger.warning(f"Download of {url} interrupted at byte {position}, retrying: {str(e)}")
+
+    def _remove_state(self, partial_path: str):
+        state_path = self._state_path(partial_path)
+        if os.path.exists(state_path):
+            os.unlink(state_path)
+
+
+# 全局共享的下载器，复用连接池
+_downloader: Optional[Downloader] = None
+_downloader_lock = threading.Lock()
+
+
+def get_downloader() -> Downloader:
+    """
+    获取全局共享的下载器
+
+    Returns:
+        Downloader: 下载器
+    """
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = Downloader()
+        return _downloader
+
+
+def set_downloader(downloader: Downloader):
+    """
+    替换全局共享的下载器，例如调整分段数或块大小
+
+    Args:
+        downloader: 下载器
+    """
+    global _downloader
+    with _downloader_lock:
+        _downloader = downloader
@@ -0,0 +1,129 @@
+import fcntl
+import json
+import logging
+import os
+import socket
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LockTimeout(TimeoutError):
+    """等待文件锁超时"""
+
+
+class FileLock:
+    """
+    跨进程文件锁
+
+    基于 flock 实现，持有锁的进程崩溃后内核会自动释放锁，因此残留的锁文件不会阻塞其他进程；
+    锁文件中记录持有者信息，获取到残留锁文件时会识别并记录日志。
+    同一进程内的不同线程分别获取时也会互斥
+    """
+
+    # 等待锁时的轮询间隔（秒）
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, lock_path: str, timeout: Optional[float] = None):
+        """
+        初始化文件锁
+
+        Args:
+            lock_path: 锁文件路径
+            timeout: 获取锁的超时时间（秒），None表示一直等待
+        """
+        self.lock_path = lock_path
+        self.timeout = timeout
+        self._fd: Optional[int] = None
+
+    def _read_owner(self) -> dict:
+        try:
+            with open(self.lock_path, 'r', encoding='utf-8') as f:
+                return json.loads(f.read() or '{}')
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def is_stale(self) -> bool:
+        """
+        判断锁文件是否是崩溃进程残留的（记录的持有者在本机且已不存在）
+
+        Returns:
+            bool: 是否是残留的锁文件
+        """
+        owner = self._read_owner()
+        if not owner or owner.get('host') != socket.gethostname():
+            return False
+        return not self._pid_alive(owner.get('pid', 0))
+
+    def acquire(self) -> "FileLock":
+        """
+        获取锁
+
+        Returns:
+            FileLock: 自身
+
+        Raises:
+            LockTimeout: 超时未获取到锁
+        """
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        start = time.monotonic()
+        waiting_logged = False
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if self.timeout is not None and time.monotonic() - start > self.timeout:
+                        raise LockTimeout(f"Timeout waiting for lock: {self.lock_path}")
+                    if not waiting_logged:
+                        owner = self._read_owner()
+                        logger.info(f"Waiting for lock {self.lock_path} held by "
+                                    f"pid {owner.get('pid')} on {owner.get('host')}")
+                        waiting_logged = True
+                    time.sleep(self.POLL_INTERVAL)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        if self.is_stale():
+            logger.warning(f"Reclaimed stale lock left by a crashed process: {self.lock_path}")
+
+        # 记录持有者信息
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, json.dumps({
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'acquired_at': time.time(),
+        }).encode(), 0)
+        self._fd = fd
+        return self
+
+    def release(self):
+        """释放锁"""
+        if self._fd is None:
+            return
+        try:
+            os.ftruncate(self._fd, 0)
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "FileLock":
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
@@ -0,0 +1,363 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Union
+
+from .archive_codec import DEFAULT_CODEC, get_codec
+from .common import cleanup_archive, prepare_archive
+from .connection_pool import get_connection_pool
+from .deploy_plan import DeployPlan
+from .deploy_stamp import DeployStamp, read_remote_stamp
+from .lazy_import import lazy_import
+from .package_relay import PackageRelay
+from .service_manager import DeployConfig, ServiceManagerOperator
+
+if TYPE_CHECKING:
+    from fabric import Connection
+
+fabric = lazy_import('fabric')
+
+logger = logging.getLogger(__name__)
+
+# 主机清单：主机地址（如 root@1.2.3.4:22）或已创建的Fabric连接对象
+HostSpec = Union[str, "Connection"]
+
+
+@dataclass
+class HostDeployResult:
+    """单台主机的部署结果"""
+    host: str  # 主机地址
+    success: bool  # 是否成功
+    exception: Optional[BaseException] = None  # 失败时的异常
+    timings: Dict[str, Any] = field(default_factory=dict)  # 各阶段耗时（秒）及使用的压缩编解码器
+    healthy: Optional[bool] = None  # 部署后健康检查是否通过，None表示未检查
+
+
+class UnhealthyServiceError(RuntimeError):
+    """部署后服务在超时前未进入健康状态"""
+
+
+@dataclass
+class RolloutPolicy:
+    """分批滚动发布策略"""
+    batch_size: int = 1  # 每批主机数
+    batch_percent: Optional[float] = None  # 每批主机占全部主机的百分比（0-100），指定时优先于 batch_size
+    max_failures: int = 0  # 允许失败的主机总数，超过后终止发布
+    concurrency: Optional[int] = None  # 批内最大并发部署数，None表示整批并发
+    health_timeout: float = 60  # 等待服务健康的超时时间（秒）
+    health_interval: float = 1  # 首次健康检查间隔（秒），之后按指数退避增长
+    health_max_interval: float = 10  # 最大健康检查间隔（秒）
+
+    def batches(self, hosts: List[HostSpec]) -> List[List[HostSpec]]:
+        """
+        将主机清单按批大小分组
+
+        Args:
+            hosts: 主机清单
+
+        Returns:
+            List[List[HostSpec]]: 各批主机，顺序与主机清单一致
+        """
+        size = self.batch_size
+        if self.batch_percent is not None:
+            size = math.ceil(len(hosts) * self.batch_percent / 100)
+        if size < 1:
+            raise ValueError(f"Batch size must be positive: {size}")
+        return [hosts[i:i + size] for i in range(0, len(hosts), size)]
+
+
+@dataclass
+class RolloutResult:
+    """滚动发布结果"""
+    results: List[HostDeployResult]  # 已部署主机的结果，顺序与部署顺序一致
+    batches: int  # 已执行的批数
+    aborted: bool = False  # 是否因失败过多而终止
+    skipped: List[str] = field(default_factory=list)  # 终止后未部署的主机
+
+    @property
+    def failures(self) -> int:
+        """失败的主机数"""
+        return sum(1 for result in self.results if not result.success)
+
+
+class SharedArchives(Mapping):
+    """
+    多主机共享的上传归档：源路径到tgz文件路径的只读映射，作为 prepared_archives 传给各主机的部署
+
+    归档在某台主机的部署计划第一次需要上传该路径时才下载并打包（由锁保证只准备一次），之后各主机复用同一份；
+    所有主机都已是最新时不下载也不打包。判断路径是否包含在内（in）不会触发准备。
+    各主机支持的解压方式可能不同，未在部署配置中指定编解码器时使用所有主机都支持的gzip
+    """
+
+    def __init__(self, config: DeployConfig):
+        """
+        初始化共享归档
+
+        Args:
+            config: 部署配置
+
+        Raises:
+            ValueError: 编解码器不可用或压缩级别超出范围
+        """
+        self.codec = get_codec(config.compression or DEFAULT_CODEC)
+        self.level = self.codec.check_level(config.compression_level)
+        # 路径 -> prepare_archive 的额外参数
+        self._sources: Dict[str, Dict[str, Any]] = {config.source_path: {'sha256': config.sha256}}
+        if config.merge_config_dir and os.path.exists(config.merge_config_dir) and not config.sync_config:
+            self._sources[config.merge_config_dir] = {}
+        self._archives: Dict[str, str] = {}
+        # 准备失败时保存异常，其他主机直接失败而不是重复下载
+        self._errors: Dict[str, BaseException] = {}
+        self._lock = threading.Lock()
+        self.prepare_time = 0.0  # 下载和打包的累计耗时（秒）
+
+    def __getitem__(self, path: str) -> str:
+        if path not in self._sources:
+            raise KeyError(path)
+        with self._lock:
+            if path in self._errors:
+                raise self._errors[path]
+            if path not in self._archives:
+                start = time.monotonic()
+                try:
+                    self._archives[path] = prepare_archive(path, codec=self.codec, level=self.level,
+                                                           **self._sources[path])
+                except Exception as e:
+                    self._errors[path] = e
+                    raise
+                finally:
+                    self.prepare_time += time.monotonic() - start
+            return self._archives[path]
+
+    def __contains__(self, path: object) -> bool:
+        return path in self._sources
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sources)
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    @property
+    def prepared(self) -> Dict[str, str]:
+        """已准备好的归档"""
+        with self._lock:
+            return dict(self._archives)
+
+    def cleanup(self):
+        """清理已准备的归档"""
+        with self._lock:
+            for tgz_path in self._archives.values():
+                cleanup_archive(tgz_path)
+            self._archives.clear()
+
+
+class FleetDeployer:
+    """多主机并发部署器"""
+
+    def __init__(self,
+                 hosts: List[HostSpec],
+                 max_workers: int = 8,
+                 connection_factory: Optional[Callable[[str], "Connection"]] = None,
+                 package_relay: Optional[PackageRelay] = None):
+        """
+        初始化多主机部署器
+
+        Args:
+            hosts: 主机清单
+            max_workers: 最大并发部署主机数
+            connection_factory: 由主机地址创建连接的函数，默认从全局连接池获取，多次部署复用同一个SSH连接
+            package_relay: 软件包中转缓存，指定时依赖只下载一次，再推送到各主机安装
+        """
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be positive: {max_workers}")
+        self.hosts = list(hosts)
+        self.max_workers = max_workers
+        self.connection_factory = connection_factory
+        self.package_relay = package_relay
+
+    @staticmethod
+    def _host_name(host: HostSpec) -> str:
+        return host if isinstance(host, str) else host.host
+
+    def _connect(self, host: HostSpec) -> "Connection":
+        if isinstance(host, fabric.Connection):
+            return host
+        if self.connection_factory is None:
+            return get_connection_pool().acquire(host)
+        return self.connection_factory(host)
+
+    def _disconnect(self, host: HostSpec, conn: "Connection"):
+        """归还从连接池获取的连接"""
+        if not isinstance(host, fabric.Connection) and self.connection_factory is None:
+            get_connection_pool().release(conn)
+
+    def _deploy_host(self, host: HostSpec, config: DeployConfig,
+                     prepared_archives: "SharedArchives",
+                     policy: Optional[RolloutPolicy] = None) -> HostDeployResult:
+        """在单台主机上部署服务，指定发布策略时等待服务健康，异常不会向上抛出而是记录在结果中"""
+        host_name = self._host_name(host)
+        timings = {}
+        start = time.monotonic()
+        conn = None
+        try:
+            conn = self._connect(host)
+            operator = ServiceManagerOperator(conn, package_relay=self.package_relay)
+            timings['connect'] = time.monotonic() - start
+
+            deploy_start = time.monotonic()
+            operator.deploy_service(config, prepared_archives=prepared_archives)
+            timings['deploy'] = time.monotonic() - deploy_start
+            timings.update(operator.timings)
+
+            if policy is not None:
+                health_start = time.monotonic()
+                healthy = operator.wait_healthy(config, policy.health_timeout, policy.health_interval,
+                                                policy.health_max_interval)
+                timings['health'] = time.monotonic() - health_start
+                if not healthy:
+                    error = UnhealthyServiceError(f"Service {config.name} on {host_name} is not healthy "
+                                                  f"after {policy.health_timeout}s")
+                    logger.error(str(error))
+                    return HostDeployResult(host=host_name, success=False, exception=error, timings=timings,
+                                            healthy=False)
+                return HostDeployResult(host=host_name, success=True, timings=timings, healthy=True)
+            return HostDeployResult(host=host_name, success=True, timings=timings)
+        except Exception as e:
+            logger.error(f"Deploy {config.name} to {host_name} failed: {str(e)}")
+            return HostDeployResult(host=host_name, success=False, exception=e, timings=timings)
+        finally:
+            if conn is not None:
+                self._disconnect(host, conn)
+            timings['total'] = time.monotonic() - start
+
+    def _plan_host(self, host: HostSpec, config: DeployConfig) -> DeployPlan:
+        """计算单台主机的部署计划"""
+        conn = self._connect(host)
+        try:
+            return ServiceManagerOperator(conn, package_relay=self.package_relay).plan(config)
+        finally:
+            self._disconnect(host, conn)
+
+    def plan_service(self, config: DeployConfig) -> List[DeployPlan]:
+        """
+        并发计算所有主机的部署计划，不修改远程主机，可用 summarize_plans 汇总为JSON。
+        各主机按单独部署计算，实际部署时归档由所有主机共享，只打包一次
+
+        Args:
+            config: 部署配置
+
+        Returns:
+            List[DeployPlan]: 每台主机的部署计划，顺序与主机清单一致
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda host: self._plan_host(host, config), self.hosts))
+
+    def deploy_service(self, config: DeployConfig) -> List[HostDeployResult]:
+        """
+        并发部署服务到所有主机，归档在第一台需要上传的主机上准备，所有主机都已是最新时不准备
+
+        Args:
+            config: 部署配置
+
+        Returns:
+            List[HostDeployResult]: 每台主机的部署结果，顺序与主机清单一致
+        """
+        prepared_archives = SharedArchives(config)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(self._deploy_host, host, config, prepared_archives)
+                           for host in self.hosts]
+                results = [future.result() for future in futures]
+        finally:
+            prepared_archives.cleanup()
+
+        for result in results:
+            result.timings['prepare'] = prepared_archives.prepare_time
+        return results
+
+    def rolling_deploy(self, config: DeployConfig, policy: Optional[RolloutPolicy] = None) -> RolloutResult:
+        """
+        分批滚动发布：每批主机部署后等待服务健康再发布下一批，失败主机数超过阈值时终止发布。
+        归档与 deploy_service 相同，在第一台需要上传的主机上准备
+
+        Args:
+            config: 部署配置
+            policy: 发布策略，默认逐台发布、任一主机失败即终止
+
+        Returns:
+            RolloutResult: 发布结果
+        """
+        policy = policy or RolloutPolicy()
+        batches = policy.batches(self.hosts)
+        prepared_archives = SharedArchives(config)
+        rollout = RolloutResult(results=[], batches=0)
+        try:
+            for index, batch in enumerate(batches):
+                workers = min(policy.concurrency or len(batch), len(batch))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(self._deploy_host, host, config, prepared_archives, policy)
+                               for host in batch]
+                    batch_results = [future.result() for future in futures]
+                for result in batch_results:
+                    result.timings['prepare'] = prepared_archives.prepare_time
+                rollout.results.extend(batch_results)
+                rollout.batches += 1
+
+                batch_failures = sum(1 for result in batch_results if not result.success)
+                logger.info(f"Rollout {config.name} batch {index + 1}/{len(batches)}: "
+                            f"{len(batch) - batch_failures} healthy, {batch_failures} failed")
+                if rollout.failures > policy.max_failures:
+                    rollout.aborted = True
+                    rollout.skipped = [self._host_name(host) for later in batches[index + 1:] for host in later]
+                    logger.error(f"Rollout {config.name} aborted after {rollout.failures} failures, "
+                                 f"{len(rollout.skipped)} hosts skipped")
+                    break
+        finally:
+            prepared_archives.cleanup()
+        return rollout
+
+    def deploy_service_with_service_dir(self, service_dir: str) -> List[HostDeployResult]:
+        """
+        根据服务目录并发部署服务到所有主机
+
+        Args:
+            service_dir: 服务目录（包含 definitions.json）
+
+        Returns:
+            List[HostDeployResult]: 每台主机的部署结果
+        """
+        return self.deploy_service(DeployConfig.from_service_dir(service_dir))
+
+    def check_service(self, config: DeployConfig) -> Dict[str, bool]:
+        """
+        并发检查所有主机上的服务是否已是最新部署，每台主机只执行一次远程命令
+
+        Args:
+            config: 部署配置
+
+        Returns:
+            Dict[str, bool]: 主机地址到是否最新的映射，无法连接的主机视为非最新
+        """
+        stamp = DeployStamp.compute(config)
+
+        def check(host: HostSpec) -> bool:
+            try:
+                conn = self._connect(host)
+                try:
+                    remote_stamp = read_remote_stamp(conn, config.install_path, config.use_sudo)
+                finally:
+                    self._disconnect(host, conn)
+                return not stamp.changed_parts(remote_stamp)
+            except Exception as e:
+                logger.error(f"Check {config.name} on {self._host_name(host)} failed: {str(e)}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(check, self.hosts))
+        return {self._host_name(host): result for host, result in zip(self.hosts, results)}
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import logging
+import os
+import shlex
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from fabric import Connection
+
+logger = logging.getLogger(__name__)
+
+# 各部分输出前的分隔标记
+SECTION_MARKER = '@@fact '
+
+# 需要检测是否存在的命令（如归档解压依赖的命令）
+PROBED_COMMANDS = ('gzip', 'xz', 'zstd', 'tar')
+
+# 一次收集所有主机信息的脚本，各部分以分隔标记开头
+GATHER_SCRIPT = f"""
+echo '{SECTION_MARKER}package_manager'
+if command -v dnf >/dev/null 2>&1; then echo dnf
+elif command -v yum >/dev/null 2>&1; then echo yum
+elif command -v apt >/dev/null 2>&1; then echo apt
+else echo unknown; fi
+echo '{SECTION_MARKER}service_manager'
+if command -v systemctl >/dev/null 2>&1; then echo systemd
+elif command -v service >/dev/null 2>&1; then echo service
+else echo unknown; fi
+echo '{SECTION_MARKER}os'
+( . /etc/os-release 2>/dev/null; echo "${{ID:-unknown}}"; echo "${{VERSION_ID:-}}" )
+uname -m
+uname -r
+echo '{SECTION_MARKER}disk'
+df -Pk / /tmp /opt 2>/dev/null | tail -n +2
+echo '{SECTION_MARKER}packages'
+if command -v dpkg-query >/dev/null 2>&1; then
+    dpkg-query -W -f='${{Status}} ${{Package}}\\n' 2>/dev/null | awk '$3 == "installed" {{print $4}}'
+elif command -v rpm >/dev/null 2>&1; then
+    rpm -qa --qf '%{{NAME}}\\n' 2>/dev/null
+fi
+echo '{SECTION_MARKER}unit_files'
+ls /etc/systemd/system /usr/lib/systemd/system /lib/systemd/system 2>/dev/null | grep '\\.service$' | sort -u
+echo '{SECTION_MARKER}commands'
+for c in {' '.join(PROBED_COMMANDS)}; do command -v $c >/dev/null 2>&1 && echo $c; done
+true
+"""
+
+
+def host_key(conn: "Connection") -> str:
+    """
+    获取连接对应的主机标识
+
+    Args:
+        conn: Fabric连接对象
+
+    Returns:
+        str: user@host:port
+    """
+    return f"{conn.user}@{conn.host}:{conn.port}"
+
+
+@dataclass
+class HostFacts:
+    """主机信息"""
+    host: str  # 主机标识 user@host:port
+    package_manager: str = 'unknown'  # 包管理器（apt/yum/dnf/unknown）
+    service_manager: str = 'unknown'  # 服务管理器（systemd/service/unknown）
+    os_id: str = 'unknown'  # 发行版ID（/etc/os-release 中的ID）
+    os_version: str = ''  # 发行版版本
+    arch: str = ''  # CPU架构（uname -m）
+    kernel: str = ''  # 内核版本
+    disk_free: Dict[str, int] = field(default_factory=dict)  # 挂载点 -> 可用空间（字节）
+    installed_packages: List[str] = field(default_factory=list)  # 已安装的软件包
+    unit_files: List[str] = field(default_factory=list)  # 已存在的服务单元文件名
+    commands: List[str] = field(default_factory=list)  # PROBED_COMMANDS 中远程存在的命令
+    gathered_at: float = 0.0  # 收集时间
+
+    @classmethod
+    def parse(cls, host: str, output: str) -> "HostFacts":
+        """
+        解析收集脚本的输出
+
+        Args:
+            host: 主机标识
+            output: 收集脚本的输出
+
+        Returns:
+            HostFacts: 主机信息
+        """
+        sections: Dict[str, List[str]] = {}
+        current = None
+        for line in output.splitlines():
+            if line.startswith(SECTION_MARKER):
+                current = sections.setdefault(line[len(SECTION_MARKER):].strip(), [])
+            elif current is not None and line.strip():
+                current.append(line.strip())
+
+        facts = cls(host=host, gathered_at=time.time())
+        facts.package_manager = (sections.get('package_manager') or ['unknown'])[0]
+        facts.service_manager = (sections.get('service_manager') or ['unknown'])[0]
+        os_lines = sections.get('os', []) + [''] * 4
+        facts.os_id, facts.os_version, facts.arch, facts.kernel = os_lines[:4]
+        for line in sections.get('disk', []):
+            # Filesystem 1024-blocks Used Available Capacity Mounted-on
+            columns = line.split()
+            if len(columns) >= 6 and columns[3].isdigit():
+                facts.disk_free[' '.join(columns[5:])] = int(columns[3]) * 1024
+        facts.installed_packages = sorted(set(sections.get('packages', [])))
+        facts.unit_files = sections.get('unit_files', [])
+        facts.commands = sections.get('commands', [])
+        return facts
+
+    def free_bytes(self, path: str) -> Optional[int]:
+        """
+        获取路径所在挂载点的可用空间
+
+        Args:
+            path: 远程绝对路径
+
+        Returns:
+            Optional[int]: 可用空间（字节），未收集到对应挂载点时返回None
+        """
+        mounts = [mount for mount in self.disk_free
+                  if path == mount or path.startswith(mount.rstrip('/') + '/')]
+        if not mounts:
+            return None
+        return self.disk_free[max(mounts, key=len)]
+
+    def has_package(self, package_name: str) -> bool:
+        """是否已安装软件包"""
+        return package_name in self.installed_packages
+
+    def has_unit(self, service_name: str) -> bool:
+        """是否已存在服务单元文件"""
+        if not service_name.endswith('.service'):
+            service_name = f"{service_name}.service"
+        return service_name in self.unit_files
+
+
+class FactsCache:
+    """
+    主机信息缓存
+
+    按主机缓存在内存和磁盘中，超过有效期后重新收集；每次收集只执行一次远程命令
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, ttl: float = 3600):
+        """
+        初始化主机信息缓存
+
+        Args:
+            cache_dir: 缓存目录路径，如果为None则使用默认路径
+            ttl: 有效期（秒）
+        """
+        if cache_dir is None:
+            cache_dir = os.path.expanduser("~/.fabric_cache/facts")
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._memory: Dict[str, HostFacts] = {}
+        self._lock = threading.Lock()
+
+    def _cache_file(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{hashlib.sha256(key.encode()).hexdigest()[:16]}.json")
+
+    def _fresh(self, facts: Optional[HostFacts]) -> bool:
+        return facts is not None and time.time() - facts.gathered_at <= self.ttl
+
+    def _load(self, key: str) -> Optional[HostFacts]:
+        try:
+            with open(self._cache_file(key), 'r', encoding='utf-8') as f:
+                facts = HostFacts(**json.load(f))
+        except (OSError, json.JSONDecodeError, TypeError):
+            return None
+        return facts if facts.host == key else None
+
+    def save(self, facts: HostFacts):
+        """
+        保存主机信息到内存和磁盘，例如安装软件包后更新已安装列表
+
+        Args:
+            facts: 主机信息
+        """
+        with self._lock:
+            self._memory[facts.host] = facts
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_file = self._cache_file(facts.host)
+        # 多台主机并发部署时各线程同时保存，每次写入使用唯一的临时文件
+        fd, temp_file = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(asdict(facts), f)
+            os.replace(temp_file, cache_file)
+        except BaseException:
+            os.unlink(temp_file)
+            raise
+
+    def gather(self, conn: "Connection") -> HostFacts:
+        """
+        在远程主机上收集主机信息，不使用缓存
+
+        Args:
+            conn: Fabric连接对象
+
+        Returns:
+            HostFacts: 主机信息
+        """
+        result = conn.run(f"sh -c {shlex.quote(GATHER_SCRIPT)}", hide=True, warn=True)
+        facts = HostFacts.parse(host_key(conn), result.stdout)
+        logger.info(f"Gathered facts for {facts.host}: {facts.os_id} {facts.os_version} {facts.arch}, "
+                    f"{facts.package_manager}/{facts.service_manager}")
+        self.save(facts)
+        return facts
+
+    def get(self, conn: "Connection", refresh: bool = False) -> HostFacts:
+        """
+        获取主机信息，依次使用内存缓存、磁盘缓存，都已过期时重新收集
+
+        Args:
+            conn: Fabric连接对象
+            refresh: 是否忽略缓存重新收集
+
+        Returns:
+            HostFacts: 主机信息
+        """
+        key = host_key(conn)
+        if not refresh:
+            with self._lock:
+                facts = self._memory.get(key)
+            if self._fresh(facts):
+                return facts
+            facts = self._load(key)
+            if self._fresh(facts):
+                with self._lock:
+                    self._memory[key] = facts
+                return facts
+        return self.gather(conn)
+
+    def invalidate(self, conn: "Connection"):
+        """
+        删除主机的缓存信息
+
+        Args:
+            conn: Fabric连接对象
+        """
+        key = host_key(conn)
+        with self._lock:
+            self._memory.pop(key, None)
+        if os.path.exists(self._cache_file(key)):
+            os.unlink(self._cache_file(key))
+
+
+# 全局共享的主机信息缓存
+_facts_cache: Optional[FactsCache] = None
+_facts_cache_lock = threading.Lock()
+
+
+def get_facts_cache() -> FactsCache:
+    """
+    获取全局共享的主机信息缓存
+
+    Returns:
+        FactsCache: 主机信息缓存
+    """
+    global _facts_cache
+    with _facts_cache_lock:
+        if _facts_cache is None:
+            _facts_cache = FactsCache()
+        return _facts_cache
+
+
+def set_facts_cache(cache: FactsCache):
+    """
+    替换全局共享的主机信息缓存，例如调整有效期
+
+    Args:
+        cache: 主机信息缓存
+    """
+    global _facts_cache
+    with _facts_cache_lock:
+        _facts_cache = cache
+
+
+def get_facts(conn: "Connection", refresh: bool = False) -> HostFacts:
+    """
+    获取主机信息
+
+    Args:
+        conn: Fabric连接对象
+        refresh: 是否忽略缓存重新收集
+
+    Returns:
+        HostFacts: 主机信息
+    """
+    return get_facts_cache().get(conn, refresh)
@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+# 导入耗时较长、只应在第一次使用时加载的依赖
+HEAVY_MODULES = ('fabric', 'invoke', 'paramiko', 'requests', 'urllib3', 'jsonschema')
+
+# 短命令（状态查询、配置校验）需要导入的模块
+DEFAULT_MODULES = ('fabric_src.utils.service_manager', 'fabric_src.utils.fleet_manager')
+
+# -X importtime 输出：import time: self | cumulative | name
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+# 在子进程中导入模块，输出真正执行了导入的重量级依赖（LazyLoader 登记的模块尚未加载时类型为 _LazyModule）
+_PROBE_SCRIPT = """
+import importlib, json, sys
+importlib.import_module(sys.argv[1])
+loaded = [name for name in sys.argv[2:]
+          if name in sys.modules and type(sys.modules[name]).__name__ != '_LazyModule']
+print(json.dumps(loaded))
+"""
+
+
+def _project_root() -> str:
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure_import_time(module: str, runs: int = 5, python: Optional[str] = None) -> Dict[str, Any]:
+    """
+    在全新的子进程中用 -X importtime 测量模块的导入耗时
+
+    每个子进程使用空的临时HOME目录，同时检查导入时是否在用户目录下创建了文件（如缓存目录）
+
+    Args:
+        module: 模块名
+        runs: 测量次数，取中位数
+        python: Python解释器路径，默认为当前解释器
+
+    Returns:
+        Dict[str, Any]: 包含 module、import_ms（模块累计导入耗时）、process_ms（整个进程耗时）、
+            heavy_loaded（已加载的重量级依赖）、home_files（导入时在HOME下创建的文件）
+    """
+    python = python or sys.executable
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_project_root(), os.environ.get('PYTHONPATH')])))
+    import_times, process_times = [], []
+    home_files: List[str] = []
+    for _ in range(runs):
+        home = tempfile.mkdtemp()
+        try:
+            start = time.perf_counter()
+            result = subprocess.run([python, '-X', 'importtime', '-c', f"import {module}"],
+                                    env=dict(env, HOME=home), capture_output=True, text=True, check=True)
+            process_times.append((time.perf_counter() - start) * 1000)
+            for line in result.stderr.splitlines():
+                match = _IMPORTTIME_LINE.match(line)
+                if match and match.group(4) == module:
+                    import_times.append(int(match.group(2)) / 1000)
+            home_files = sorted(set(home_files) | {os.path.relpath(os.path.join(root, name), home)
+                                                    for root, dirs, files in os.walk(home) for name in dirs + files})
+        finally:
+            shutil.rmtree(home, ignore_errors=True)
+
+    probe = subprocess.run([python, '-c', _PROBE_SCRIPT, module, *HEAVY_MODULES],
+                           env=env, capture_output=True, text=True, check=True)
+    return {
+        'module': module,
+        'import_ms': statistics.median(import_times) if import_times else 0.0,
+        'process_ms': statistics.median(process_times),
+        'heavy_loaded': json.loads(probe.stdout),
+        'home_files': home_files,
+    }
+
+
+def _budget_problems(report: Dict[str, Any], budget_ms: float) -> List[str]:
+    """检查一个模块的测量结果"""
+    module = report['module']
+    problems = []
+    if report['import_ms'] > budget_ms:
+        problems.append(f"{module}: import takes {report['import_ms']:.1f} ms > budget {budget_ms:.0f} ms")
+    if report['heavy_loaded']:
+        problems.append(f"{module}: loads {', '.join(report['heavy_loaded'])} at import time")
+    if report['home_files']:
+        problems.append(f"{module}: creates {', '.join(report['home_files'])} in HOME at import time")
+    return problems
+
+
+def check_import_budget(modules: List[str], budget_ms: float = 100, runs: int = 5,
+                        python: Optional[str] = None) -> List[str]:
+    """
+    检查模块的导入耗时是否在预算内，且导入时不加载重量级依赖、不在用户目录下创建文件
+
+    Args:
+        modules: 模块名列表
+        budget_ms: 模块累计导入耗时的上限（毫秒）
+        runs: 测量次数
+        python: Python解释器路径
+
+    Returns:
+        List[str]: 问题列表，为空表示通过
+    """
+    return [problem for module in modules
+            for problem in _budget_problems(measure_import_time(module, runs, python), budget_ms)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="测量模块导入耗时并检查导入预算")
+    parser.add_argument('modules', nargs='*', default=list(DEFAULT_MODULES), help="模块名")
+    parser.add_argument('--budget', type=float, default=100, help="导入耗时上限（毫秒）")
+    parser.add_argument('--runs', type=int, default=5, help="测量次数")
+    args = parser.parse_args(argv)
+
+    problems = []
+    for module in args.modules:
+        report = measure_import_time(module, args.runs)
+        print(f"{module}: import {report['import_ms']:.1f} ms, process {report['process_ms']:.1f} ms, "
+              f"heavy loaded: {report['heavy_loaded'] or '-'}")
+        problems += _budget_problems(report, args.budget)
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+import importlib.util
+import sys
+import threading
+from types import ModuleType
+
+_lazy_lock = threading.Lock()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    延迟导入顶层模块：立即返回模块对象，第一次访问其属性时才真正执行导入
+
+    用于 fabric、invoke、requests、jsonschema 等导入耗时较长的依赖，
+    只做状态查询或配置校验的短命令不需要承担它们的导入开销
+
+    Args:
+        name: 顶层模块名（不支持子模块，查找子模块会导入其父包）
+
+    Returns:
+        ModuleType: 模块对象，已导入时直接返回
+
+    Raises:
+        ModuleNotFoundError: 模块不存在
+    """
+    with _lazy_lock:
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        return module
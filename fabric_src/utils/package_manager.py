@@ -1,7 +1,19 @@
-from fabric import Connection
-from invoke import UnexpectedExit
+import logging
+import shlex
 from enum import Enum
-from typing import Dict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from .host_facts import get_facts, get_facts_cache
+from .lazy_import import lazy_import
+from .package_relay import PackageRelay
+from .tracing import get_tracer
+
+if TYPE_CHECKING:
+    from fabric import Connection
+
+invoke = lazy_import('invoke')
+
+logger = logging.getLogger(__name__)
 
 
 class PackageManager(Enum):
@@ -19,19 +31,25 @@ class PackageManagerCommands:
             "install": "apt-get install -y",
             "remove": "apt-get remove -y",
             "update": "apt-get update",
-            "check": "dpkg -l"
+            "check": "dpkg -l",
+            "list_installed": "dpkg-query -W -f='${Status} ${Package}\\n'",
+            "index_path": "/var/lib/apt/lists"
         },
         PackageManager.YUM: {
             "install": "yum install -y",
             "remove": "yum remove -y",
             "update": "yum update -y",
-            "check": "rpm -q"
+            "check": "rpm -q",
+            "list_installed": "rpm -qa --qf '%{NAME}\\n'",
+            "index_path": "/var/cache/yum"
         },
         PackageManager.DNF: {
             "install": "dnf install -y",
             "remove": "dnf remove -y",
             "update": "dnf update -y",
-            "check": "rpm -q"
+            "check": "rpm -q",
+            "list_installed": "rpm -qa --qf '%{NAME}\\n'",
+            "index_path": "/var/cache/dnf"
         }
     }
 
@@ -42,19 +60,40 @@ class PackageManagerCommands:
         
         Args:
             pkg_manager: 包管理器类型
-            action: 操作类型 (install/remove/update/check)
+            action: 操作类型 (install/remove/update/check/list_installed/index_path)
         
         Returns:
             str: 对应的命令
         """
         return cls.COMMANDS.get(pkg_manager, {}).get(action, "")
 
+    @classmethod
+    def get_dispatch_script(cls, action: str, args: str = "") -> str:
+        """
+        生成在远程主机上自动选择包管理器执行操作的shell片段，无需事先检测包管理器
+
+        Args:
+            action: 操作类型 (install/remove/update/check)
+            args: 命令参数（如包名）
+
+        Returns:
+            str: shell片段，检测不到包管理器时以非零状态退出
+        """
+        # 检测顺序与 PackageManagerDetector 一致
+        branches = []
+        for pkg_manager, binary in ((PackageManager.DNF, 'dnf'), (PackageManager.YUM, 'yum'),
+                                    (PackageManager.APT, 'apt')):
+            command = f"{cls.get_command(pkg_manager, action)} {args}".strip()
+            branches.append(f"command -v {binary} >/dev/null 2>&1; then {command}")
+        return ("if " + "; elif ".join(branches)
+                + "; else echo 'Unable to detect package manager' >&2; false; fi")
+
 
 class PackageManagerDetector:
     """包管理器检测器"""
 
     @staticmethod
-    def detect(conn: Connection) -> PackageManager:
+    def detect(conn: "Connection") -> PackageManager:
         """
         检测远程系统使用的包管理器类型
         
@@ -87,19 +126,48 @@ class PackageManagerDetector:
                 return PackageManager.APT
             else:
                 return PackageManager.UNKNOWN
-        except UnexpectedExit:
+        except invoke.UnexpectedExit:
             return PackageManager.UNKNOWN
 
 
 class PackageManagerOperator:
     """包管理器操作类"""
 
-    def __init__(self, conn: Connection):
+    def __init__(self, conn: "Connection", index_max_age: Optional[float] = None,
+                 relay: Optional[PackageRelay] = None):
+        """
+        初始化包管理器操作类
+
+        Args:
+            conn: Fabric连接对象
+            index_max_age: 包索引的最大有效期（秒），update 时索引比该值新则跳过；None表示总是更新
+            relay: 软件包中转缓存，指定时从中转缓存推送软件包文件安装，不访问上游镜像
+        """
         self.conn = conn
-        self.pkg_manager = PackageManagerDetector.detect(conn)
+        self.index_max_age = index_max_age
+        self.relay = relay
+        # 使用缓存的主机信息，避免每次创建时都检测包管理器
+        self.facts = get_facts(conn)
+        self.pkg_manager = PackageManager(self.facts.package_manager)
         if self.pkg_manager == PackageManager.UNKNOWN:
             raise RuntimeError("Unable to detect package manager")
 
+    def record_installed(self, package_names: Iterable[str], installed: bool = True):
+        """
+        安装或卸载成功后同步更新缓存的已安装列表
+
+        Args:
+            package_names: 包名
+            installed: 已安装还是已卸载
+        """
+        packages = set(self.facts.installed_packages)
+        if installed:
+            packages.update(package_names)
+        else:
+            packages.difference_update(package_names)
+        self.facts.installed_packages = sorted(packages)
+        get_facts_cache().save(self.facts)
+
     def install(self, package_name: str, use_sudo: bool = False) -> bool:
         """
         安装软件包
@@ -111,14 +179,17 @@ class PackageManagerOperator:
         Returns:
             bool: 安装是否成功
         """
+        if self.relay is not None:
+            return self._install_from_relay([package_name], use_sudo)
         try:
             install_cmd = f"{PackageManagerCommands.get_command(self.pkg_manager, 'install')} {package_name}"
             if use_sudo:
                 self.conn.sudo(install_cmd)
             else:
                 self.conn.run(install_cmd)
+            self.record_installed([package_name], True)
             return True
-        except UnexpectedExit:
+        except invoke.UnexpectedExit:
             return False
 
     def uninstall(self, package_name: str, use_sudo: bool = False) -> bool:
@@ -138,8 +209,9 @@ class PackageManagerOperator:
                 self.conn.sudo(remove_cmd)
             else:
                 self.conn.run(remove_cmd)
+            self.record_installed([package_name], False)
             return True
-        except UnexpectedExit:
+        except invoke.UnexpectedExit:
             return False
 
     def is_installed(self, package_name: str) -> bool:
@@ -156,25 +228,138 @@ class PackageManagerOperator:
             check_cmd = f"{PackageManagerCommands.get_command(self.pkg_manager, 'check')} {package_name}"
             self.conn.run(check_cmd, hide=True)
             return True
-        except UnexpectedExit:
+        except invoke.UnexpectedExit:
             return False
 
-    def update(self, use_sudo: bool = False) -> bool:
+    def _install_from_relay(self, package_names: List[str], use_sudo: bool) -> bool:
+        """从中转缓存安装软件包"""
+        with get_tracer().span('package_relay_install', host=self.conn.host, packages=package_names) as span:
+            if not self.relay.install(self.conn, self.facts, package_names, use_sudo):
+                span.error = 'relay install failed'
+                return False
+        self.record_installed(package_names, True)
+        return True
+
+    def install_many(self, package_names: Iterable[str], use_sudo: bool = False,
+                     update: bool = False) -> bool:
         """
-        更新包列表
-        
+        批量安装软件包：一次查询已安装的包，只在一个事务中安装缺少的包
+
         Args:
+            package_names: 要安装的包名
             use_sudo: 是否使用sudo权限
-        
+            update: 安装前是否更新包列表（索引未过期时跳过，见 index_max_age；使用中转缓存时不更新）
+
         Returns:
-            bool: 更新是否成功
+            bool: 所有包是否均已安装
         """
-        try:
-            update_cmd = PackageManagerCommands.get_command(self.pkg_manager, 'update')
-            if use_sudo:
-                self.conn.sudo(update_cmd)
-            else:
-                self.conn.run(update_cmd)
+        installed = self.is_installed_many(package_names)
+        missing = [name for name, ok in installed.items() if not ok]
+        if not missing:
+            logger.info(f"All {len(installed)} packages already installed")
             return True
-        except UnexpectedExit:
+
+        if self.relay is not None:
+            return self._install_from_relay(missing, use_sudo)
+        if update and not self.update(use_sudo):
             return False
+        logger.info(f"Installing {len(missing)} missing packages: {' '.join(missing)}")
+        with get_tracer().span('package_install', host=self.conn.host, remote_calls=1, packages=missing) as span:
+            try:
+                install_cmd = self.install_cmd(missing)
+                if use_sudo:
+                    self.conn.sudo(install_cmd)
+                else:
+                    self.conn.run(install_cmd)
+                self.record_installed(missing, True)
+                return True
+            except invoke.UnexpectedExit as e:
+                span.error = f"exit code {e.result.exited}"
+                return False
+
+    def missing_packages(self, package_names: Iterable[str]) -> List[str]:
+        """
+        按缓存的主机信息计算缺少的包，不执行远程调用
+
+        Args:
+            package_names: 包名
+
+        Returns:
+            List[str]: 缺少的包名，顺序与输入一致（去重）
+        """
+        return [name for name in dict.fromkeys(package_names) if not self.facts.has_package(name)]
+
+    def install_cmd(self, package_names: Iterable[str]) -> str:
+        """
+        生成在一个事务中安装软件包的命令
+
+        Args:
+            package_names: 包名
+
+        Returns:
+            str: 安装命令
+        """
+        return (f"{PackageManagerCommands.get_command(self.pkg_manager, 'install')} "
+                f"{' '.join(shlex.quote(name) for name in package_names)}")
+
+    def is_installed_many(self, package_names: Iterable[str]) -> Dict[str, bool]:
+        """
+        批量检查软件包是否已安装，只执行一次查询，并同步更新缓存的已安装列表
+
+        Args:
+            package_names: 包名
+
+        Returns:
+            Dict[str, bool]: 包名 -> 是否已安装，顺序与输入一致（去重）
+        """
+        query_cmd = PackageManagerCommands.get_command(self.pkg_manager, 'list_installed')
+        with get_tracer().span('package_query', host=self.conn.host, remote_calls=1) as span:
+            result = self.conn.run(f"{query_cmd} 2>/dev/null", hide=True, warn=True)
+            span.bytes_in = len(result.stdout)
+        packages = set()
+        for line in result.stdout.splitlines():
+            columns = line.split()
+            # dpkg-query: "install ok installed name"；rpm: "name"
+            if len(columns) == 4 and columns[2] == 'installed':
+                packages.add(columns[3])
+            elif len(columns) == 1:
+                packages.add(columns[0])
+        if packages:
+            self.facts.installed_packages = sorted(packages)
+            get_facts_cache().save(self.facts)
+        return {name: name in packages for name in dict.fromkeys(package_names)}
+
+    def update(self, use_sudo: bool = False, max_age: Optional[float] = None) -> bool:
+        """
+        更新包列表，包索引比有效期新时跳过
+
+        Args:
+            use_sudo: 是否使用sudo权限
+            max_age: 包索引的最大有效期（秒），None使用 index_max_age
+
+        Returns:
+            bool: 更新是否成功（跳过也视为成功）
+        """
+        if max_age is None:
+            max_age = self.index_max_age
+        update_cmd = PackageManagerCommands.get_command(self.pkg_manager, 'update')
+        if max_age is not None:
+            # 索引年龄检查和更新在同一次远程调用中完成，更新成功后刷新索引目录的修改时间
+            index = shlex.quote(PackageManagerCommands.get_command(self.pkg_manager, 'index_path'))
+            script = (f"age=$(( $(date +%s) - $(stat -c %Y {index} 2>/dev/null || echo 0) )); "
+                      f"if [ \"$age\" -lt {int(max_age)} ]; then echo \"Package index is fresh ($age s)\"; "
+                      f"else {update_cmd} && {{ [ ! -d {index} ] || touch {index}; }}; fi")
+            update_cmd = f"sh -c {shlex.quote(script)}"
+        with get_tracer().span('package_update', host=self.conn.host, remote_calls=1) as span:
+            try:
+                if use_sudo:
+                    result = self.conn.sudo(update_cmd)
+                else:
+                    result = self.conn.run(update_cmd)
+                # 索引未过期时跳过更新，相当于缓存命中
+                if max_age is not None:
+                    span.cache = 'hit' if 'Package index is fresh' in result.stdout else 'miss'
+                return True
+            except invoke.UnexpectedExit as e:
+                span.error = f"exit code {e.result.exited}"
+                return False
@@ -0,0 +1,306 @@
+import glob
+import json
+import logging
+import os
+import re
+import shlex
+import shutil
+import tarfile
+import tempfile
+import threading
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterable, List, Optional
+
+from .common import run_shell, run_streaming
+from .host_facts import HostFacts, get_facts
+from .lazy_import import lazy_import
+
+if TYPE_CHECKING:
+    from fabric import Connection
+
+invoke = lazy_import('invoke')
+
+logger = logging.getLogger(__name__)
+
+# 各包管理器（与 HostFacts.package_manager 一致）的软件包文件扩展名
+PACKAGE_EXTENSIONS = {
+    'apt': '.deb',
+    'yum': '.rpm',
+    'dnf': '.rpm',
+}
+
+# 在种子主机上下载软件包及其缺少的依赖（不安装）的命令，{dest} 为下载目录，{package} 为包名
+DOWNLOAD_COMMANDS = {
+    # --reinstall 保证种子主机上已安装的包也会被下载；下载目录中需要有 partial 子目录
+    'apt': "apt-get install -y -q --reinstall --download-only -o Dir::Cache::archives={dest} {package}",
+    'yum': "yumdownloader -q --resolve --destdir {dest} {package}",
+    'dnf': "dnf download -q --resolve --destdir {dest} {package}",
+}
+
+# 从本地软件包文件安装的命令，后接文件路径
+LOCAL_INSTALL_COMMANDS = {
+    'apt': "apt-get install -y",
+    'yum': "yum localinstall -y",
+    'dnf': "dnf install -y",
+}
+
+
+def platform_key(facts: HostFacts) -> str:
+    """
+    获取主机的软件包平台标识，同一平台的主机可以共用软件包文件
+
+    Args:
+        facts: 主机信息
+
+    Returns:
+        str: 包管理器-发行版-版本-架构
+    """
+    key = f"{facts.package_manager}-{facts.os_id}-{facts.os_version}-{facts.arch}"
+    return re.sub(r'[^A-Za-z0-9._-]', '_', key)
+
+
+class PackageRelay:
+    """
+    软件包中转缓存
+
+    软件包只在控制机或种子主机上解析和下载一次并缓存在本地，再推送到目标主机从本地文件安装，
+    目标主机无需访问上游镜像。软件包来源可以是：
+    - 本地仓库目录：平铺存放软件包文件的目录（如在控制机上用 apt-get download 准备），
+      按文件名匹配包名，不解析依赖，依赖需要显式列出
+    - 种子主机：与目标主机平台相同的主机，用包管理器下载软件包及种子主机上缺少的依赖
+    """
+
+    def __init__(self,
+                 cache_dir: Optional[str] = None,
+                 seed: Optional["Connection"] = None,
+                 repo_dir: Optional[str] = None):
+        """
+        初始化软件包中转缓存
+
+        Args:
+            cache_dir: 缓存目录路径，如果为None则使用默认路径
+            seed: 种子主机连接
+            repo_dir: 本地仓库目录，同时指定时优先于种子主机
+        """
+        if cache_dir is None:
+            cache_dir = os.path.expanduser("~/.fabric_cache/packages")
+        self.cache_dir = cache_dir
+        self.seed = seed
+        self.repo_dir = repo_dir
+        # 多个主机并发部署时，同一批软件包只下载一次
+        self._lock = threading.Lock()
+
+    def _index_file(self, platform: str) -> str:
+        return os.path.join(self.cache_dir, platform, 'index.json')
+
+    def _load_index(self, platform: str) -> Dict[str, List[str]]:
+        try:
+            with open(self._index_file(platform), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self, platform: str, index: Dict[str, List[str]]):
+        index_file = self._index_file(platform)
+        fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(index_file), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f, indent=2, sort_keys=True)
+            os.replace(temp_file, index_file)
+        except BaseException:
+            os.unlink(temp_file)
+            raise
+
+    def _add(self, platform: str, index: Dict[str, List[str]], package_name: str, files: List[str]):
+        """将软件包文件移入缓存并记录到索引"""
+        platform_dir = os.path.join(self.cache_dir, platform)
+        names = []
+        for path in files:
+            name = os.path.basename(path)
+            target = os.path.join(platform_dir, name)
+            if not os.path.exists(target):
+                shutil.copy2(path, f"{target}.tmp")
+                os.replace(f"{target}.tmp", target)
+            names.append(name)
+        index[package_name] = sorted(names)
+
+    def cached(self, facts: HostFacts, package_names: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        获取已缓存的软件包文件
+
+        Args:
+            facts: 目标主机信息
+            package_names: 包名
+
+        Returns:
+            Dict[str, List[str]]: 已缓存的包名 -> 软件包文件路径（包括依赖）
+        """
+        platform = platform_key(facts)
+        platform_dir = os.path.join(self.cache_dir, platform)
+        index = self._load_index(platform)
+        result = {}
+        for name in package_names:
+            files = [os.path.join(platform_dir, f) for f in index.get(name, [])]
+            if name in index and all(os.path.exists(f) for f in files):
+                result[name] = files
+        return result
+
+    def _import_from_repo(self, facts: HostFacts, package_names: List[str]) -> Dict[str, List[str]]:
+        """在本地仓库目录中按文件名查找软件包"""
+        extension = PACKAGE_EXTENSIONS[facts.package_manager]
+        # deb: name_version_arch.deb；rpm: name-version-release.arch.rpm
+        separator = '_' if extension == '.deb' else '-'
+        found = {}
+        for name in package_names:
+            pattern = os.path.join(self.repo_dir, f"{glob.escape(name)}{separator}*{extension}")
+            candidates = [path for path in glob.glob(pattern)
+                          if re.match(rf"{re.escape(name)}{separator}\d", os.path.basename(path))]
+            if not candidates:
+                raise FileNotFoundError(f"Package {name} not found in repository {self.repo_dir}")
+            # 存在多个版本时使用文件名排序最后的一个
+            found[name] = [sorted(candidates)[-1]]
+        return found
+
+    def _download_from_seed(self, facts: HostFacts, package_names: List[str], use_sudo: bool,
+                            work_dir: str) -> Dict[str, List[str]]:
+        """在种子主机上下载软件包，再取回本地"""
+        seed_facts = get_facts(self.seed)
+        if platform_key(seed_facts) != platform_key(facts):
+            raise ValueError(f"Seed host {seed_facts.host} ({platform_key(seed_facts)}) "
+                             f"does not match target platform {platform_key(facts)}")
+        pkg_manager = seed_facts.package_manager
+        extension = PACKAGE_EXTENSIONS[pkg_manager]
+
+        # 临时目录由连接用户创建，以root下载的文件也可以通过SFTP取回
+        remote_dir = self.seed.run("mktemp -d", hide=True).stdout.strip()
+        try:
+            # 每个包下载到单独的子目录，以区分各包对应的文件
+            commands = ['set -e']
+            for index, name in enumerate(package_names):
+                dest = f"{remote_dir}/{index}"
+                commands.append(f"mkdir -p {dest}/partial")
+                commands.append(DOWNLOAD_COMMANDS[pkg_manager].format(dest=dest, package=shlex.quote(name)))
+            logger.info(f"Downloading {len(package_names)} packages on seed host {seed_facts.host}")
+            run_shell(self.seed, '\n'.join(commands), use_sudo, hide=True)
+
+            listing = self.seed.run(f"cd {remote_dir} && find . -mindepth 2 -maxdepth 2 -type f -name '*{extension}'",
+                                    hide=True).stdout
+            found: Dict[str, List[str]] = {name: [] for name in package_names}
+            for line in sorted(listing.split()):
+                index, filename = line[2:].split('/', 1)
+                local_path = os.path.join(work_dir, index, filename)
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                self.seed.get(f"{remote_dir}/{index}/{filename}", local_path)
+                found[package_names[int(index)]].append(local_path)
+            # 包不存在时 apt-get --download-only 也可能正常退出，不能把空的文件列表记录到缓存
+            for name, files in found.items():
+                if not files:
+                    raise FileNotFoundError(f"Package {name} could not be downloaded on seed host {seed_facts.host}")
+            return found
+        finally:
+            run_shell(self.seed, f"rm -rf {remote_dir}", use_sudo, hide=True, warn=True)
+
+    def resolve(self, facts: HostFacts, package_names: Iterable[str], use_sudo: bool = False) -> List[str]:
+        """
+        获取安装软件包所需的全部文件，未缓存的从本地仓库目录或种子主机获取并加入缓存
+
+        Args:
+            facts: 目标主机信息
+            package_names: 包名
+            use_sudo: 在种子主机上下载时是否使用sudo权限
+
+        Returns:
+            List[str]: 本地软件包文件路径（去重）
+
+        Raises:
+            RuntimeError: 没有配置软件包来源
+            FileNotFoundError: 本地仓库目录中找不到软件包，或种子主机上无法下载软件包
+            ValueError: 种子主机与目标主机平台不同
+        """
+        package_names = list(dict.fromkeys(package_names))
+        platform = platform_key(facts)
+        with self._lock:
+            cached = self.cached(facts, package_names)
+            missing = [name for name in package_names if name not in cached]
+            if cached:
+                logger.info(f"Package relay cache hit for {len(cached)} packages ({platform})")
+            if missing:
+                work_dir = None
+                try:
+                    if self.repo_dir:
+                        found = self._import_from_repo(facts, missing)
+                    elif self.seed is not None:
+                        work_dir = tempfile.mkdtemp()
+                        found = self._download_from_seed(facts, missing, use_sudo, work_dir)
+                    else:
+                        raise RuntimeError(f"No package source configured for {' '.join(missing)}")
+                    os.makedirs(os.path.join(self.cache_dir, platform), exist_ok=True)
+                    index = self._load_index(platform)
+                    for name, files in found.items():
+                        self._add(platform, index, name, files)
+                    self._save_index(platform, index)
+                finally:
+                    if work_dir:
+                        shutil.rmtree(work_dir, ignore_errors=True)
+                cached = self.cached(facts, package_names)
+
+        return list(dict.fromkeys(path for name in package_names for path in cached[name]))
+
+    @staticmethod
+    def local_install_cmd(facts: HostFacts, remote_files: Iterable[str]) -> str:
+        """
+        生成从本地软件包文件安装的命令
+
+        Args:
+            facts: 目标主机信息
+            remote_files: 远程软件包文件路径（已转义或shell表达式）
+
+        Returns:
+            str: 安装命令
+        """
+        return f"{LOCAL_INSTALL_COMMANDS[facts.package_manager]} {' '.join(remote_files)}"
+
+    def install(self, conn: "Connection", facts: HostFacts, package_names: Iterable[str],
+                use_sudo: bool = False) -> bool:
+        """
+        将软件包文件推送到目标主机并安装，传输和安装在一次远程调用中完成
+
+        Args:
+            conn: 目标主机连接
+            facts: 目标主机信息
+            package_names: 包名
+            use_sudo: 是否使用sudo权限
+
+        Returns:
+            bool: 安装是否成功
+        """
+        try:
+            files = self.resolve(facts, package_names, use_sudo)
+        except invoke.UnexpectedExit as e:
+            logger.error(f"Failed to download packages on seed host: {e.result.stderr.strip()}")
+            return False
+        except FileNotFoundError as e:
+            logger.error(str(e))
+            return False
+        if not files:
+            return True
+
+        names = [os.path.basename(path) for path in files]
+        script = "\n".join([
+            'tmp=$(mktemp -d) || exit 1',
+            'trap \'rm -rf "$tmp"\' EXIT',
+            'tar -xf - -C "$tmp" || exit 1',
+            'exec </dev/null',
+            self.local_install_cmd(facts, [f'"$tmp"/{shlex.quote(name)}' for name in names]),
+        ])
+
+        def write_bundle(stdin: BinaryIO):
+            with tarfile.open(fileobj=stdin, mode='w|') as tar:
+                for path, name in zip(files, names):
+                    tar.add(path, arcname=name)
+
+        logger.info(f"Installing {len(names)} package files from relay cache on {conn.host}")
+        exit_status, stdout, stderr = run_streaming(conn, script, write_bundle, use_sudo)
+        if exit_status != 0:
+            logger.error(f"Relay install failed on {conn.host} ({exit_status}): {(stderr or stdout).strip()}")
+            return False
+        return True
@@ -0,0 +1,135 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import List, Optional
+
+from .common import configure_logging, download_file, get_download_cache
+from .service_catalog import DEFAULT_SERVICE_ROOT, ServiceCatalog, get_service_catalog
+from .service_manager import DeployConfig
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PrefetchResult:
+    """单个制品的预取结果"""
+    service: str  # 服务名称
+    url: str  # 源路径
+    state: str  # 缓存状态：hit（已缓存）、downloaded（本次下载）、local（本地源，无需下载）、failed（失败）
+    size: int = 0  # 文件大小（字节）
+    elapsed: float = 0.0  # 耗时（秒）
+    error: Optional[str] = None  # 失败原因
+
+    @property
+    def throughput(self) -> float:
+        """下载速度（字节/秒），缓存命中时为0"""
+        if self.state != 'downloaded' or self.elapsed <= 0:
+            return 0.0
+        return self.size / self.elapsed
+
+
+def load_catalog(service_root: str = DEFAULT_SERVICE_ROOT) -> List[DeployConfig]:
+    """
+    通过服务目录索引获取服务目录下所有 */definitions.json 的部署配置，不合法的定义记录日志后跳过
+
+    Args:
+        service_root: 服务目录
+
+    Returns:
+        List[DeployConfig]: 部署配置列表
+    """
+    catalog = get_service_catalog()
+    if os.path.abspath(service_root) != catalog.service_root:
+        catalog = ServiceCatalog(service_root)
+    catalog.refresh()
+    return catalog.configs()
+
+
+def _prefetch_one(config: DeployConfig) -> PrefetchResult:
+    """下载单个部署配置的源文件到缓存，异常不会向上抛出而是记录在结果中"""
+    url = config.source_path
+    if not url.startswith(('http://', 'https://')):
+        return PrefetchResult(service=config.name, url=url, state='local')
+
+    cached = get_download_cache().contains(url, config.sha256)
+    start = time.monotonic()
+    try:
+        local_path = download_file(url, True, sha256=config.sha256)
+    except Exception as e:
+        return PrefetchResult(service=config.name, url=url, state='failed',
+                              elapsed=time.monotonic() - start, error=str(e))
+    return PrefetchResult(service=config.name, url=url, state='hit' if cached else 'downloaded',
+                          size=os.path.getsize(local_path), elapsed=time.monotonic() - start)
+
+
+def prefetch_catalog(service_root: str = DEFAULT_SERVICE_ROOT, max_workers: int = 4) -> List[PrefetchResult]:
+    """
+    并发下载服务目录中所有服务的源文件到下载缓存，部署时直接命中缓存
+
+    Args:
+        service_root: 服务目录
+        max_workers: 最大并发下载数
+
+    Returns:
+        List[PrefetchResult]: 每个服务的预取结果，顺序与服务名称排序一致
+    """
+    if max_workers < 1:
+        raise ValueError(f"max_workers must be positive: {max_workers}")
+    configs = load_catalog(service_root)
+    # 多个服务共用同一个源文件时只下载一次
+    unique = {}
+    for config in configs:
+        unique.setdefault((config.source_path, config.sha256), config)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetched = dict(zip(unique, executor.map(_prefetch_one, unique.values())))
+    return [replace(fetched[(config.source_path, config.sha256)], service=config.name) for config in configs]
+
+
+def _format_size(size: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def format_report(results: List[PrefetchResult]) -> str:
+    """
+    生成预取结果报告
+
+    Args:
+        results: 预取结果列表
+
+    Returns:
+        str: 报告文本
+    """
+    lines = [f"{'SERVICE':<16}{'STATE':<12}{'SIZE':>10}{'TIME':>9}{'SPEED':>12}  URL"]
+    for result in results:
+        speed = f"{_format_size(result.throughput)}/s" if result.throughput else '-'
+        lines.append(f"{result.service:<16}{result.state:<12}{_format_size(result.size):>10}"
+                     f"{result.elapsed:>8.2f}s{speed:>12}  {result.url}")
+        if result.error:
+            lines.append(f"{'':<16}error: {result.error}")
+    total = sum(result.size for result in results)
+    failed = sum(1 for result in results if result.state == 'failed')
+    lines.append(f"{len(results)} artifacts, {_format_size(total)}, {failed} failed")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="预取服务目录中所有服务的源文件到下载缓存")
+    parser.add_argument('service_root', nargs='?', default=DEFAULT_SERVICE_ROOT, help="服务目录")
+    parser.add_argument('-j', '--jobs', type=int, default=4, help="最大并发下载数")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    results = prefetch_catalog(args.service_root, args.jobs)
+    print(format_report(results))
+    return 1 if any(result.state == 'failed' for result in results) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,586 @@
+import base64
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from .common import STREAM_READY_MARKER
+from .lazy_import import lazy_import
+
+if TYPE_CHECKING:
+    from fabric import Connection
+    from fabric.runners import Result
+
+fabric = lazy_import('fabric')
+invoke = lazy_import('invoke')
+
+logger = logging.getLogger(__name__)
+
+# 录制 get 时保存文件内容的大小上限（字节），超过时回放只生成空文件
+MAX_RECORDED_DATA = 1024 * 1024
+
+# 根据调用方式、命令（或远程路径）和写入的字节数生成 (退出码, 标准输出, 标准错误)；get 的标准输出作为文件内容
+Responder = Callable[[str, str, int], Tuple[int, str, str]]
+
+
+class BudgetExceeded(AssertionError):
+    """操作的远程调用次数或传输字节数超过预算"""
+
+
+class ReplayMismatch(LookupError):
+    """回放时找不到与调用对应的录制记录"""
+
+
+@dataclass
+class NetworkProfile:
+    """模拟的网络条件"""
+    rtt: float = 0.0  # 往返时延（秒）
+    bandwidth: Optional[float] = None  # 带宽（字节/秒），None表示不限
+    handshake_rtts: int = 3  # 建立SSH连接需要的往返次数
+    sleep: bool = False  # 是否实际等待模拟的耗时，False时只累计到模拟时钟
+
+    def cost(self, nbytes: int = 0, round_trips: int = 1) -> float:
+        """
+        计算一次调用的模拟耗时
+
+        Args:
+            nbytes: 传输的字节数
+            round_trips: 往返次数
+
+        Returns:
+            float: 耗时（秒）
+        """
+        seconds = self.rtt * round_trips
+        if self.bandwidth:
+            seconds += nbytes / self.bandwidth
+        return seconds
+
+
+@dataclass
+class CallRecord:
+    """一次远程调用的记录"""
+    method: str  # 调用方式：run/sudo/put/get/stream
+    command: str  # 执行的命令，put/get 为远程路径
+    exit_code: int = 0  # 退出码
+    stdout: str = ''  # 标准输出
+    stderr: str = ''  # 标准错误
+    bytes_out: int = 0  # 发送到远程主机的字节数（上传文件、流式写入的标准输入）
+    bytes_in: int = 0  # 从远程主机接收的字节数（下载文件、命令输出）
+    elapsed: float = 0.0  # 模拟的网络耗时（秒）
+    data: Optional[str] = None  # get 下载的文件内容（base64），用于回放
+
+
+def pattern_responder(rules: List[Tuple[str, int, str, str]],
+                      default: Tuple[int, str, str] = (0, '', '')) -> Responder:
+    """
+    按正则表达式匹配命令生成响应
+
+    Args:
+        rules: (正则表达式, 退出码, 标准输出, 标准错误) 列表，按顺序匹配，第一个匹配的生效
+        default: 没有规则匹配时的响应
+
+    Returns:
+        Responder: 响应函数
+    """
+    compiled = [(re.compile(pattern), response) for pattern, *response in rules]
+
+    def respond(method: str, command: str, stdin_bytes: int) -> Tuple[int, str, str]:
+        for pattern, response in compiled:
+            if pattern.search(command):
+                return tuple(response)
+        return default
+    return respond
+
+
+class ReplaySession:
+    """
+    回放录制的会话：按调用顺序返回录制的结果
+
+    优先匹配方式和命令都相同的第一条未使用记录；命令中含有临时路径等每次运行都不同的内容时，
+    非严格模式下退回到方式相同的第一条未使用记录
+    """
+
+    def __init__(self, records: List[CallRecord], strict: bool = False):
+        """
+        初始化回放会话
+
+        Args:
+            records: 录制的调用记录
+            strict: 是否要求命令完全一致
+        """
+        self.records = list(records)
+        self.strict = strict
+        self._used = [False] * len(self.records)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, strict: bool = False) -> "ReplaySession":
+        """
+        读取 RecordingConnection.save 保存的会话
+
+        Args:
+            path: 会话文件路径
+            strict: 是否要求命令完全一致
+
+        Returns:
+            ReplaySession: 回放会话
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls([CallRecord(**record) for record in data['calls']], strict)
+
+    def respond(self, method: str, command: str) -> CallRecord:
+        """
+        获取调用对应的录制记录
+
+        Args:
+            method: 调用方式
+            command: 命令或远程路径
+
+        Returns:
+            CallRecord: 录制记录
+
+        Raises:
+            ReplayMismatch: 找不到对应的记录
+        """
+        with self._lock:
+            candidates = [i for i, record in enumerate(self.records) if not self._used[i] and record.method == method]
+            exact = [i for i in candidates if self.records[i].command == command]
+            if exact:
+                index = exact[0]
+            elif candidates and not self.strict:
+                index = candidates[0]
+            else:
+                raise ReplayMismatch(f"No recorded {method} call for: {command}")
+            self._used[index] = True
+            return self.records[index]
+
+    @property
+    def remaining(self) -> int:
+        """未使用的记录数"""
+        with self._lock:
+            return self._used.count(False)
+
+
+class _FakeTransport:
+    """模拟的SSH传输层"""
+
+    def __init__(self, conn: "RecordingConnection"):
+        self.conn = conn
+
+    def is_active(self) -> bool:
+        return self.conn.is_connected
+
+    def set_keepalive(self, interval: int):
+        pass
+
+    def open_session(self) -> "_RecordingChannel":
+        return _RecordingChannel(self.conn)
+
+
+class _FakeClient:
+    def __init__(self, conn: "RecordingConnection"):
+        self.conn = conn
+
+    def get_transport(self):
+        if self.conn.backend is not None:
+            return _RecordingTransport(self.conn)
+        return _FakeTransport(self.conn)
+
+
+class _RecordingTransport:
+    """包装真实传输层，记录直接打开的SSH通道"""
+
+    def __init__(self, conn: "RecordingConnection"):
+        self.conn = conn
+
+    def open_session(self) -> "_RecordingChannel":
+        return _RecordingChannel(self.conn, self.conn.backend.client.get_transport().open_session())
+
+
+class _CountingStdin:
+    def __init__(self, channel: "_RecordingChannel", fileobj: Optional[BinaryIO]):
+        self.channel = channel
+        self.fileobj = fileobj
+
+    def write(self, data) -> int:
+        if self.fileobj is not None:
+            self.fileobj.write(data)
+        self.channel.stdin_bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        if self.fileobj is not None:
+            self.fileobj.flush()
+
+
+class _ChannelOutput:
+    """
+    通道的输出流：有真实通道时读取并记录真实输出，否则等待标准输入写完、生成结果之后再返回。
+    读取可能在写入标准输入的同时在其他线程中进行，创建时不读取
+    """
+
+    def __init__(self, channel: "_RecordingChannel", name: str, real: Optional[BinaryIO] = None):
+        self.channel = channel
+        self.name = name
+        self.real = real
+
+    def read(self, size: int = -1) -> bytes:
+        if self.real is not None:
+            setattr(self.channel, self.name, self.real.read())
+        else:
+            self.channel._responded.wait()
+        return getattr(self.channel, self.name)
+
+
+class _RecordingChannel:
+    """
+    记录流式调用（如 run_streaming）的SSH通道，有真实通道时透传，否则按回放或响应函数生成结果
+
+    通道关闭时记录一次 stream 调用
+    """
+
+    def __init__(self, conn: "RecordingConnection", real: Any = None):
+        self.conn = conn
+        self.real = real
+        self.command = ''
+        self.stdin_bytes = 0
+        self._record: Optional[CallRecord] = None
+        self._stdout = b''
+        self._stderr = b''
+        self._exit_code = -1
+        self._closed = False
+        self._ready_sent = False
+        self._responded = threading.Event()
+
+    def exec_command(self, command: str):
+        self.command = command
+        if self.real is not None:
+            self.real.exec_command(command)
+
+    def makefile_stdin(self, mode: str = 'wb') -> _CountingStdin:
+        return _CountingStdin(self, self.real.makefile_stdin(mode) if self.real is not None else None)
+
+    def sendall(self, data: bytes):
+        # sudo密码不计入传输的数据量
+        if self.real is not None:
+            self.real.sendall(data)
+
+    def recv_stderr(self, nbytes: int) -> bytes:
+        if self.real is not None:
+            return self.real.recv_stderr(nbytes)
+        # 模拟远程脚本开始执行（见 run_streaming 使用sudo时的就绪标记）
+        if STREAM_READY_MARKER in self.command and not self._ready_sent:
+            self._ready_sent = True
+            return f"{STREAM_READY_MARKER}\n".encode()
+        return b''
+
+    def shutdown_write(self):
+        if self.real is not None:
+            self.real.shutdown_write()
+            return
+        record = self.conn._respond('stream', self.command, self.stdin_bytes)
+        self._exit_code = record.exit_code
+        self._stdout, self._stderr = record.stdout.encode(), record.stderr.encode()
+        self._responded.set()
+
+    def makefile(self, mode: str = 'rb') -> _ChannelOutput:
+        return _ChannelOutput(self, '_stdout', self.real.makefile(mode) if self.real is not None else None)
+
+    def makefile_stderr(self, mode: str = 'rb') -> _ChannelOutput:
+        return _ChannelOutput(self, '_stderr', self.real.makefile_stderr(mode) if self.real is not None else None)
+
+    def recv_exit_status(self) -> int:
+        if self.real is not None:
+            self._exit_code = self.real.recv_exit_status()
+        return self._exit_code
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        # 未写完标准输入就关闭时，等待输出的读取线程不再阻塞
+        self._responded.set()
+        if self.real is not None:
+            self.real.close()
+        stdout, stderr = self._stdout.decode(errors='replace'), self._stderr.decode(errors='replace')
+        self.conn._record(CallRecord('stream', self.command, self._exit_code, stdout, stderr,
+                                     bytes_out=self.stdin_bytes, bytes_in=len(self._stdout) + len(self._stderr)))
+
+
+class RecordingConnection:
+    """
+    记录远程调用的 Connection 替身
+
+    记录每次 run/sudo/put/get 及直接打开SSH通道的流式调用，并按网络条件模拟往返时延和带宽。
+    调用结果的来源按优先级为：
+    - backend：真实连接，调用透传并记录结果，可保存为会话文件
+    - replay：回放录制的会话，无需真实主机即可重复执行部署逻辑
+    - responder：按命令生成结果的函数；都未指定时所有命令成功且无输出
+
+    可以直接传给 ServiceManagerOperator、PackageManagerOperator 等，
+    或作为 FleetDeployer / ConnectionPool 的 connection_factory 的返回值
+    """
+
+    def __init__(self,
+                 host: str = 'fake-host',
+                 user: str = 'root',
+                 port: int = 22,
+                 profile: Optional[NetworkProfile] = None,
+                 backend: Optional["Connection"] = None,
+                 replay: Optional[ReplaySession] = None,
+                 responder: Optional[Responder] = None):
+        """
+        初始化记录连接
+
+        Args:
+            host: 主机地址，有真实连接时使用真实连接的主机
+            user: 连接用户
+            port: 端口
+            profile: 模拟的网络条件，默认不模拟时延
+            backend: 真实连接（可选）
+            replay: 回放会话（可选）
+            responder: 响应函数（可选）
+        """
+        if backend is not None:
+            host, user, port = backend.host, backend.user, backend.port
+        self.host = host
+        self.user = user
+        self.port = port
+        self.profile = profile or NetworkProfile()
+        self.backend = backend
+        self.replay = replay
+        self.responder = responder
+        self.config = backend.config if backend is not None else fabric.Config()
+        self.calls: List[CallRecord] = []
+        self.handshakes = 0
+        self.clock = 0.0  # 累计的模拟网络耗时（秒）
+        self._connected = False
+        self._lock = threading.Lock()
+
+    # ---- 连接状态 ----
+
+    @property
+    def is_connected(self) -> bool:
+        if self.backend is not None:
+            return self.backend.is_connected
+        return self._connected
+
+    @property
+    def transport(self):
+        if self.backend is not None:
+            return self.backend.transport
+        return _FakeTransport(self) if self._connected else None
+
+    @property
+    def client(self) -> _FakeClient:
+        return _FakeClient(self)
+
+    def open(self):
+        """建立连接，已连接时不产生开销"""
+        if self.is_connected:
+            return
+        if self.backend is not None:
+            self.backend.open()
+        self._connected = True
+        self._wait(self.profile.cost(round_trips=self.profile.handshake_rtts))
+        with self._lock:
+            self.handshakes += 1
+
+    def close(self):
+        """关闭连接"""
+        if self.backend is not None:
+            self.backend.close()
+        self._connected = False
+
+    # ---- 记录与模拟 ----
+
+    def _wait(self, seconds: float):
+        with self._lock:
+            self.clock += seconds
+        if self.profile.sleep and seconds > 0:
+            time.sleep(seconds)
+
+    def _record(self, record: CallRecord):
+        """记录一次调用，并按网络条件计入模拟耗时"""
+        record.elapsed = self.profile.cost(record.bytes_out + record.bytes_in)
+        self._wait(record.elapsed)
+        with self._lock:
+            self.calls.append(record)
+
+    def _respond(self, method: str, command: str, stdin_bytes: int = 0) -> CallRecord:
+        """从回放会话或响应函数生成调用结果（不记录）"""
+        if self.replay is not None:
+            return self.replay.respond(method, command)
+        if self.responder is not None:
+            exit_code, stdout, stderr = self.responder(method, command, stdin_bytes)
+        else:
+            exit_code, stdout, stderr = 0, '', ''
+        data = base64.b64encode(stdout.encode()).decode() if method == 'get' else None
+        return CallRecord(method, command, exit_code, stdout, stderr, data=data)
+
+    def _execute(self, method: str, command: str, **kwargs) -> "Result":
+        self.open()
+        if self.backend is not None:
+            try:
+                result = getattr(self.backend, method)(command, **kwargs)
+            except invoke.UnexpectedExit as e:
+                result = e.result
+                self._record(CallRecord(method, command, result.exited, result.stdout, result.stderr,
+                                        bytes_in=len(result.stdout) + len(result.stderr)))
+                raise
+            self._record(CallRecord(method, command, result.exited, result.stdout, result.stderr,
+                                    bytes_in=len(result.stdout) + len(result.stderr)))
+            return result
+
+        record = self._respond(method, command)
+        self._record(CallRecord(method, command, record.exit_code, record.stdout, record.stderr,
+                                bytes_in=len(record.stdout) + len(record.stderr)))
+        result = fabric.Result(connection=self, command=command, stdout=record.stdout, stderr=record.stderr,
+                        exited=record.exit_code, hide=('stdout', 'stderr') if kwargs.get('hide') else ())
+        if not result.ok and not kwargs.get('warn'):
+            raise invoke.UnexpectedExit(result)
+        return result
+
+    def run(self, command: str, **kwargs) -> "Result":
+        """执行命令，参数与 Connection.run 相同"""
+        return self._execute('run', command, **kwargs)
+
+    def sudo(self, command: str, **kwargs) -> "Result":
+        """以sudo执行命令，参数与 Connection.sudo 相同"""
+        return self._execute('sudo', command, **kwargs)
+
+    def put(self, local: Union[str, BinaryIO], remote: Optional[str] = None, preserve_mode: bool = True):
+        """上传文件，参数与 Connection.put 相同"""
+        if isinstance(local, str):
+            size = os.path.getsize(local)
+            name = os.path.basename(local)
+        else:
+            position = local.tell()
+            size = local.seek(0, os.SEEK_END) - position
+            local.seek(position)
+            name = ''
+        remote_path = remote or name
+        self.open()
+        if self.backend is not None:
+            result = self.backend.put(local, remote=remote, preserve_mode=preserve_mode)
+        else:
+            record = self._respond('put', remote_path, size)
+            if record.exit_code != 0:
+                raise OSError(f"Upload to {remote_path} failed: {record.stderr.strip()}")
+            result = fabric.transfer.Result(local=local, orig_local=local, remote=remote_path, orig_remote=remote,
+                                    connection=self)
+        self._record(CallRecord('put', remote_path, bytes_out=size))
+        return result
+
+    def get(self, remote: str, local: Optional[str] = None, preserve_mode: bool = True):
+        """下载文件，参数与 Connection.get 相同（local 只支持路径）"""
+        local = local or os.path.basename(remote)
+        self.open()
+        if self.backend is not None:
+            result = self.backend.get(remote, local=local, preserve_mode=preserve_mode)
+            size = os.path.getsize(local)
+            data = None
+            if size <= MAX_RECORDED_DATA:
+                with open(local, 'rb') as f:
+                    data = base64.b64encode(f.read()).decode()
+            self._record(CallRecord('get', remote, bytes_in=size, data=data))
+            return result
+
+        record = self._respond('get', remote)
+        if record.exit_code != 0:
+            raise FileNotFoundError(f"Download of {remote} failed: {record.stderr.strip()}")
+        content = base64.b64decode(record.data) if record.data else b''
+        with open(local, 'wb') as f:
+            f.write(content)
+        self._record(CallRecord('get', remote, bytes_in=len(content), data=record.data))
+        return fabric.transfer.Result(local=local, orig_local=local, remote=remote, orig_remote=remote, connection=self)
+
+    # ---- 统计与预算 ----
+
+    @property
+    def round_trips(self) -> int:
+        """已记录的远程调用次数"""
+        return len(self.calls)
+
+    def summary(self, start: int = 0) -> Dict[str, Any]:
+        """
+        汇总记录的调用
+
+        Args:
+            start: 从第几条记录开始汇总
+
+        Returns:
+            Dict[str, Any]: 包含 round_trips、by_method、bytes_out、bytes_in、simulated_seconds、handshakes
+        """
+        with self._lock:
+            calls = self.calls[start:]
+            by_method: Dict[str, int] = {}
+            for call in calls:
+                by_method[call.method] = by_method.get(call.method, 0) + 1
+            return {
+                'round_trips': len(calls),
+                'by_method': by_method,
+                'bytes_out': sum(call.bytes_out for call in calls),
+                'bytes_in': sum(call.bytes_in for call in calls),
+                'simulated_seconds': sum(call.elapsed for call in calls),
+                'handshakes': self.handshakes,
+            }
+
+    @contextmanager
+    def budget(self, max_round_trips: Optional[int] = None, max_bytes: Optional[int] = None,
+               label: str = 'operation') -> Iterator[Dict[str, Any]]:
+        """
+        限制一段操作的远程调用次数和传输字节数，超过时在退出时抛出 BudgetExceeded
+
+        在退出时而不是超出时检查，避免异常被部署代码中的 except 捕获
+
+        Args:
+            max_round_trips: 最大远程调用次数，None表示不限制
+            max_bytes: 最大传输字节数（上传和下载之和），None表示不限制
+            label: 操作名称，用于错误信息
+
+        Yields:
+            Dict[str, Any]: 操作结束后填入的汇总信息（见 summary）
+
+        Raises:
+            BudgetExceeded: 超过预算
+        """
+        start = len(self.calls)
+        usage: Dict[str, Any] = {}
+        yield usage
+        usage.update(self.summary(start))
+        problems = []
+        if max_round_trips is not None and usage['round_trips'] > max_round_trips:
+            problems.append(f"{usage['round_trips']} round trips > budget {max_round_trips}")
+        transferred = usage['bytes_out'] + usage['bytes_in']
+        if max_bytes is not None and transferred > max_bytes:
+            problems.append(f"{transferred} bytes > budget {max_bytes}")
+        if problems:
+            commands = '\n'.join(f"  {call.method}: {call.command[:120]}" for call in self.calls[start:])
+            raise BudgetExceeded(f"{label} on {self.host}: {', '.join(problems)}\n{commands}")
+
+    def save(self, path: str):
+        """
+        保存记录的调用为会话文件，供 ReplaySession 回放
+
+        Args:
+            path: 会话文件路径
+        """
+        with self._lock:
+            data = {'host': self.host, 'user': self.user, 'port': self.port,
+                    'calls': [asdict(call) for call in self.calls]}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    def reset(self):
+        """清空记录和模拟时钟"""
+        with self._lock:
+            self.calls.clear()
+            self.clock = 0.0
+            self.handshakes = 0
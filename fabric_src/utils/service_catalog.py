@@ -0,0 +1,320 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
+
+from .common import configure_logging
+from .deploy_schema import schema_fingerprint
+from .service_manager import DeployConfig, ServiceSource
+
+logger = logging.getLogger(__name__)
+
+# 默认的服务目录（fabric_src/service）
+DEFAULT_SERVICE_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'service')
+
+# 服务定义文件名
+DEFINITIONS_NAME = 'definitions.json'
+
+
+@dataclass
+class CatalogEntry:
+    """服务目录中的一个服务定义"""
+    path: str  # definitions.json 的绝对路径
+    size: int  # 文件大小
+    mtime_ns: int  # 修改时间（纳秒）
+    data: Optional[Dict[str, Any]] = None  # 已通过校验的JSON内容
+    error: Optional[str] = None  # 解析或校验失败的原因
+
+    @property
+    def service_dir(self) -> str:
+        """服务目录"""
+        return os.path.dirname(self.path)
+
+
+class ServiceCatalog:
+    """
+    服务目录索引
+
+    扫描服务根目录下所有 */definitions.json，按路径、大小和修改时间缓存校验结果并写入索引文件，
+    未变化的定义文件不会重新读取和校验；JSON Schema 变化时索引整体失效。
+    配置按 DeployConfig.from_service_dir 的规则创建（deploy 目录作为合并配置目录）
+    """
+
+    INDEX_VERSION = 1
+
+    def __init__(self, service_root: str = DEFAULT_SERVICE_ROOT, index_file: Optional[str] = None):
+        """
+        初始化服务目录索引，不会立即扫描
+
+        Args:
+            service_root: 服务根目录
+            index_file: 索引文件路径，如果为None则使用默认路径（每个服务根目录一个索引文件）
+        """
+        self.service_root = os.path.abspath(service_root)
+        if index_file is None:
+            root_key = hashlib.sha256(self.service_root.encode()).hexdigest()[:16]
+            index_file = os.path.expanduser(f"~/.fabric_cache/service_catalog/{root_key}.json")
+        self.index_file = index_file
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._configs: Dict[str, DeployConfig] = {}
+        self._by_source_type: Dict[ServiceSource, List[str]] = {}
+        self._by_dependency: Dict[str, List[str]] = {}
+        self._loaded = False
+        self._dirty = False
+        self.stats = {'scanned': 0, 'parsed': 0, 'reused': 0, 'invalid': 0}
+
+    def _load_index(self):
+        """读取索引文件，版本或 Schema 不一致时丢弃"""
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if (index.get('version') != self.INDEX_VERSION or index.get('schema') != schema_fingerprint()
+                or index.get('root') != self.service_root):
+            return
+        self._entries = {path: CatalogEntry(**entry) for path, entry in index.get('entries', {}).items()}
+
+    def _parse(self, path: str, stat: os.stat_result) -> CatalogEntry:
+        """读取并校验定义文件"""
+        entry = CatalogEntry(path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            DeployConfig.validate(data)
+            entry.data = data
+        except json.JSONDecodeError as e:
+            entry.error = f"Invalid JSON format: {str(e)}"
+        except (ValueError, OSError) as e:
+            entry.error = str(e)
+        return entry
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        重新扫描服务根目录，只解析新增或变化的定义文件，索引有变化时写回磁盘
+
+        Returns:
+            Dict[str, int]: 统计信息，包括 scanned（定义文件数）、parsed（重新解析数）、
+                reused（复用索引数）、invalid（不合法的定义数）
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load_index()
+                self._loaded = True
+
+            stats = dict.fromkeys(self.stats, 0)
+            entries: Dict[str, CatalogEntry] = {}
+            try:
+                names = sorted(os.listdir(self.service_root))
+            except FileNotFoundError:
+                names = []
+            for name in names:
+                path = os.path.join(self.service_root, name, DEFINITIONS_NAME)
+                try:
+                    stat = os.stat(path)
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
+                stats['scanned'] += 1
+                entry = self._entries.get(path)
+                if entry is not None and entry.size == stat.st_size and entry.mtime_ns == stat.st_mtime_ns:
+                    stats['reused'] += 1
+                else:
+                    entry = self._parse(path, stat)
+                    stats['parsed'] += 1
+                entries[path] = entry
+
+            if entries.keys() != self._entries.keys() or stats['parsed']:
+                self._dirty = True
+            self._entries = entries
+            self._build_lookups(stats)
+            self.stats = stats
+            self._save()
+            return dict(stats)
+
+    def _build_lookups(self, stats: Dict[str, int]):
+        """根据索引条目创建配置对象和查找表"""
+        configs: Dict[str, DeployConfig] = {}
+        by_source_type: Dict[ServiceSource, List[str]] = {}
+        by_dependency: Dict[str, List[str]] = {}
+        for entry in self._entries.values():
+            if entry.data is not None:
+                try:
+                    config = DeployConfig.from_definition(entry.data, entry.path, validate=False)
+                except (ValueError, TypeError) as e:
+                    config = None
+                    entry.error = str(e)
+            else:
+                config = None
+            if config is None:
+                stats['invalid'] += 1
+                logger.error(f"Skip invalid definition {entry.path}: {entry.error.splitlines()[0]}")
+                continue
+            config.merge_config_dir = os.path.join(entry.service_dir, 'deploy')
+            if config.name in configs:
+                logger.warning(f"Duplicate service name {config.name} in {entry.path}, ignored")
+                continue
+            configs[config.name] = config
+            by_source_type.setdefault(config.source_type, []).append(config.name)
+            for dependency in config.dependencies or []:
+                by_dependency.setdefault(dependency, []).append(config.name)
+        self._configs = configs
+        self._by_source_type = by_source_type
+        self._by_dependency = by_dependency
+
+    def _save(self):
+        """将索引写回磁盘"""
+        if not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(self.index_file), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({
+                        'version': self.INDEX_VERSION,
+                        'schema': schema_fingerprint(),
+                        'root': self.service_root,
+                        'entries': {path: entry.__dict__ for path, entry in self._entries.items()},
+                    }, f, ensure_ascii=False)
+                os.replace(temp_file, self.index_file)
+            except BaseException:
+                os.unlink(temp_file)
+                raise
+            self._dirty = False
+        except OSError as e:
+            logger.warning(f"Failed to save service catalog index {self.index_file}: {str(e)}")
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.refresh()
+
+    def configs(self) -> List[DeployConfig]:
+        """
+        获取所有合法的部署配置
+
+        Returns:
+            List[DeployConfig]: 按定义文件路径排序的部署配置列表
+        """
+        self._ensure_loaded()
+        return list(self._configs.values())
+
+    def names(self) -> List[str]:
+        """获取所有服务名称"""
+        self._ensure_loaded()
+        return list(self._configs)
+
+    def get(self, name: str) -> Optional[DeployConfig]:
+        """
+        按服务名称查找部署配置
+
+        Args:
+            name: 服务名称
+
+        Returns:
+            Optional[DeployConfig]: 部署配置，不存在时返回None
+        """
+        self._ensure_loaded()
+        return self._configs.get(name)
+
+    def by_source_type(self, source_type: Union[ServiceSource, str]) -> List[DeployConfig]:
+        """
+        按源类型查找部署配置
+
+        Args:
+            source_type: 源类型，可以是 ServiceSource 或其值（如 "http"）
+
+        Returns:
+            List[DeployConfig]: 部署配置列表
+        """
+        self._ensure_loaded()
+        return [self._configs[name] for name in self._by_source_type.get(ServiceSource(source_type), [])]
+
+    def by_dependency(self, package_name: str) -> List[DeployConfig]:
+        """
+        查找依赖指定软件包的部署配置
+
+        Args:
+            package_name: 软件包名称
+
+        Returns:
+            List[DeployConfig]: 部署配置列表
+        """
+        self._ensure_loaded()
+        return [self._configs[name] for name in self._by_dependency.get(package_name, [])]
+
+    def errors(self) -> Dict[str, str]:
+        """
+        获取不合法的定义文件
+
+        Returns:
+            Dict[str, str]: 定义文件路径到错误原因（完整的校验信息）的映射
+        """
+        self._ensure_loaded()
+        return {path: entry.error for path, entry in self._entries.items() if entry.error}
+
+
+# 全局共享的服务目录索引
+_catalog: Optional[ServiceCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_service_catalog() -> ServiceCatalog:
+    """
+    获取全局共享的服务目录索引（默认服务根目录）
+
+    Returns:
+        ServiceCatalog: 服务目录索引
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ServiceCatalog()
+        return _catalog
+
+
+def set_service_catalog(catalog: ServiceCatalog):
+    """
+    替换全局共享的服务目录索引，例如使用其他服务根目录
+
+    Args:
+        catalog: 服务目录索引
+    """
+    global _catalog
+    with _catalog_lock:
+        _catalog = catalog
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="列出并校验服务目录下的所有服务定义")
+    parser.add_argument('service_root', nargs='?', default=DEFAULT_SERVICE_ROOT, help="服务目录")
+    parser.add_argument('--source-type', choices=[source.value for source in ServiceSource], help="按源类型过滤")
+    parser.add_argument('--dependency', help="只列出依赖指定软件包的服务")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    catalog = ServiceCatalog(args.service_root)
+    stats = catalog.refresh()
+    configs = catalog.configs()
+    if args.source_type:
+        configs = [config for config in configs if config in catalog.by_source_type(args.source_type)]
+    if args.dependency:
+        configs = [config for config in configs if config in catalog.by_dependency(args.dependency)]
+
+    for config in configs:
+        print(f"{config.name:<16}{config.source_type.value:<12}{config.source_path}")
+    for path, error in catalog.errors().items():
+        print(f"INVALID {path}: {error.splitlines()[0]}")
+    print(f"{stats['scanned']} definitions, {stats['parsed']} parsed, {stats['reused']} from index, "
+          f"{stats['invalid']} invalid")
+    return 1 if stats['invalid'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
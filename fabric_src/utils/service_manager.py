@@ -1,21 +1,43 @@
 import logging
 import json
 from pathlib import Path
-from fabric import Connection
-from invoke import UnexpectedExit
 from enum import Enum
-from typing import Dict, Optional, Union, Tuple, List, Any
-from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Optional, Union, Tuple, List, Any
+from dataclasses import asdict, dataclass
+import io
 import os
+import shlex
+import tarfile
 import tempfile
-import requests
+import time
 from urllib.parse import urlparse, unquote
-from .common import extract_archive
+from .archive_codec import (CODEC_PROFILES, CODECS, Codec, codec_for_path, get_codec, known_link_speed,
+                            measure_link_speed, probe_remote_codecs, select_codec)
+from .batch_script import BatchScript, BatchStepError, ScriptStep, StepResult
+from .common import (RoundTripCounter, cleanup_archive, download_file, get_download_cache, prepare_archive,
+                     run_shell, run_streaming, stream_archive, upload_archive)
+from .config_sync import build_local_manifest, fetch_remote_manifest, sync_config_dir
+from .deploy_plan import DeployPlan, PlanAction
+from .deploy_schema import LazyDeploySchema, get_deploy_validator
+from .deploy_stamp import DeployStamp, read_remote_stamp, stamp_write_cmd, write_remote_stamp
+from .downloader import get_downloader
+from .host_facts import get_facts, get_facts_cache, host_key
+from .lazy_import import lazy_import
 from .package_manager import PackageManagerOperator
-import jsonschema
+from .package_relay import PackageRelay
+from .tracing import get_tracer
+
+if TYPE_CHECKING:
+    from fabric import Connection
+
+invoke = lazy_import('invoke')
+jsonschema = lazy_import('jsonschema')
 
 logger = logging.getLogger(__name__)
 
+# 部署计划中的操作对象与 timings 中耗时名称的对应关系
+PLAN_TIMING_KEYS = {'source': 'extract', 'config': 'config'}
+
 
 class ServiceManager(Enum):
     """服务管理器类型枚举"""
@@ -106,29 +128,33 @@ class DeployConfig:
     restart_sec: int = 3  # 重启间隔
     source_type: Optional[ServiceSource] = None  # 源类型（可选，如果不指定则自动检测）
     binary: str = None  # 可执行文件路径（可选，如果不指定则自动检测）
+    stream_transfer: bool = False  # 是否流式传输归档（tar over SSH，不产生临时文件）
+    sync_config: bool = False  # 合并配置目录是否按清单增量同步
+    sync_delete: bool = False  # 增量同步时是否删除本地已不存在的文件
+    sha256: str = None  # 源文件的sha256（可选），下载时校验
+    compression: str = None  # 传输压缩编解码器（none/gzip/xz/zstd），不指定则根据链路速度自动选择
+    compression_level: int = None  # 压缩级别（可选）
+    batch: bool = False  # 是否将部署步骤编译为一个脚本，在一次远程调用中执行
+    check_script: str = None  # 健康检查脚本（可选），在安装目录中执行，退出码为0表示服务健康
+
+    # JSON Schema，与 service/deploy_schema.json 保持一致，首次访问时读取
+    SCHEMA = LazyDeploySchema()
 
-    # JSON Schema for validation
-    SCHEMA = {
-        "type": "object",
-        "required": ["name", "description", "exec_start", "source_path", "install_path"],
-        "properties": {
-            "name": {"type": "string", "pattern": "^[a-zA-Z0-9_-]+$"},
-            "description": {"type": "string"},
-            "exec_start": {"type": "string"},
-            "source_path": {"type": "string"},
-            "install_path": {"type": "string", "pattern": "^/"},
-            "user": {"type": "string"},
-            "merge_config_dir": {"type": ["string", "null"]},
-            "dependencies": {
-                "type": ["array", "null"],
-                "items": {"type": "string"}
-            },
-            "use_sudo": {"type": "boolean"},
-            "after": {"type": "string"},
-            "restart": {"type": "string"},
-            "restart_sec": {"type": "integer", "minimum": 1}
-        }
-    }
+    @classmethod
+    def validate(cls, config_data: Dict[str, Any]):
+        """
+        使用预编译的校验器验证配置
+
+        Args:
+            config_data: 配置字典
+
+        Raises:
+            ValueError: 配置不符合 JSON Schema
+        """
+        try:
+            get_deploy_validator().validate(config_data)
+        except jsonschema.exceptions.ValidationError as e:
+            raise ValueError(f"Invalid configuration: {str(e)}")
 
     @classmethod
     def from_json(cls, json_path: Union[str, Path]) -> "DeployConfig":
@@ -149,27 +175,7 @@ class DeployConfig:
             # 读取JSON文件
             with open(json_path, 'r', encoding='utf-8') as f:
                 config_data = json.load(f)
-
-            # 验证JSON Schema
-            jsonschema.validate(instance=config_data, schema=cls.SCHEMA)
-
-            # 处理相对路径
-            json_dir = Path(json_path).parent
-
-            # 处理source_path
-            if not (config_data['source_path'].startswith('/') or
-                    config_data['source_path'].startswith('http://') or
-                    config_data['source_path'].startswith('https://') or
-                    config_data['source_path'].startswith('file://')):
-                config_data['source_path'] = str(json_dir / config_data['source_path'])
-
-            # 处理merge_config_dir
-            if config_data.get('merge_config_dir'):
-                if not config_data['merge_config_dir'].startswith('/'):
-                    config_data['merge_config_dir'] = str(json_dir / config_data['merge_config_dir'])
-
-            # 创建配置对象
-            return cls(**config_data)
+            return cls.from_definition(config_data, json_path)
 
         except FileNotFoundError:
             raise FileNotFoundError(f"Configuration file not found: {json_path}")
@@ -178,6 +184,46 @@ class DeployConfig:
         except Exception as e:
             raise ValueError(f"Error loading configuration: {str(e)}")
 
+    @classmethod
+    def from_definition(cls, config_data: Dict[str, Any], json_path: Union[str, Path],
+                        validate: bool = True) -> "DeployConfig":
+        """
+        从已读取的 definitions.json 内容创建部署配置，相对路径以JSON文件所在目录为基准
+
+        Args:
+            config_data: JSON文件内容
+            json_path: JSON文件路径
+            validate: 是否验证JSON Schema（服务目录索引中已验证过的内容可跳过）
+
+        Returns:
+            DeployConfig: 部署配置对象
+
+        Raises:
+            ValueError: 配置不符合 JSON Schema
+        """
+        config_data = dict(config_data)
+        # 验证JSON Schema
+        if validate:
+            cls.validate(config_data)
+
+        # 处理相对路径
+        json_dir = Path(json_path).parent
+
+        # 处理source_path
+        if not (config_data['source_path'].startswith('/') or
+                config_data['source_path'].startswith('http://') or
+                config_data['source_path'].startswith('https://') or
+                config_data['source_path'].startswith('file://')):
+            config_data['source_path'] = str(json_dir / config_data['source_path'])
+
+        # 处理merge_config_dir
+        if config_data.get('merge_config_dir'):
+            if not config_data['merge_config_dir'].startswith('/'):
+                config_data['merge_config_dir'] = str(json_dir / config_data['merge_config_dir'])
+
+        # 创建配置对象
+        return cls(**config_data)
+
     @classmethod
     def from_dict(cls, config_dict: Dict[str, Any]) -> "DeployConfig":
         """
@@ -190,13 +236,32 @@ class DeployConfig:
             DeployConfig: 部署配置对象
         """
         # 验证JSON Schema
-        try:
-            jsonschema.validate(instance=config_dict, schema=cls.SCHEMA)
-        except jsonschema.exceptions.ValidationError as e:
-            raise ValueError(f"Invalid configuration: {str(e)}")
-
+        cls.validate(config_dict)
         return cls(**config_dict)
 
+    @classmethod
+    def from_service_dir(cls, service_dir: Union[str, Path]) -> "DeployConfig":
+        """
+        从服务目录创建部署配置，服务目录下的 deploy 目录作为合并配置目录
+
+        Args:
+            service_dir: 服务目录（包含 definitions.json）
+
+        Returns:
+            DeployConfig: 部署配置对象
+
+        Raises:
+            FileNotFoundError: definitions.json 不存在
+        """
+        definitions_path = os.path.join(service_dir, 'definitions.json')
+        # 判断定义文件是否存在
+        if not os.path.exists(definitions_path):
+            raise FileNotFoundError(f"Service definitions.json not found in {service_dir}")
+
+        config = cls.from_json(definitions_path)
+        config.merge_config_dir = os.path.join(service_dir, 'deploy')
+        return config
+
     def __post_init__(self):
         """初始化后处理，验证路径和设置源类型"""
         # 验证安装路径
@@ -209,6 +274,10 @@ class DeployConfig:
             if not local_path.startswith('/'):
                 raise ValueError(f"Local source path must be absolute: {local_path}")
 
+        # 验证压缩级别是否在编解码器支持的范围内
+        if self.compression in CODECS:
+            CODECS[self.compression].check_level(self.compression_level)
+
         # 自动检测源类型
         if self.source_type is None:
             self.source_type = ServiceSource.detect_source_type(self.source_path)
@@ -231,7 +300,7 @@ class ServiceManagerDetector:
     """服务管理器检测器"""
 
     @staticmethod
-    def detect(conn: Connection) -> ServiceManager:
+    def detect(conn: "Connection") -> ServiceManager:
         """检测远程系统使用的服务管理器类型"""
         try:
             result = conn.run(
@@ -252,7 +321,7 @@ class ServiceManagerDetector:
                 return ServiceManager.SERVICE
             else:
                 return ServiceManager.UNKNOWN
-        except UnexpectedExit:
+        except invoke.UnexpectedExit:
             return ServiceManager.UNKNOWN
 
 
@@ -266,7 +335,8 @@ class ServiceManagerCommands:
             "status": "systemctl status",
             "enable": "systemctl enable",
             "disable": "systemctl disable",
-            "reload": "systemctl daemon-reload"
+            "reload": "systemctl daemon-reload",
+            "is_active": "systemctl is-active --quiet"
         },
         ServiceManager.SERVICE: {
             "start": "service start",
@@ -274,7 +344,8 @@ class ServiceManagerCommands:
             "restart": "service restart",
             "status": "service status",
             "enable": "chkconfig on",
-            "disable": "chkconfig off"
+            "disable": "chkconfig off",
+            "is_active": "service status"
         }
     }
 
@@ -307,12 +378,39 @@ class ServiceManagerOperator:
         'kubelet',  # Kubernetes服务
     }
 
-    def __init__(self, conn: Connection):
+    def __init__(self, conn: "Connection", link_speed: Optional[float] = None, cpu_budget: Optional[float] = None,
+                 package_relay: Optional[PackageRelay] = None):
+        """
+        初始化服务管理器操作类
+
+        Args:
+            conn: Fabric连接对象
+            link_speed: 到远程主机的链路速度（字节/秒），不指定则在需要时测量
+            cpu_budget: 每GB输入允许的本地压缩CPU时间（秒），None表示不限制
+            package_relay: 软件包中转缓存，指定时依赖从中转缓存推送安装
+        """
         self.conn = conn
-        self.svc_manager = ServiceManagerDetector.detect(conn)
+        self.link_speed = link_speed
+        self.cpu_budget = cpu_budget
+        self.package_relay = package_relay
+        # 最近一次部署各步骤的耗时（秒）及使用的压缩编解码器
+        self.timings: Dict[str, Any] = {}
+        # 使用缓存的主机信息，避免每次创建时都检测服务管理器
+        self.facts = get_facts(conn)
+        self.svc_manager = ServiceManager(self.facts.service_manager)
         if self.svc_manager == ServiceManager.UNKNOWN:
             raise RuntimeError("Unable to detect service manager")
 
+    def _record_unit(self, service_name: str, exists: bool):
+        """上传或删除服务单元文件后同步更新缓存的单元文件列表"""
+        unit_files = set(self.facts.unit_files)
+        if exists:
+            unit_files.add(f"{service_name}.service")
+        else:
+            unit_files.discard(f"{service_name}.service")
+        self.facts.unit_files = sorted(unit_files)
+        get_facts_cache().save(self.facts)
+
     def _is_protected_service(self, service_name: str) -> bool:
         """
         检查服务是否是受保护的系统服务
@@ -345,7 +443,7 @@ class ServiceManagerOperator:
             else:
                 self.conn.run(cmd)
             return True
-        except UnexpectedExit:
+        except invoke.UnexpectedExit:
             return False
 
     @classmethod
@@ -397,12 +495,7 @@ class ServiceManagerOperator:
             local_path = os.path.join(temp_dir, filename)
 
             # 下载文件
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-
-            with open(local_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            get_downloader().fetch(url, local_path)
 
             return True, local_path
         except Exception as e:
@@ -511,75 +604,554 @@ class ServiceManagerOperator:
                 # 设置正确的权限
                 self.conn.sudo(f"chown root:root {remote_path}")
                 self.conn.sudo(f"chmod 644 {remote_path}")
+                self._record_unit(service_name, True)
                 return remote_path
             finally:
                 # 清理临时文件
                 os.unlink(temp_file.name)
 
     def deploy_service_with_service_dir(self, service_dir: str):
-        # 判断定义文件是否存在
-        if not os.path.exists(os.path.join(service_dir, 'definitions.json')):
-            raise FileNotFoundError(f"Service definitions.json not found in {service_dir}")
+        config = DeployConfig.from_service_dir(service_dir)
 
-        config = DeployConfig.from_json(os.path.join(service_dir, 'definitions.json'))
+        self.deploy_service(config)
 
-        config.merge_config_dir = os.path.join(service_dir, 'deploy')
+    def select_codec(self, config: DeployConfig, measure_link: bool = True) -> Tuple[Codec, int]:
+        """
+        选择传输使用的压缩编解码器和级别：优先使用部署配置指定的编解码器，
+        否则在本地和远程均支持的编解码器中根据链路速度和CPU预算选择
 
-        self.deploy_service(config)
+        Args:
+            config: 部署配置
+            measure_link: 链路速度未知时是否测量（会向远程主机发送数MB数据），
+                否则只使用已测得的链路速度，未测量过时使用默认编解码器
 
-    def deploy_service(self, config: DeployConfig):
-        """部署服务"""
-        try:
-            # 检查是否是受保护的服务
-            if self._is_protected_service(config.name):
-                raise ValueError(f"Cannot deploy protected system service: {config.name}")
+        Returns:
+            Tuple[Codec, int]: (编解码器, 压缩级别)
+
+        Raises:
+            ValueError: 指定的编解码器本地不可用，或压缩级别超出范围
+            RuntimeError: 指定的编解码器远程主机不支持
+        """
+        if config.compression:
+            codec = get_codec(config.compression)
+            if codec.name not in probe_remote_codecs(self.conn):
+                raise RuntimeError(f"Remote host does not support compression codec: {codec.name}")
+            return codec, codec.check_level(config.compression_level)
+
+        if self.link_speed is None:
+            self.link_speed = measure_link_speed(self.conn) if measure_link else known_link_speed(self.conn)
+        codec, level = select_codec(probe_remote_codecs(self.conn), self.link_speed, self.cpu_budget)
+        if config.compression_level is not None:
+            try:
+                level = codec.check_level(config.compression_level)
+            except ValueError as e:
+                # 编解码器是自动选择的，级别不适用时使用选择的级别
+                logger.warning(f"{str(e)}, using level {level}")
+        return codec, level
 
-            # 确保安装路径是绝对路径
-            install_path = self._ensure_path_validate(config.install_path)
+    def is_up_to_date(self, config: DeployConfig) -> bool:
+        """
+        检查远程主机上的服务是否已是最新部署，只执行一次远程命令
 
-            # 1. 创建安装目录
-            self._execute_cmd(f"mkdir -p {install_path}", config.use_sudo)
+        Args:
+            config: 部署配置
 
-            # 2. 下载或复制源文件到安装目录并解压
-            extract_archive(
-                self.conn,
-                config.source_path,
-                install_path,
-                use_sudo=config.use_sudo,
-            )
+        Returns:
+            bool: 是否无需重新部署
+        """
+        install_path = self._ensure_path_validate(config.install_path)
+        remote_stamp = read_remote_stamp(self.conn, install_path, config.use_sudo)
+        return not DeployStamp.compute(config).changed_parts(remote_stamp)
 
-            # 3.copy本地目录等配置到安装目录：必须是相对路径
-            if config.merge_config_dir and os.path.exists(config.merge_config_dir):
-                extract_archive(self.conn, config.merge_config_dir, install_path, use_sudo=config.use_sudo)
+    @staticmethod
+    def _local_size(path: str) -> int:
+        """本地文件或目录的大小（字节）"""
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(root, name))
+                       for root, _, names in os.walk(path) for name in names)
+        return os.path.getsize(path)
 
-            # 4. 安装依赖
-            if config.dependencies:
-                pkg_operator = PackageManagerOperator(self.conn)
-                for dep in config.dependencies:
-                    pkg_operator.install(dep, config.use_sudo)
+    @classmethod
+    def _estimate_archive_size(cls, local_path: str, codec: Codec, level: Optional[int]) -> Tuple[int, bool]:
+        """
+        估算打包后的大小
 
-            # 5. 确保binary文件可执行
-            if config.binary:
-                binary_path = os.path.join(install_path, config.binary)
-                self._execute_cmd(f"chmod +x {binary_path}", config.use_sudo)
+        Returns:
+            Tuple[int, bool]: (字节数, 是否为估算值)，源文件已是目标格式时为准确值
+        """
+        size = cls._local_size(local_path)
+        if codec_for_path(local_path) is codec:
+            return size, False
+        level = codec.default_level if level is None else level
+        profiles = {lvl: profile for (name, lvl), profile in CODEC_PROFILES.items() if name == codec.name}
+        if not profiles:
+            return size, True
+        ratio = profiles[min(profiles, key=lambda lvl: abs(lvl - level))][0]
+        return int(size * ratio), True
+
+    def _plan_transfer(self, plan: DeployPlan, target: str, source_path: str, local_path: Optional[str],
+                       prepared_archives: Dict[str, str], codec: Optional[Codec], level: Optional[int],
+                       streaming: bool, use_sudo: bool, sha256: Optional[str] = None):
+        """添加打包和上传源或配置目录的操作"""
+        # upload_archive：创建目录、上传、解压、（修改属主、）删除临时文件
+        upload_calls = 5 if use_sudo else 4
+        prepared = prepared_archives.get(source_path)
+        if prepared:
+            plan.add('upload', target, bytes=os.path.getsize(prepared), remote_calls=upload_calls,
+                     details={'path': source_path, 'codec': (codec_for_path(prepared) or get_codec('gzip')).name,
+                              'level': None, 'streaming': False})
+            return
+
+        codec = codec or get_codec('gzip')
+        details = {'path': source_path, 'codec': codec.name, 'level': level, 'sha256': sha256}
+        size, upload_size, estimated = None, None, False
+        if local_path and os.path.exists(local_path):
+            size = self._local_size(local_path)
+            upload_size, estimated = self._estimate_archive_size(local_path, codec, level)
+        if not streaming:
+            plan.add('archive', target, bytes=size, details=dict(details))
+        plan.add('upload', target, bytes=upload_size, estimated=estimated,
+                 remote_calls=1 if streaming else upload_calls, details=dict(details, streaming=streaming))
+
+    def plan(self, config: DeployConfig, prepared_archives: Optional[Dict[str, str]] = None,
+             force: bool = False, measure_link: bool = False) -> DeployPlan:
+        """
+        计算部署计划，不修改远程主机
 
-            # 6. 创建systemd服务文件
-            if self.svc_manager == ServiceManager.SYSTEMD:
-                service_content = config.to_service_definition().generate_systemd_unit()
+        需要读取远程部署摘要，增量同步配置时读取远程清单；未指定sha256的HTTP源会下载到缓存以计算摘要。
+        默认不测量链路速度，只使用已知的链路速度选择编解码器
 
-                # 上传服务文件
-                self._upload_service_file(config.name, service_content)
+        Args:
+            config: 部署配置
+            prepared_archives: 源路径到已准备好的tgz文件路径的映射（可选）
+            force: 是否忽略部署摘要，计划执行所有步骤
+            measure_link: 链路速度未知时是否测量，用于自动选择编解码器（会向远程主机发送数MB数据）
 
-                # 重新加载systemd
-                self.control_service("", "reload", config.use_sudo)
+        Returns:
+            DeployPlan: 部署计划
 
-                # 启用并启动服务
-                self.control_service(config.name, "enable", config.use_sudo)
-                self.control_service(config.name, "start", config.use_sudo)
+        Raises:
+            ValueError: 受保护的系统服务
+        """
+        # 检查是否是受保护的服务
+        if self._is_protected_service(config.name):
+            raise ValueError(f"Cannot deploy protected system service: {config.name}")
+
+        # 确保安装路径是绝对路径
+        install_path = self._ensure_path_validate(config.install_path)
+        prepared_archives = prepared_archives or {}
+
+        # 计算部署摘要可能会下载源文件，先记录下载缓存状态
+        is_url = config.source_path.startswith(('http://', 'https://'))
+        source_cached = is_url and get_download_cache().contains(config.source_path, config.sha256)
+
+        # 比较部署摘要，确定需要执行的步骤
+        stamp = DeployStamp.compute(config)
+        remote_stamp = None if force else read_remote_stamp(self.conn, install_path, config.use_sudo)
+        changed = stamp.changed_parts(remote_stamp)
+        plan = DeployPlan(service=config.name, host=host_key(self.conn), install_path=install_path,
+                          batch=config.batch, changed=sorted(changed), stamp=asdict(stamp))
+        if not changed:
+            return plan
+
+        source_changed = bool(changed & {'source', 'archive'})
+        config_changed = ('config' in changed and config.merge_config_dir
+                          and os.path.exists(config.merge_config_dir))
+        # 批量模式下归档随脚本一起传输，不使用流式传输
+        streaming = config.stream_transfer and not config.batch
+        codec, level = None, None
+        if source_changed and config.source_path not in prepared_archives:
+            codec, level = self.select_codec(config, measure_link)
+
+        # 1. 下载源文件
+        local_source = config.source_path[7:] if config.source_path.startswith('file://') else config.source_path
+        if source_changed and is_url and config.source_path not in prepared_archives:
+            local_source = None
+            if get_download_cache().contains(config.source_path, config.sha256):
+                local_source = download_file(config.source_path, True, sha256=config.sha256)
+            if not source_cached:
+                plan.add('download', config.source_path,
+                         bytes=os.path.getsize(local_source) if local_source else None,
+                         details={'url': config.source_path, 'sha256': config.sha256})
+
+        # 2. 创建安装目录
+        if remote_stamp is None:
+            plan.add('mkdir', install_path, remote_calls=1)
+
+        # 3. 打包并上传源文件
+        if source_changed:
+            self._plan_transfer(plan, 'source', config.source_path, local_source, prepared_archives,
+                                codec, level, streaming, config.use_sudo, config.sha256)
+
+        # 4. 上传配置目录：增量同步时按远程清单计算需要传输的文件
+        if config_changed and config.sync_config:
+            local_manifest = build_local_manifest(config.merge_config_dir)
+            remote_manifest = fetch_remote_manifest(self.conn, install_path, config.use_sudo)
+            uploaded = [rel_path for rel_path, entry in local_manifest.items()
+                        if rel_path not in remote_manifest or remote_manifest[rel_path].sha256 != entry.sha256]
+            deleted = sorted(set(remote_manifest) - set(local_manifest)) if config.sync_delete else []
+            upload_calls = 1 if config.stream_transfer else (5 if config.use_sudo else 4)
+            plan.add('sync', 'config', bytes=sum(local_manifest[rel_path].size for rel_path in uploaded),
+                     estimated=True,
+                     remote_calls=1 + (upload_calls if uploaded or deleted else 0) + (1 if deleted else 0),
+                     details={'path': config.merge_config_dir, 'files': len(uploaded), 'deleted': len(deleted),
+                              'streaming': config.stream_transfer})
+        elif config_changed:
+            # 配置目录通常很小，沿用源文件的编解码器
+            self._plan_transfer(plan, 'config', config.merge_config_dir, config.merge_config_dir,
+                                prepared_archives, codec, level, streaming, config.use_sudo)
+
+        # 5. 安装依赖：按缓存的主机信息估算缺少的包
+        if 'dependencies' in changed and config.dependencies:
+            missing = [dep for dep in config.dependencies if not self.facts.has_package(dep)]
+            plan.add('install', ' '.join(config.dependencies), remote_calls=1 + (1 if missing else 0),
+                     details={'packages': list(config.dependencies), 'missing': missing,
+                              'relay': self.package_relay is not None})
+
+        # 6. 确保binary文件可执行
+        if source_changed and config.binary:
+            plan.add('chmod', os.path.join(install_path, config.binary), remote_calls=1)
+
+        # 7. 创建并启用systemd服务文件，启动服务：首次安装时启动，服务已存在时重启，
+        # 否则正在运行的旧进程不会加载新的源文件、配置或单元文件，健康检查检查的仍是旧进程
+        if self.svc_manager == ServiceManager.SYSTEMD:
+            exists = remote_stamp is not None or self.facts.has_unit(config.name)
+            if 'unit' in changed:
+                unit = config.to_service_definition().generate_systemd_unit()
+                plan.add('unit', config.name, bytes=len(unit.encode()), remote_calls=3,
+                         details={'path': f"/etc/systemd/system/{config.name}.service"})
+                plan.add('enable', config.name, remote_calls=2)
+            plan.add('restart' if exists else 'start', config.name, remote_calls=1)
+
+        # 8. 记录部署摘要
+        plan.add('stamp', install_path, remote_calls=1)
+
+        if plan.batch:
+            # 批量模式下增量同步之外的操作合并为一次远程调用，增量同步前后各一次
+            plan.remote_calls, pending = 0, False
+            for action in plan.actions:
+                if action.action == 'sync':
+                    plan.remote_calls += int(pending) + action.remote_calls
+                    pending = False
+                elif action.remote_calls:
+                    pending = True
+            plan.remote_calls += int(pending)
+        else:
+            plan.remote_calls = sum(action.remote_calls for action in plan.actions)
+        return plan
+
+    def deploy_service(self, config: DeployConfig, prepared_archives: Optional[Dict[str, str]] = None,
+                       force: bool = False, plan: Optional[DeployPlan] = None) -> DeployPlan:
+        """
+        部署服务：先计算部署计划，再只执行计划中的操作
+
+        安装目录中会写入部署摘要，再次部署时未变化的步骤会被跳过。
+        部署过程中的远程调用次数（包括计算计划）记录在 timings['round_trips'] 中
 
+        Args:
+            config: 部署配置
+            prepared_archives: 源路径到已准备好的tgz文件路径的映射（可选），
+                多主机部署时由调用方统一下载打包，避免每台主机重复处理
+            force: 是否忽略部署摘要，强制执行所有步骤
+            plan: 预先计算（如已审核）的部署计划，None时重新计算
+
+        Returns:
+            DeployPlan: 执行的部署计划
+        """
+        self.timings = {}
+        counter = RoundTripCounter(self.conn)
+        conn, self.conn = self.conn, counter
+        tracer = get_tracer()
+        try:
+            with tracer.span('deploy', conn=counter, service=config.name) as span:
+                if plan is None:
+                    with tracer.span('plan', conn=counter):
+                        plan = self.plan(config, prepared_archives, force, measure_link=True)
+                span.attributes['actions'] = len(plan.actions)
+                if plan.up_to_date:
+                    logger.info(f"Service {config.name} is up to date, skip deploy")
+                    return plan
+                self.execute_plan(plan, config, prepared_archives)
+                return plan
         except Exception as e:
             logger.exception(f"Error deploying service: {str(e)}", exc_info=e)
             raise e
+        finally:
+            self.conn = conn
+            self.timings['round_trips'] = counter.count
+
+    def execute_plan(self, plan: DeployPlan, config: DeployConfig,
+                     prepared_archives: Optional[Dict[str, str]] = None):
+        """
+        按顺序执行部署计划中的操作
+
+        Args:
+            plan: 部署计划
+            config: 计算计划时使用的部署配置
+            prepared_archives: 源路径到已准备好的tgz文件路径的映射
+
+        Raises:
+            ValueError: 计划与部署配置不对应，或是受保护的系统服务
+            RuntimeError: 逐条执行时某个操作失败，失败后不会写入部署摘要
+            BatchStepError: 批量模式下某个步骤执行失败，失败后不会写入部署摘要
+        """
+        if plan.service != config.name:
+            raise ValueError(f"Plan for {plan.service} does not match service {config.name}")
+        if self._is_protected_service(config.name):
+            raise ValueError(f"Cannot deploy protected system service: {config.name}")
+
+        prepared_archives = prepared_archives or {}
+        temp_archives: Dict[str, str] = {}
+        try:
+            if plan.batch:
+                self._execute_batch(plan, config, prepared_archives, temp_archives)
+                return
+            for action in plan.actions:
+                step_start = time.monotonic()
+                with get_tracer().span(action.action, conn=self.conn, target=action.target):
+                    self._execute_action(action, plan, config, prepared_archives, temp_archives)
+                timing_key = PLAN_TIMING_KEYS.get(action.target)
+                if timing_key and action.action in ('archive', 'upload', 'sync'):
+                    self.timings[timing_key] = self.timings.get(timing_key, 0) + time.monotonic() - step_start
+        finally:
+            for tgz_path in temp_archives.values():
+                cleanup_archive(tgz_path)
+
+    @staticmethod
+    def _build_archive(action: PlanAction) -> str:
+        """按计划中的编解码器打包源或配置目录"""
+        return prepare_archive(action.details['path'], sha256=action.details.get('sha256'),
+                               codec=get_codec(action.details['codec']), level=action.details['level'])
+
+    @staticmethod
+    def _check_step(ok: bool, action: PlanAction):
+        """操作失败时抛出异常，终止部署，避免之后写入部署摘要"""
+        if not ok:
+            raise RuntimeError(f"Deploy step {action.action} failed: {action.target}")
+
+    def _execute_action(self, action: PlanAction, plan: DeployPlan, config: DeployConfig,
+                        prepared_archives: Dict[str, str], temp_archives: Dict[str, str]):
+        """
+        逐条执行部署计划中的一个操作
+
+        Raises:
+            RuntimeError: 操作执行失败
+        """
+        use_sudo = config.use_sudo
+        if action.action == 'download':
+            download_file(action.details['url'], True, sha256=action.details.get('sha256'))
+        elif action.action == 'mkdir':
+            self._check_step(self._execute_cmd(f"mkdir -p {plan.install_path}", use_sudo), action)
+        elif action.action == 'archive':
+            temp_archives[action.target] = self._build_archive(action)
+        elif action.action == 'upload':
+            # 与 extract_archive 不同，这里的异常会向上抛出，避免失败的部署被记录为成功
+            path = action.details['path']
+            self.timings['codec'] = action.details['codec']
+            if action.details['streaming']:
+                stream_archive(self.conn, path, plan.install_path, use_sudo=use_sudo,
+                               sha256=action.details.get('sha256'), codec=get_codec(action.details['codec']),
+                               level=action.details['level'])
+            else:
+                upload_archive(self.conn, prepared_archives.get(path) or temp_archives[action.target],
+                               plan.install_path, use_sudo=use_sudo)
+        elif action.action == 'sync':
+            # 只传输新增或变更的文件
+            sync_config_dir(self.conn, action.details['path'], plan.install_path, use_sudo,
+                            delete=config.sync_delete, streaming=action.details['streaming'])
+        elif action.action == 'install':
+            pkg_operator = PackageManagerOperator(self.conn, relay=self.package_relay)
+            # 一次查询已安装的包，缺少的包在一个事务中安装
+            self._check_step(pkg_operator.install_many(action.details['packages'], use_sudo), action)
+        elif action.action == 'chmod':
+            self._check_step(self._execute_cmd(f"chmod +x {action.target}", use_sudo), action)
+        elif action.action == 'unit':
+            self._upload_service_file(config.name, config.to_service_definition().generate_systemd_unit())
+        elif action.action == 'enable':
+            # 重新加载systemd并启用服务
+            self._check_step(self.control_service("", "reload", use_sudo)
+                             and self.control_service(config.name, "enable", use_sudo), action)
+        elif action.action in ('start', 'restart'):
+            self._check_step(self.control_service(config.name, action.action, use_sudo), action)
+        elif action.action == 'stamp':
+            write_remote_stamp(self.conn, plan.install_path, DeployStamp(**plan.stamp), use_sudo)
+
+    def _execute_batch(self, plan: DeployPlan, config: DeployConfig, prepared_archives: Dict[str, str],
+                       temp_archives: Dict[str, str]):
+        """
+        批量模式执行部署计划：将远程操作编译为一个shell脚本，连同归档和服务文件打包为一个tar流，
+        在一次远程调用中完成传输和执行。配置目录按清单增量同步时，同步在之前的操作执行后单独执行
+
+        Args:
+            plan: 部署计划
+            config: 部署配置
+            prepared_archives: 源路径到已准备好的tgz文件路径的映射
+            temp_archives: 本次打包生成的临时归档，由调用方清理
+
+        Raises:
+            BatchStepError: 某个步骤执行失败
+        """
+        use_sudo = config.use_sudo
+        install_path = plan.install_path
+        script, files = BatchScript(), {}
+        pkg_operator, installed_packages = None, []
+        for action in plan.actions:
+            if action.action == 'download':
+                download_file(action.details['url'], True, sha256=action.details.get('sha256'))
+            elif action.action == 'archive':
+                temp_archives[action.target] = self._build_archive(action)
+            elif action.action == 'mkdir':
+                script.add_step('mkdir', f"mkdir -p {install_path}")
+            elif action.action == 'upload':
+                archive = prepared_archives.get(action.details['path']) or temp_archives[action.target]
+                codec = self._add_extract_step(script, files, action.target, archive, install_path, use_sudo)
+                if action.target == 'source':
+                    self.timings['codec'] = codec.name
+            elif action.action == 'sync':
+                # 增量同步需要先读取远程清单，无法编入脚本
+                self._run_batch(script, files, use_sudo)
+                sync_config_dir(self.conn, action.details['path'], install_path, use_sudo,
+                                delete=config.sync_delete, streaming=action.details['streaming'])
+                script, files = BatchScript(), {}
+            elif action.action == 'install':
+                # 与 install_many 一致：按缓存的主机信息只安装缺少的包，所有包在一个事务中安装；
+                # 任一步骤失败即终止脚本，不会写入部署摘要
+                pkg_operator = PackageManagerOperator(self.conn, relay=self.package_relay)
+                missing = pkg_operator.missing_packages(action.details['packages'])
+                if not missing:
+                    continue
+                if self.package_relay is not None:
+                    # 软件包文件随脚本一起传输，从本地文件安装
+                    remote_files = []
+                    for path in self.package_relay.resolve(self.facts, missing, use_sudo):
+                        name = f"packages/{os.path.basename(path)}"
+                        files[name] = path
+                        remote_files.append(f'"$tmp"/{shlex.quote(name)}')
+                    script.add_step('dependencies', PackageRelay.local_install_cmd(self.facts, remote_files))
+                else:
+                    script.add_step('dependencies', pkg_operator.install_cmd(missing))
+                installed_packages = missing
+            elif action.action == 'chmod':
+                script.add_step('binary', f"chmod +x {action.target}")
+            elif action.action == 'unit':
+                files['unit.service'] = config.to_service_definition().generate_systemd_unit().encode()
+                script.add_step('unit', 'install -m 644 -o root -g root "$tmp/unit.service" '
+                                        f"{action.details['path']}")
+            elif action.action == 'enable':
+                script.add_step('enable', ServiceManagerCommands.get_command(self.svc_manager, 'reload'),
+                                f"{ServiceManagerCommands.get_command(self.svc_manager, 'enable')} {config.name}")
+            elif action.action in ('start', 'restart'):
+                script.add_step(action.action, f"{ServiceManagerCommands.get_command(self.svc_manager, action.action)} "
+                                               f"{config.name}")
+            elif action.action == 'stamp':
+                script.add_step('stamp', stamp_write_cmd(install_path, DeployStamp(**plan.stamp)))
+
+        self._run_batch(script, files, use_sudo)
+        if installed_packages:
+            pkg_operator.record_installed(installed_packages)
+        if 'unit.service' in files:
+            self._record_unit(config.name, True)
+
+    @staticmethod
+    def _add_extract_step(script: BatchScript, files: Dict[str, Any], name: str, archive: str,
+                          install_path: str, use_sudo: bool) -> Codec:
+        """添加解压归档到安装目录的步骤，归档随脚本一起传输，返回归档的编解码器"""
+        codec = codec_for_path(archive) or get_codec('gzip')
+        bundle_name = f"{name}{codec.extension}"
+        files[bundle_name] = archive
+        commands = [f"mkdir -p {install_path}", codec.tar_extract_cmd(f'"$tmp/{bundle_name}"', install_path)]
+        if use_sudo:
+            commands.append(f"chown -R root:root {install_path}")
+        script.add_step(name, *commands)
+        return codec
+
+    def _run_batch(self, script: BatchScript, files: Dict[str, Any], use_sudo: bool):
+        """
+        在一次远程调用中传输文件并执行批量脚本
+
+        Args:
+            script: 批量脚本
+            files: 随脚本传输的文件：名称 -> 本地文件路径或文件内容
+            use_sudo: 是否使用sudo权限
+
+        Raises:
+            BatchStepError: 某个步骤执行失败
+        """
+        if not script.steps:
+            return
+        script.prologue.append('tmp=$(mktemp -d) || exit 1')
+        script.epilogue.append('rm -rf "$tmp"')
+        # 第一个步骤从标准输入解出随脚本传输的文件，之后的命令不再读取标准输入
+        script.steps.insert(0, ScriptStep('unpack', ['tar -xf - -C "$tmp"', 'exec </dev/null']))
+
+        def write_bundle(stdin):
+            with tarfile.open(fileobj=stdin, mode='w|') as tar:
+                for name, content in files.items():
+                    if isinstance(content, bytes):
+                        tarinfo = tarfile.TarInfo(name)
+                        tarinfo.size = len(content)
+                        tar.addfile(tarinfo, io.BytesIO(content))
+                    else:
+                        tar.add(os.path.realpath(content), arcname=name)
+
+        with get_tracer().span('batch', conn=self.conn, steps=[step.name for step in script.steps]) as span:
+            exit_status, output, stderr = run_streaming(self.conn, script.render(), write_bundle, use_sudo)
+            results = BatchScript.parse(output)
+            span.attributes['exit_codes'] = {result.name: result.exit_code for result in results}
+        fatal = {step.name: step.fatal for step in script.steps}
+        for result in results:
+            logger.info(f"Batch step {result.name}: exit code {result.exit_code}")
+            if not result.ok and not fatal[result.name]:
+                logger.warning(f"Batch step {result.name} failed: {result.output.strip()}")
+        if exit_status != 0:
+            failed = next((r for r in results if not r.ok and fatal[r.name]), None)
+            raise BatchStepError(failed or StepResult('script', exit_status, (output + stderr).strip()))
+
+    def check_health(self, config: DeployConfig) -> bool:
+        """
+        检查服务是否健康：服务处于运行状态，且健康检查脚本（如有）执行成功，只执行一次远程命令
+
+        Args:
+            config: 部署配置
+
+        Returns:
+            bool: 是否健康
+        """
+        install_path = self._ensure_path_validate(config.install_path)
+        script = f"{ServiceManagerCommands.get_command(self.svc_manager, 'is_active')} {config.name}"
+        if config.check_script:
+            script += f" && cd {install_path} && {{ {config.check_script}; }}"
+        result = run_shell(self.conn, script, config.use_sudo, hide=True, warn=True)
+        return result.ok
+
+    def wait_healthy(self, config: DeployConfig, timeout: float = 60, interval: float = 1,
+                     max_interval: float = 10) -> bool:
+        """
+        轮询服务健康状态直到健康或超时，轮询间隔按指数退避增长
+
+        Args:
+            config: 部署配置
+            timeout: 超时时间（秒）
+            interval: 首次轮询间隔（秒）
+            max_interval: 最大轮询间隔（秒）
+
+        Returns:
+            bool: 超时前是否健康
+        """
+        deadline = time.monotonic() + timeout
+        with get_tracer().span('health', host=self.conn.host, service=config.name) as span:
+            while True:
+                span.remote_calls += 1
+                if self.check_health(config):
+                    span.attributes['healthy'] = True
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Service {config.name} on {self.conn.host} not healthy after {timeout}s")
+                    span.attributes['healthy'] = False
+                    return False
+                time.sleep(min(interval, remaining))
+                interval = min(interval * 2, max_interval)
 
     def control_service(self, service_name: str, action: str, use_sudo: bool = True) -> bool:
         """控制服务"""
@@ -608,6 +1180,7 @@ class ServiceManagerOperator:
             if self.svc_manager == ServiceManager.SYSTEMD:
                 service_file = f"/etc/systemd/system/{service_name}.service"
                 self._execute_cmd(f"rm -f {service_file}", use_sudo)
+                self._record_unit(service_name, False)
                 self.control_service("", "reload", use_sudo)
 
             # 3. 删除安装目录（如果提供）
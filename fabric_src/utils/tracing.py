@@ -0,0 +1,264 @@
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    """一个部署步骤的执行记录"""
+    name: str  # 步骤名称（如部署计划操作 download、upload，或 http_download、sftp_put 等底层步骤）
+    host: Optional[str] = None  # 远程主机，本地步骤继承外层步骤的主机
+    start: float = 0.0  # 开始时间（Unix时间戳）
+    duration: float = 0.0  # 耗时（秒）
+    bytes_in: int = 0  # 读取或下载的字节数
+    bytes_out: int = 0  # 写出或上传的字节数
+    remote_calls: int = 0  # 远程调用次数
+    cache: Optional[str] = None  # 缓存命中情况：hit/miss，None表示不涉及缓存
+    error: Optional[str] = None  # 失败时的异常
+    span_id: str = ''  # 步骤ID
+    parent_id: Optional[str] = None  # 外层步骤ID
+    attributes: Dict[str, Any] = field(default_factory=dict)  # 其他属性（如URL、服务名）
+
+
+# 可以在创建步骤时直接设置的字段
+_SPAN_FIELDS = {f.name for f in fields(Span)} - {'name', 'host', 'start', 'duration', 'span_id', 'parent_id'}
+
+# 步骤开始和结束时调用的回调：(事件 start/end, 步骤)
+SpanHook = Callable[[str, Span], None]
+
+# 当前线程（上下文）正在执行的步骤
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Tracer:
+    """
+    部署步骤追踪器
+
+    记录每个步骤的耗时、字节数、远程调用次数和缓存命中情况，可导出为JSON lines或
+    Prometheus textfile；回调可以在步骤开始和结束时接入其他性能分析工具
+    """
+
+    def __init__(self, max_spans: int = 10000):
+        """
+        初始化追踪器
+
+        Args:
+            max_spans: 内存中保留的最大步骤数，超过时丢弃最早的记录
+        """
+        self.spans: deque = deque(maxlen=max_spans)
+        self._hooks: List[SpanHook] = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: SpanHook):
+        """
+        添加回调，回调中的异常只记录日志，不影响部署
+
+        Args:
+            hook: 回调函数，参数为事件（start/end）和步骤
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook: SpanHook):
+        """删除回调"""
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def _emit(self, event: str, span: Span):
+        for hook in list(self._hooks):
+            try:
+                hook(event, span)
+            except Exception as e:
+                logger.exception(f"Span hook failed: {str(e)}", exc_info=e)
+
+    @contextmanager
+    def span(self, name: str, host: Optional[str] = None, conn: Any = None, **kwargs) -> Iterator[Span]:
+        """
+        记录一个步骤，可嵌套；执行过程中可以修改返回的步骤（如设置字节数、缓存命中情况）。
+        步骤结束时字节数累加到外层步骤，外层步骤的统计包括其中所有步骤
+
+        Args:
+            name: 步骤名称
+            host: 远程主机，None时使用conn的主机或外层步骤的主机
+            conn: 连接对象，为 RoundTripCounter 时自动统计步骤内的远程调用次数
+            **kwargs: Span的字段（bytes_in、bytes_out、remote_calls、cache），其他参数记录为属性
+
+        Yields:
+            Span: 步骤
+        """
+        parent = _current_span.get()
+        if host is None:
+            host = getattr(conn, 'host', None) or (parent.host if parent else None)
+        span = Span(name=name, host=host, start=time.time(), span_id=uuid.uuid4().hex[:16],
+                    parent_id=parent.span_id if parent else None)
+        for key, value in kwargs.items():
+            if key in _SPAN_FIELDS:
+                setattr(span, key, value)
+            else:
+                span.attributes[key] = value
+        count_start = getattr(conn, 'count', None) if conn is not None else None
+
+        token = _current_span.set(span)
+        self._emit('start', span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            if isinstance(count_start, int):
+                span.remote_calls += conn.count - count_start
+            _current_span.reset(token)
+            with self._lock:
+                self.spans.append(span)
+                if parent is not None:
+                    parent.bytes_in += span.bytes_in
+                    parent.bytes_out += span.bytes_out
+            self._emit('end', span)
+
+    def snapshot(self) -> List[Span]:
+        """获取当前记录的所有步骤"""
+        with self._lock:
+            return list(self.spans)
+
+    def clear(self):
+        """清空记录"""
+        with self._lock:
+            self.spans.clear()
+
+    def export_jsonl(self, path: str, append: bool = True) -> int:
+        """
+        导出为JSON lines，每行一个步骤
+
+        Args:
+            path: 输出文件路径
+            append: 是否追加到已有文件
+
+        Returns:
+            int: 导出的步骤数
+        """
+        spans = self.snapshot()
+        with open(path, 'a' if append else 'w', encoding='utf-8') as f:
+            for span in spans:
+                f.write(json.dumps(asdict(span), ensure_ascii=False, default=str) + '\n')
+        return len(spans)
+
+    def export_prometheus(self, path: str, prefix: str = 'fabric_deploy_step') -> int:
+        """
+        按步骤名称和主机汇总，导出为 node_exporter textfile collector 格式，原子替换目标文件
+
+        Args:
+            path: 输出文件路径（通常以 .prom 结尾）
+            prefix: 指标名前缀
+
+        Returns:
+            int: 导出的指标序列数
+        """
+        totals: Dict[Tuple[str, str], Dict[str, float]] = {}
+        for span in self.snapshot():
+            total = totals.setdefault((span.name, span.host or ''), dict.fromkeys(
+                ('count', 'seconds', 'bytes_in', 'bytes_out', 'remote_calls', 'errors', 'hit', 'miss'), 0))
+            total['count'] += 1
+            total['seconds'] += span.duration
+            total['bytes_in'] += span.bytes_in
+            total['bytes_out'] += span.bytes_out
+            total['remote_calls'] += span.remote_calls
+            total['errors'] += span.error is not None
+            if span.cache in ('hit', 'miss'):
+                total[span.cache] += 1
+
+        metrics = (
+            ('count', 'total', 'Number of executed steps'),
+            ('seconds', 'seconds_total', 'Wall time spent in steps'),
+            ('bytes_in', 'bytes_in_total', 'Bytes read or downloaded by steps'),
+            ('bytes_out', 'bytes_out_total', 'Bytes written or uploaded by steps'),
+            ('remote_calls', 'remote_calls_total', 'Remote calls issued by steps'),
+            ('errors', 'errors_total', 'Failed steps'),
+        )
+        lines = []
+        series = 0
+        for key, suffix, help_text in metrics:
+            lines.append(f"# HELP {prefix}_{suffix} {help_text}")
+            lines.append(f"# TYPE {prefix}_{suffix} counter")
+            for (name, host), total in sorted(totals.items()):
+                lines.append(f'{prefix}_{suffix}{{step="{_escape_label(name)}",host="{_escape_label(host)}"}} '
+                             f'{total[key]:g}')
+                series += 1
+        lines.append(f"# HELP {prefix}_cache_total Cache lookups by result")
+        lines.append(f"# TYPE {prefix}_cache_total counter")
+        for (name, host), total in sorted(totals.items()):
+            for result in ('hit', 'miss'):
+                if total['hit'] or total['miss']:
+                    lines.append(f'{prefix}_cache_total{{step="{_escape_label(name)}",host="{_escape_label(host)}",'
+                                 f'result="{result}"}} {total[result]:g}')
+                    series += 1
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        try:
+            # mkstemp 创建的文件只有属主可读，textfile collector 通常以其他用户运行
+            os.chmod(temp_path, 0o644)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return series
+
+
+def current_span() -> Optional[Span]:
+    """
+    获取当前正在执行的步骤
+
+    Returns:
+        Optional[Span]: 当前步骤，不在任何步骤中时返回None
+    """
+    return _current_span.get()
+
+
+# 全局共享的追踪器
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """
+    获取全局共享的追踪器
+
+    Returns:
+        Tracer: 追踪器
+    """
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+
+def set_tracer(tracer: Tracer):
+    """
+    替换全局共享的追踪器，例如调整保留的步骤数
+
+    Args:
+        tracer: 追踪器
+    """
+    global _tracer
+    with _tracer_lock:
+        _tracer = tracer
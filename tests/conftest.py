@@ -0,0 +1,210 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pytest
+
+from fabric_src.utils import archive_codec, common, config_sync, host_facts
+from fabric_src.utils.deploy_stamp import STAMP_NAME
+from fabric_src.utils.host_facts import SECTION_MARKER
+from fabric_src.utils.recording_connection import RecordingConnection
+
+
+@pytest.fixture(autouse=True)
+def isolated_home(tmp_path, monkeypatch):
+    """每个测试使用独立的用户目录和全局缓存，不读写真实的 ~/.fabric_cache"""
+    home = tmp_path / 'home'
+    home.mkdir()
+    monkeypatch.setenv('HOME', str(home))
+    monkeypatch.setattr(common, '_download_cache', None)
+    monkeypatch.setattr(common, '_archive_cache', None)
+    monkeypatch.setattr(config_sync, '_hash_cache', None)
+    monkeypatch.setattr(host_facts, '_facts_cache', None)
+    monkeypatch.setattr(archive_codec, '_link_speeds', {})
+    return home
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """按 LocalHTTPServer 的配置提供文件，支持条件请求，可选支持Range"""
+
+    server: "LocalHTTPServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.record(self.path, self.headers)
+        try:
+            with open(os.path.join(server.root, self.path.lstrip('/')), 'rb') as f:
+                data = f.read()
+            mtime = os.path.getmtime(os.path.join(server.root, self.path.lstrip('/')))
+        except FileNotFoundError:
+            self.send_error(404)
+            return
+
+        etag = f'"{hashlib.sha256(data).hexdigest()[:16]}"' if server.send_etag else None
+        last_modified = formatdate(mtime, usegmt=True)
+        if (etag and self.headers.get('If-None-Match') == etag) or \
+                (not etag and self.headers.get('If-Modified-Since') == last_modified):
+            self.send_response(304)
+            self._validators(etag, last_modified)
+            self.end_headers()
+            return
+
+        status, body, content_range = 200, data, None
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if server.ranges and match and if_range in (None, etag, last_modified):
+            start = int(match[1])
+            end = min(int(match[2]) if match[2] else len(data) - 1, len(data) - 1)
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(data)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status, body, content_range = 206, data[start:end + 1], f"bytes {start}-{end}/{len(data)}"
+
+        if status == 200 and server.delay:
+            time.sleep(server.delay)
+        self.send_response(status)
+        self._validators(etag, last_modified)
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _validators(self, etag: Optional[str], last_modified: str):
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+
+
+class LocalHTTPServer(ThreadingHTTPServer):
+    """
+    本地HTTP文件服务器，代替真实的下载源
+
+    记录每个请求的路径和请求头；ranges 控制是否支持Range（不支持或If-Range不匹配时忽略Range返回完整内容），
+    send_etag 为False时只发送Last-Modified，delay 为完整响应前的延迟（秒）
+    """
+
+    daemon_threads = True
+
+    def __init__(self, root: str, ranges: bool = True, send_etag: bool = True, delay: float = 0):
+        super().__init__(('127.0.0.1', 0), _FileHandler)
+        self.root = root
+        self.ranges = ranges
+        self.send_etag = send_etag
+        self.delay = delay
+        self.requests: List[Dict[str, Optional[str]]] = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def record(self, path: str, headers):
+        with self._lock:
+            self.requests.append({'path': path, 'range': headers.get('Range'),
+                                  'if_none_match': headers.get('If-None-Match'),
+                                  'if_modified_since': headers.get('If-Modified-Since')})
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/{name}"
+
+    def write(self, name: str, data: bytes, mtime: Optional[float] = None) -> str:
+        """写入要提供的文件，返回其URL"""
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return self.url(name)
+
+    def take_requests(self) -> List[Dict[str, Optional[str]]]:
+        """取出并清空已记录的请求"""
+        with self._lock:
+            requests, self.requests = self.requests, []
+        return requests
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+@pytest.fixture
+def http_server_factory(tmp_path):
+    """创建本地HTTP文件服务器，测试结束时关闭"""
+    servers = []
+
+    def create(**kwargs) -> LocalHTTPServer:
+        root = tmp_path / f'www{len(servers)}'
+        root.mkdir()
+        server = LocalHTTPServer(str(root), **kwargs)
+        servers.append(server)
+        return server
+
+    yield create
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def http_server(http_server_factory) -> LocalHTTPServer:
+    """支持Range和ETag的本地HTTP文件服务器"""
+    return http_server_factory()
+
+
+class FakeHost:
+    """
+    按脚本响应远程命令的Debian主机（apt + systemd），作为 RecordingConnection 的 responder
+
+    响应主机信息收集脚本、已安装软件包查询和部署摘要读取，其他命令均成功且无输出
+    """
+
+    def __init__(self, packages: Iterable[str] = (), units: Iterable[str] = (), commands=('gzip', 'xz', 'tar')):
+        self.packages = set(packages)
+        self.units = set(units)
+        self.commands = list(commands)
+        self.stamp = ''  # 远程部署摘要文件的内容
+
+    def facts_output(self) -> str:
+        def section(name: str) -> str:
+            return f"{SECTION_MARKER}{name}"
+        return '\n'.join([
+            section('package_manager'), 'apt',
+            section('service_manager'), 'systemd',
+            section('os'), 'debian', '12', 'x86_64', '6.1.0',
+            section('disk'), '/dev/sda1 104857600 52428800 52428800 50% /',
+            section('packages'), *sorted(self.packages),
+            section('unit_files'), *sorted(self.units),
+            section('commands'), *self.commands,
+        ])
+
+    def __call__(self, method: str, command: str, stdin_bytes: int) -> Tuple[int, str, str]:
+        if SECTION_MARKER in command:
+            return 0, self.facts_output(), ''
+        if 'dpkg-query -W' in command:
+            return 0, ''.join(f"install ok installed {name}\n" for name in sorted(self.packages)), ''
+        if STAMP_NAME in command and 'cat ' in command:
+            return 0, self.stamp, ''
+        return 0, '', ''
+
+
+@pytest.fixture
+def fake_host() -> FakeHost:
+    """已安装curl的Debian主机"""
+    return FakeHost(packages=['curl'])
+
+
+@pytest.fixture
+def fake_conn(fake_host) -> RecordingConnection:
+    """连接到 fake_host 的记录连接"""
+    return RecordingConnection(responder=fake_host)
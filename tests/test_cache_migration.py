@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+
+import pytest
+
+from fabric_src.utils.cache_manager import DownloadCache
+
+URL = 'https://mirror.example.com/dist/tool-1.0.tar.gz'
+
+
+def _legacy_path(cache_dir: str, url: str) -> str:
+    """最早版本的缓存路径：<md5前两位>/<第三、四位>/<文件名>"""
+    key = hashlib.md5(url.encode()).hexdigest()
+    return os.path.join(cache_dir, key[:2], key[2:4], os.path.basename(url))
+
+
+def _write(path: str, data: bytes) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def cache_dir(tmp_path) -> str:
+    return str(tmp_path / 'downloads')
+
+
+def test_unindexed_legacy_files_are_imported_by_content(cache_dir, caplog):
+    legacy = _write(_legacy_path(cache_dir, URL), b'tool v1')
+    other = _write(_legacy_path(cache_dir, 'https://mirror.example.com/other.bin'), b'other')
+    unrelated = [_write(os.path.join(cache_dir, 'notes.txt'), b'keep'),
+                 _write(os.path.join(cache_dir, 'zz', 'yy', 'file'), b'keep')]
+
+    with caplog.at_level(logging.INFO, logger='fabric_src.utils.cache_manager'):
+        cache = DownloadCache(cache_dir)
+
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['aliases'] == 0
+    assert 'without URL' in caplog.text and '2 files' in caplog.text
+    for path in (legacy, other):
+        assert not os.path.exists(os.path.dirname(os.path.dirname(path)))
+    assert all(os.path.exists(path) for path in unrelated)
+
+    # 没有URL无法按URL命中，指定sha256时命中并创建别名
+    assert cache.get(URL) is None
+    path = cache.get(URL, sha256=_sha256(b'tool v1'))
+    with open(path, 'rb') as f:
+        assert f.read() == b'tool v1'
+    assert cache.get(URL) == path
+
+
+def test_migration_runs_once(cache_dir):
+    DownloadCache(cache_dir)
+    late = _write(_legacy_path(cache_dir, URL), b'written later')
+
+    assert DownloadCache(cache_dir).stats()['entries'] == 0
+    assert os.path.exists(late)
+
+
+def test_indexed_legacy_entries_are_migrated(cache_dir):
+    """entries 表中有URL的条目创建别名，没有URL的条目按内容导入，相同内容只保存一份"""
+    with_url = _write(_legacy_path(cache_dir, URL), b'tool v1')
+    without_url = _write(_legacy_path(cache_dir, 'https://mirror.example.com/copy.tar.gz'), b'tool v1')
+    unlisted = _write(_legacy_path(cache_dir, 'https://mirror.example.com/unlisted.bin'), b'unlisted')
+    now = time.time()
+    db = sqlite3.connect(os.path.join(cache_dir, DownloadCache.INDEX_NAME))
+    db.execute("CREATE TABLE entries (path TEXT PRIMARY KEY, url TEXT, size INTEGER NOT NULL, "
+               "created_at REAL NOT NULL, last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0, "
+               "etag TEXT, last_modified TEXT, validated_at REAL)")
+    db.execute("CREATE TABLE stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    db.executemany("INSERT INTO entries VALUES (?, ?, 7, ?, ?, 3, ?, NULL, ?)",
+                   [(with_url, URL, now, now, '"v1"', now), (without_url, None, now, now, None, None)])
+    db.commit()
+    db.close()
+
+    cache = DownloadCache(cache_dir)
+    stats = cache.stats()
+    assert stats['entries'] == 2  # tool v1 + unlisted
+    assert stats['aliases'] == 1
+    assert cache.conditional_headers(URL) == {'If-None-Match': '"v1"'}
+    with open(cache.get(URL), 'rb') as f:
+        assert f.read() == b'tool v1'
+    assert cache.get('https://mirror.example.com/unlisted.bin', sha256=_sha256(b'unlisted'))
+    for path in (with_url, without_url, unlisted):
+        assert not os.path.exists(path)
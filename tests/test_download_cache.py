@@ -0,0 +1,119 @@
+import hashlib
+import multiprocessing
+
+import pytest
+
+from fabric_src.utils.cache_manager import CachePolicy, DownloadCache
+from fabric_src.utils.common import download_file, get_download_cache, set_download_cache
+
+
+def _read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _full_gets(requests):
+    return [request for request in requests if request['range'] is None]
+
+
+@pytest.fixture
+def cache_dir(tmp_path) -> str:
+    return str(tmp_path / 'cache')
+
+
+def _use_cache(cache_dir: str, **policy) -> DownloadCache:
+    cache = DownloadCache(cache_dir, policies=[CachePolicy('*', **policy)])
+    set_download_cache(cache)
+    return cache
+
+
+def test_fresh_entry_is_served_without_request(http_server, cache_dir):
+    """ttl=None 的条目永不过期，再次下载不发送任何请求"""
+    url = http_server.write('pinned.bin', b'v1')
+    _use_cache(cache_dir, ttl=None)
+
+    first = download_file(url)
+    assert len(_full_gets(http_server.take_requests())) == 1
+
+    assert download_file(url) == first
+    assert http_server.take_requests() == []
+    assert get_download_cache().stats()['hits'] == 1
+
+
+def test_stale_entry_is_revalidated_with_etag(http_server, cache_dir):
+    """过期条目发送 If-None-Match，304 时直接使用磁盘上的文件"""
+    url = http_server.write('latest.bin', b'v1')
+    _use_cache(cache_dir, ttl=0)
+    first = download_file(url)
+    http_server.take_requests()
+
+    assert download_file(url) == first
+    requests = http_server.take_requests()
+    assert len(requests) == 1
+    assert requests[0]['if_none_match']
+    assert _read(first) == b'v1'
+    stats = get_download_cache().stats()
+    assert stats['stale'] == 1
+    assert stats['revalidations'] == 1
+
+
+def test_stale_entry_is_revalidated_with_last_modified(http_server_factory, cache_dir):
+    """服务端只提供 Last-Modified 时发送 If-Modified-Since"""
+    server = http_server_factory(send_etag=False)
+    url = server.write('latest.bin', b'v1', mtime=1_000_000_000)
+    _use_cache(cache_dir, ttl=0)
+    first = download_file(url)
+    server.take_requests()
+
+    assert download_file(url) == first
+    requests = server.take_requests()
+    assert len(requests) == 1
+    assert requests[0]['if_modified_since']
+    assert get_download_cache().stats()['revalidations'] == 1
+
+
+def test_changed_body_is_refetched(http_server, cache_dir):
+    """远程内容变化后验证失败，重新完整下载"""
+    url = http_server.write('latest.bin', b'v1')
+    _use_cache(cache_dir, ttl=0)
+    download_file(url)
+    http_server.write('latest.bin', b'v2-changed')
+    http_server.take_requests()
+
+    assert _read(download_file(url)) == b'v2-changed'
+    assert len(_full_gets(http_server.take_requests())) == 1
+    assert get_download_cache().stats()['revalidations'] == 0
+
+
+def test_stale_entry_without_revalidation_is_refetched(http_server, cache_dir):
+    """revalidate=False 的策略过期后不发送条件请求，直接重新下载"""
+    url = http_server.write('latest.bin', b'v1')
+    _use_cache(cache_dir, ttl=0, revalidate=False)
+    download_file(url)
+    http_server.take_requests()
+
+    assert _read(download_file(url)) == b'v1'
+    requests = http_server.take_requests()
+    assert len(_full_gets(requests)) == 1
+    assert not any(request['if_none_match'] for request in requests)
+
+
+def _download_in_process(cache_dir: str, url: str) -> str:
+    set_download_cache(DownloadCache(cache_dir))
+    return hashlib.sha256(_read(download_file(url))).hexdigest()
+
+
+def test_concurrent_processes_download_once(http_server_factory, cache_dir):
+    """多个进程同时下载同一URL时只有一个完整下载，其余等待后读取缓存"""
+    server = http_server_factory(delay=0.5)
+    payload = b'payload' * 100_000
+    url = server.write('shared.bin', payload)
+
+    processes = 6
+    with multiprocessing.get_context('spawn').Pool(processes) as pool:
+        digests = pool.starmap(_download_in_process, [(cache_dir, url)] * processes)
+
+    assert set(digests) == {hashlib.sha256(payload).hexdigest()}
+    requests = server.take_requests()
+    assert len(_full_gets(requests)) == 1
+    assert len(requests) == 2  # 探测请求 + 完整下载
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+
+import pytest
+import requests
+
+from fabric_src.utils.downloader import Downloader
+
+PAYLOAD = bytes(range(256)) * 40  # 10240 字节
+
+
+def _read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _ranges(requests_):
+    return [request['range'] for request in requests_]
+
+
+@pytest.fixture
+def partial_path(tmp_path) -> str:
+    return str(tmp_path / 'file.partial')
+
+
+@pytest.fixture
+def segmented_downloader() -> Downloader:
+    """10240 字节的文件分为 4 段，每段 2560 字节"""
+    return Downloader(segments=4, min_segment_size=1024, chunk_size=512)
+
+
+def _write_state(partial_path: str, url: str, mode: str, done=(), etag=None):
+    """模拟一次中断的下载留下的续传状态"""
+    if etag is None:
+        etag = requests.get(url, headers={'Range': 'bytes=0-0'}).headers['ETag']
+    state = {'url': url, 'size': len(PAYLOAD), 'etag': etag, 'last_modified': None,
+             'mode': mode, 'done': [list(item) for item in done]}
+    with open(f"{partial_path}.json", 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+
+def test_small_file_probe_then_full_get(http_server, partial_path):
+    """支持Range时先探测一个字节，小文件再完整下载一次"""
+    url = http_server.write('small.bin', PAYLOAD)
+    result = Downloader(min_segment_size=1024 * 1024).fetch(url, partial_path)
+
+    assert result.status_code == 200
+    assert result.size == len(PAYLOAD)
+    assert result.segments == 1
+    assert result.etag
+    assert result.sha256 == _sha256(PAYLOAD)
+    assert _read(partial_path) == PAYLOAD
+    assert _ranges(http_server.take_requests()) == ['bytes=0-0', None]
+    assert not os.path.exists(f"{partial_path}.json")
+
+
+def test_range_ignored_uses_probe_response(http_server_factory, partial_path, segmented_downloader):
+    """服务端忽略Range返回200时，探测响应就是完整内容，只发送一次请求"""
+    server = http_server_factory(ranges=False)
+    url = server.write('plain.bin', PAYLOAD)
+    result = segmented_downloader.fetch(url, partial_path)
+
+    assert result.status_code == 200
+    assert result.segments == 1
+    assert result.sha256 == _sha256(PAYLOAD)
+    assert _read(partial_path) == PAYLOAD
+    assert len(server.take_requests()) == 1
+
+
+def test_empty_file_falls_back_after_416(http_server, partial_path):
+    url = http_server.write('empty.bin', b'')
+    result = Downloader().fetch(url, partial_path)
+
+    assert result.status_code == 200
+    assert result.size == 0
+    assert result.sha256 == _sha256(b'')
+    assert _read(partial_path) == b''
+    assert _ranges(http_server.take_requests()) == ['bytes=0-0', None]
+
+
+def test_not_modified_writes_nothing(http_server, partial_path):
+    url = http_server.write('cached.bin', PAYLOAD)
+    etag = requests.get(url, headers={'Range': 'bytes=0-0'}).headers['ETag']
+    http_server.take_requests()
+
+    result = Downloader().fetch(url, partial_path, headers={'If-None-Match': etag})
+    assert result.status_code == 304
+    assert result.sha256 is None
+    assert not os.path.exists(partial_path)
+    assert len(http_server.take_requests()) == 1
+
+
+def test_segmented_download_reassembles_and_hashes(http_server, partial_path, segmented_downloader):
+    url = http_server.write('big.bin', PAYLOAD)
+    result = segmented_downloader.fetch(url, partial_path)
+
+    assert result.segments == 4
+    assert result.resumed_bytes == 0
+    assert result.sha256 == _sha256(PAYLOAD)
+    assert _read(partial_path) == PAYLOAD
+    assert sorted(_ranges(http_server.take_requests())) == sorted(
+        ['bytes=0-0', 'bytes=0-2559', 'bytes=2560-5119', 'bytes=5120-7679', 'bytes=7680-10239'])
+    assert not os.path.exists(f"{partial_path}.json")
+
+
+def test_segmented_download_resumes_done_segments(http_server, partial_path, segmented_downloader):
+    """已完成的区间不再下载，sha256 仍覆盖完整内容"""
+    url = http_server.write('big.bin', PAYLOAD)
+    with open(partial_path, 'wb') as f:
+        f.write(PAYLOAD[:5120] + b'\0' * 5120)
+    _write_state(partial_path, url, 'segmented', done=[(0, 2560), (2560, 5120)])
+    http_server.take_requests()
+
+    result = segmented_downloader.fetch(url, partial_path)
+    assert result.resumed_bytes == 5120
+    assert result.sha256 == _sha256(PAYLOAD)
+    assert _read(partial_path) == PAYLOAD
+    assert sorted(_ranges(http_server.take_requests())) == ['bytes=0-0', 'bytes=5120-7679', 'bytes=7680-10239']
+
+
+def test_sequential_download_resumes_from_partial_length(http_server, partial_path):
+    url = http_server.write('seq.bin', PAYLOAD)
+    with open(partial_path, 'wb') as f:
+        f.write(PAYLOAD[:3000])
+    _write_state(partial_path, url, 'sequential')
+    http_server.take_requests()
+
+    result = Downloader(segments=1).fetch(url, partial_path)
+    assert result.resumed_bytes == 3000
+    assert result.sha256 == _sha256(PAYLOAD)
+    assert _read(partial_path) == PAYLOAD
+    assert _ranges(http_server.take_requests()) == ['bytes=0-0', 'bytes=3000-10239']
+
+
+def test_changed_remote_discards_partial(http_server, partial_path):
+    """远程文件的验证器与续传状态不一致时丢弃 .partial 重新下载"""
+    url = http_server.write('seq.bin', PAYLOAD)
+    with open(partial_path, 'wb') as f:
+        f.write(b'x' * 3000)
+    _write_state(partial_path, url, 'sequential', etag='"stale"')
+    http_server.take_requests()
+
+    result = Downloader(segments=1).fetch(url, partial_path)
+    assert result.resumed_bytes == 0
+    assert result.sha256 == _sha256(PAYLOAD)
+    assert _read(partial_path) == PAYLOAD
+    assert _ranges(http_server.take_requests()) == ['bytes=0-0', None]
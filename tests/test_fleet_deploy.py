@@ -0,0 +1,100 @@
+import json
+import threading
+from dataclasses import asdict
+
+import pytest
+
+from conftest import FakeHost
+from fabric_src.utils import fleet_manager
+from fabric_src.utils.deploy_stamp import DeployStamp
+from fabric_src.utils.fleet_manager import FleetDeployer, RolloutPolicy
+from fabric_src.utils.recording_connection import RecordingConnection
+from fabric_src.utils.service_manager import DeployConfig
+
+HOSTS = ['web1', 'web2', 'web3']
+
+
+@pytest.fixture
+def config(tmp_path) -> DeployConfig:
+    source = tmp_path / 'source'
+    source.mkdir()
+    (source / 'app').write_text('#!/bin/sh\nexec sleep infinity\n')
+    return DeployConfig(name='demo', description='demo service', exec_start='/opt/demo/app',
+                        source_path=str(source), install_path='/opt/demo', use_sudo=False, compression='gzip')
+
+
+@pytest.fixture
+def prepare_calls(monkeypatch):
+    """记录 prepare_archive 的调用"""
+    calls = []
+    lock = threading.Lock()
+    prepare_archive = fleet_manager.prepare_archive
+
+    def counting(source_path, **kwargs):
+        with lock:
+            calls.append(source_path)
+        return prepare_archive(source_path, **kwargs)
+
+    monkeypatch.setattr(fleet_manager, 'prepare_archive', counting)
+    return calls
+
+
+def _fleet(config, stale=()):
+    """stale 中的主机需要重新部署，其他主机的部署摘要与配置一致"""
+    stamp = json.dumps(asdict(DeployStamp.compute(config)))
+    conns = {}
+    for host in HOSTS:
+        fake_host = FakeHost()
+        fake_host.stamp = '' if host in stale else stamp
+        conns[host] = RecordingConnection(host=host, responder=fake_host)
+    return FleetDeployer(HOSTS, connection_factory=conns.__getitem__), conns
+
+
+def _uploaded_archive(conn: RecordingConnection) -> bool:
+    return any(call.method == 'put' and call.command.endswith('.tar.gz') for call in conn.calls)
+
+
+def test_up_to_date_fleet_prepares_nothing(config, prepare_calls):
+    deployer, conns = _fleet(config)
+    results = deployer.deploy_service(config)
+
+    assert all(result.success for result in results)
+    assert prepare_calls == []
+    assert all(result.timings['prepare'] == 0 for result in results)
+    # 收集主机信息 + 读取部署摘要
+    assert all(conn.round_trips == 2 for conn in conns.values())
+
+
+def test_archive_is_prepared_once_for_stale_hosts(config, prepare_calls):
+    deployer, conns = _fleet(config, stale=HOSTS)
+    results = deployer.deploy_service(config)
+
+    assert all(result.success for result in results)
+    assert prepare_calls == [config.source_path]
+    assert all(_uploaded_archive(conn) for conn in conns.values())
+
+
+def test_rolling_deploy_prepares_on_first_stale_host(config, prepare_calls):
+    deployer, conns = _fleet(config, stale=['web3'])
+    rollout = deployer.rolling_deploy(config, RolloutPolicy(health_timeout=1))
+
+    assert not rollout.aborted
+    assert prepare_calls == [config.source_path]
+    # 收集主机信息 + 读取部署摘要 + 健康检查
+    assert conns['web1'].round_trips == conns['web2'].round_trips == 3
+    assert _uploaded_archive(conns['web3'])
+
+
+def test_prepare_failure_is_not_retried(config, monkeypatch):
+    calls = []
+
+    def failing(source_path, **kwargs):
+        calls.append(source_path)
+        raise OSError('download failed')
+
+    monkeypatch.setattr(fleet_manager, 'prepare_archive', failing)
+    deployer, _ = _fleet(config, stale=HOSTS)
+    results = deployer.deploy_service(config)
+
+    assert len(calls) == 1
+    assert all(not result.success and isinstance(result.exception, OSError) for result in results)
@@ -0,0 +1,16 @@
+from fabric_src.utils import deploy_schema
+from fabric_src.utils.import_budget import DEFAULT_MODULES, check_import_budget
+
+
+def test_default_modules_within_budget():
+    """入口模块导入时不加载重量级依赖、不创建用户目录下的文件，且耗时在预算内"""
+    assert check_import_budget(list(DEFAULT_MODULES), runs=3) == []
+
+
+def test_deploy_schema_is_loaded_on_first_access(monkeypatch):
+    monkeypatch.setattr(deploy_schema, '_schema', None)
+    from fabric_src.utils.service_manager import DeployConfig
+
+    assert deploy_schema._schema is None
+    assert DeployConfig.SCHEMA['type'] == 'object'
+    assert DeployConfig.SCHEMA is deploy_schema._schema
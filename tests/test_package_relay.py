@@ -0,0 +1,118 @@
+import json
+import os
+
+import pytest
+
+from conftest import FakeHost
+from fabric_src.utils.host_facts import get_facts
+from fabric_src.utils.package_manager import PackageManagerOperator
+from fabric_src.utils.package_relay import PackageRelay, platform_key
+from fabric_src.utils.recording_connection import RecordingConnection
+
+
+@pytest.fixture
+def repo_dir(tmp_path) -> str:
+    """平铺存放 .deb 文件的本地仓库目录"""
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    for name in ('jq_1.6-2_amd64.deb', 'jq_1.7_amd64.deb', 'jq-doc_1.7_all.deb', 'libjq1_1.7_amd64.deb'):
+        (repo / name).write_bytes(name.encode() * 100)
+    return str(repo)
+
+
+@pytest.fixture
+def relay(tmp_path, repo_dir) -> PackageRelay:
+    return PackageRelay(cache_dir=str(tmp_path / 'packages'), repo_dir=repo_dir)
+
+
+@pytest.fixture
+def facts(fake_conn):
+    return get_facts(fake_conn)
+
+
+def test_resolve_imports_latest_version_into_cache(relay, facts, repo_dir):
+    files = relay.resolve(facts, ['jq', 'libjq1', 'jq'])
+
+    platform_dir = os.path.join(relay.cache_dir, platform_key(facts))
+    assert [os.path.basename(path) for path in files] == ['jq_1.7_amd64.deb', 'libjq1_1.7_amd64.deb']
+    assert all(os.path.dirname(path) == platform_dir for path in files)
+    with open(os.path.join(platform_dir, 'index.json'), encoding='utf-8') as f:
+        assert json.load(f) == {'jq': ['jq_1.7_amd64.deb'], 'libjq1': ['libjq1_1.7_amd64.deb']}
+
+
+def test_resolve_uses_cache_without_source(relay, facts, repo_dir):
+    """已缓存的软件包不再访问软件包来源"""
+    relay.resolve(facts, ['jq'])
+    for name in os.listdir(repo_dir):
+        os.unlink(os.path.join(repo_dir, name))
+
+    assert [os.path.basename(path) for path in relay.resolve(facts, ['jq'])] == ['jq_1.7_amd64.deb']
+
+
+def test_resolve_missing_package(relay, facts):
+    with pytest.raises(FileNotFoundError, match='htop'):
+        relay.resolve(facts, ['jq', 'htop'])
+    assert relay.cached(facts, ['jq', 'htop']) == {}
+
+
+def test_install_pushes_files_in_one_call(relay, facts, fake_conn):
+    """软件包文件和安装命令在一次流式调用中发送"""
+    with fake_conn.budget(max_round_trips=1, label='relay install') as usage:
+        assert relay.install(fake_conn, facts, ['jq', 'libjq1'])
+
+    call = fake_conn.calls[-1]
+    assert call.method == 'stream'
+    assert 'apt-get install -y "$tmp"/jq_1.7_amd64.deb "$tmp"/libjq1_1.7_amd64.deb' in call.command
+    assert usage['bytes_out'] >= sum(os.path.getsize(path) for path in relay.resolve(facts, ['jq', 'libjq1']))
+
+
+def test_install_reports_missing_package(relay, facts, fake_conn):
+    with fake_conn.budget(max_round_trips=0, label='relay install'):
+        assert not relay.install(fake_conn, facts, ['htop'])
+
+
+def test_install_many_relays_only_missing_packages(relay, fake_conn):
+    operator = PackageManagerOperator(fake_conn, relay=relay)
+    with fake_conn.budget(max_round_trips=2, label='install_many'):
+        assert operator.install_many(['curl', 'jq'])
+
+    command = fake_conn.calls[-1].command
+    assert 'jq_1.7_amd64.deb' in command and 'curl' not in command
+    assert operator.facts.has_package('jq')
+
+
+class SeedHost(FakeHost):
+    """可以用包管理器下载软件包的种子主机"""
+
+    def __init__(self, files):
+        super().__init__()
+        self.files = files  # 下载到第一个包目录中的文件名
+        self.downloads = []
+
+    def __call__(self, method, command, stdin_bytes):
+        if method == 'get':
+            return 0, f"content of {os.path.basename(command)}", ''
+        if command == 'mktemp -d':
+            return 0, '/tmp/seed\n', ''
+        if command.startswith('cd /tmp/seed && find'):
+            return 0, ''.join(f"./0/{name}\n" for name in self.files), ''
+        if '--download-only' in command:
+            self.downloads.append(command)
+        return super().__call__(method, command, stdin_bytes)
+
+
+def test_resolve_downloads_on_seed_host(tmp_path, facts):
+    seed_host = SeedHost(['jq_1.7_amd64.deb', 'libjq1_1.7_amd64.deb'])
+    seed = RecordingConnection(host='seed', responder=seed_host)
+    relay = PackageRelay(cache_dir=str(tmp_path / 'packages'), seed=seed)
+
+    files = relay.resolve(facts, ['jq'])
+    assert [os.path.basename(path) for path in files] == ['jq_1.7_amd64.deb', 'libjq1_1.7_amd64.deb']
+    with open(files[0], encoding='utf-8') as f:
+        assert f.read() == 'content of jq_1.7_amd64.deb'
+    assert len(seed_host.downloads) == 1
+    assert seed.calls[-1].command.endswith("rm -rf /tmp/seed'")
+
+    seed.reset()
+    relay.resolve(facts, ['jq'])
+    assert seed.round_trips == 0
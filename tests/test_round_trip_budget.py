@@ -0,0 +1,98 @@
+import json
+from dataclasses import asdict
+
+import pytest
+
+from fabric_src.utils.deploy_stamp import DeployStamp
+from fabric_src.utils.package_manager import PackageManagerOperator
+from fabric_src.utils.recording_connection import BudgetExceeded
+from fabric_src.utils.service_manager import DeployConfig, ServiceManagerOperator
+
+
+@pytest.fixture
+def deploy_config(tmp_path):
+    def create(**kwargs) -> DeployConfig:
+        source = tmp_path / 'source'
+        source.mkdir(exist_ok=True)
+        (source / 'app').write_text('#!/bin/sh\nexec sleep infinity\n')
+        options = dict(name='demo', description='demo service', exec_start='/opt/demo/app',
+                       source_path=str(source), install_path='/opt/demo', use_sudo=False,
+                       compression='gzip', dependencies=['curl', 'jq'])
+        options.update(kwargs)
+        return DeployConfig(**options)
+    return create
+
+
+def test_budget_reports_overrun(fake_conn):
+    with pytest.raises(BudgetExceeded, match='2 round trips > budget 1'):
+        with fake_conn.budget(max_round_trips=1, label='two commands'):
+            fake_conn.run('true')
+            fake_conn.run('true')
+
+
+def test_first_deploy_round_trips(fake_conn, deploy_config):
+    """逐条执行的首次部署：读取摘要、上传、安装缺少的依赖、写入单元文件、启动、写入摘要"""
+    operator = ServiceManagerOperator(fake_conn)
+    with fake_conn.budget(max_round_trips=15, max_bytes=4096, label='deploy') as usage:
+        operator.deploy_service(deploy_config())
+    assert operator.timings['round_trips'] == usage['round_trips']
+
+
+def test_batch_deploy_round_trips(fake_conn, deploy_config):
+    """批量模式的首次部署只需读取摘要和执行脚本两次远程调用"""
+    operator = ServiceManagerOperator(fake_conn)
+    with fake_conn.budget(max_round_trips=2, max_bytes=16 * 1024, label='batch deploy') as usage:
+        operator.deploy_service(deploy_config(batch=True))
+    assert usage['by_method'] == {'run': 1, 'stream': 1}
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_up_to_date_deploy_reads_only_the_stamp(fake_conn, fake_host, deploy_config, batch):
+    config = deploy_config(batch=batch)
+    operator = ServiceManagerOperator(fake_conn)
+    fake_host.stamp = json.dumps(asdict(DeployStamp.compute(config)))
+    with fake_conn.budget(max_round_trips=1, max_bytes=1024, label='redeploy'):
+        plan = operator.deploy_service(config)
+    assert plan.up_to_date
+
+
+def test_install_many_all_installed(fake_conn):
+    operator = PackageManagerOperator(fake_conn)
+    with fake_conn.budget(max_round_trips=1, label='install_many'):
+        assert operator.install_many(['curl'])
+
+
+def test_install_many_missing_packages(fake_conn):
+    """一次查询已安装的包，缺少的包在一次调用中安装"""
+    operator = PackageManagerOperator(fake_conn)
+    with fake_conn.budget(max_round_trips=2, label='install_many'):
+        assert operator.install_many(['curl', 'jq', 'htop'])
+    install = fake_conn.calls[-1].command
+    assert 'jq' in install and 'htop' in install and 'curl' not in install
+    assert operator.facts.has_package('jq')
+
+
+def test_install_many_with_index_update(fake_conn):
+    """包索引年龄检查和更新合并为一次调用"""
+    operator = PackageManagerOperator(fake_conn, index_max_age=3600)
+    with fake_conn.budget(max_round_trips=3, label='install_many'):
+        assert operator.install_many(['jq'], update=True)
+
+
+def test_batch_deploy_installs_only_missing_packages(fake_conn, deploy_config):
+    """批量模式按主机的包管理器只安装缺少的包，并更新缓存的已安装列表"""
+    operator = ServiceManagerOperator(fake_conn)
+    operator.deploy_service(deploy_config(batch=True))
+
+    script = fake_conn.calls[-1].command
+    assert 'apt-get install -y jq' in script
+    assert 'curl' not in script and 'command -v dnf' not in script
+    assert operator.facts.has_package('jq')
+
+
+def test_batch_deploy_skips_installed_dependencies(fake_conn, fake_host, deploy_config):
+    fake_host.packages.add('jq')
+    operator = ServiceManagerOperator(fake_conn)
+    operator.deploy_service(deploy_config(batch=True))
+
+    assert 'apt-get install' not in fake_conn.calls[-1].command